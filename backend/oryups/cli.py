@@ -4,7 +4,8 @@ from pathlib import Path
 
 import uvicorn
 
-from oryups.config import load_config
+from oryups.config import get_storage, load_config
+from oryups.filesystem import local as LocalStorage
 
 BASE_DIR: Path = Path(__file__).resolve().parents[1]
 
@@ -28,9 +29,39 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="Enable auto-reload for development",
     )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Rebuild the local metadata index from the .metadata sidecars and exit",
+    )
+    parser.add_argument(
+        "--migrate-layout",
+        action="store_true",
+        help="Move flat local.root folders into the sharded layout and exit",
+    )
     return parser.parse_args(argv)
 
 
+def rebuild_index() -> int:
+    """Regenerate the local backend's metadata index and report the row count."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage) or storage.index is None:
+        raise SystemExit("--rebuild-index requires storage 'local' with local.index enabled")
+    count = storage.rebuild_index()
+    print(f"Indexed {count} files under {storage.root}")
+    return count
+
+
+def migrate_layout() -> int:
+    """Convert a flat local tree to the sharded layout and report the move count."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage) or not storage.sharded:
+        raise SystemExit("--migrate-layout requires storage 'local' with local.layout set to 'sharded'")
+    moved = storage.migrate_layout()
+    print(f"Moved {moved} folders into the sharded layout under {storage.root}")
+    return moved
+
+
 def main() -> None:
     """Entry point for the ``ups`` console script."""
     args = parse_args()
@@ -46,6 +77,13 @@ def main() -> None:
     # between the CLI read and the app startup read (the app runs in-process
     # with the CLI when --workers is unset and --reload is off).
     config = load_config(path=config_path)
+    if args.migrate_layout:
+        migrate_layout()
+        return
+    if args.rebuild_index:
+        rebuild_index()
+        return
+
     host_cfg = config["host"]
     proxy_enabled = bool(host_cfg.get("proxy", False))
     forwarded_allow_ips = host_cfg.get("proxy_trusted_hosts", "127.0.0.1")
@@ -0,0 +1,265 @@
+import fcntl
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+DEFAULT_DOWNLOAD_CACHE_BYTES: int = 1024 * 1024 * 1024
+_SLOT_LOCK: str = ".lock"
+
+
+class Fill:
+    """One upstream download being written into the cache.
+
+    Readers tail :attr:`part` while it grows: :meth:`wait` blocks until
+    more than ``offset`` bytes are written or the fill ends. Readers open
+    it through :meth:`DownloadCache.open_fill` and keep their own
+    descriptor, so a rename into place (or an eviction) never cuts them off.
+    """
+
+    def __init__(self, part: Path, final: Path, size: int):
+        self.part = part
+        self.final = final
+        self.size = size
+        self.written = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.discard = False
+        self._cond = threading.Condition()
+
+    def advance(self, n: int) -> None:
+        with self._cond:
+            self.written += n
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def wait(self, offset: int, timeout: float) -> tuple[int, bool, Optional[BaseException]]:
+        """Return ``(written, done, error)`` once there is news past ``offset``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.written > offset or self.done, timeout)
+            return self.written, self.done, self.error
+
+
+class DownloadCache:
+    """Byte-budgeted LRU cache of downloaded blobs on local disk.
+
+    Each blob is a file named after its key under :attr:`root`. A miss
+    starts a background :class:`Fill` that every concurrent request for the
+    same key shares, so one upstream download serves them all; later
+    requests get the finished file path and can use sendfile. When the
+    cached bytes exceed ``max_bytes`` the least recently used blobs are
+    deleted.
+
+    Every process claims its own numbered directory under ``base`` (see
+    :func:`_claim_slot`), so worker processes never evict or clean up each
+    other's files and ``max_bytes`` applies per process. A restarted
+    worker picks up a free directory and its blobs again: the index is
+    rebuilt from it (oldest mtime first), and half-written ``*.part`` files
+    from a crash are removed.
+    """
+
+    def __init__(self, base: Path, max_bytes: int = DEFAULT_DOWNLOAD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        self._fills: dict[str, Fill] = {}
+        self._lock = threading.Lock()
+
+        base.mkdir(parents=True, exist_ok=True)
+        self.root, self._slot = _claim_slot(base)
+        found = []
+        for entry in self.root.iterdir():
+            if entry.name == _SLOT_LOCK:
+                continue
+            if entry.name.endswith(".part"):
+                entry.unlink(missing_ok=True)
+            elif entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    def open_fill(self, fill: Fill) -> BinaryIO:
+        """Open ``fill``'s bytes for reading, wherever they are by now.
+
+        A fill may finish (its part file renamed into place) before a
+        reader gets to open it; the lock makes the rename and eviction
+        atomic with respect to this lookup.
+
+        Raises:
+            FileNotFoundError: The bytes were discarded or already evicted.
+        """
+        with self._lock:
+            try:
+                return fill.part.open("rb")
+            except FileNotFoundError:
+                return fill.final.open("rb")
+
+    def cacheable(self, size: int) -> bool:
+        return 0 <= size <= self.max_bytes
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the cached blob for ``key`` (marking it recently used), or None.
+
+        A blob that vanished from disk (e.g. removed by hand) is forgotten
+        and reported as a miss.
+        """
+        path = self.root / key
+        with self._lock:
+            size = self._entries.get(key)
+            if size is not None and not path.is_file():
+                del self._entries[key]
+                self._bytes -= size
+                size = None
+            if size is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return path
+
+    def fill(
+        self,
+        key: str,
+        size: int,
+        read_range: Callable[[int, int], bytes],
+        chunk: int,
+        read_ahead: int = 1,
+    ) -> Fill:
+        """Return the in-flight fill for ``key``, starting one if none is running.
+
+        Args:
+            key(str): Cache key (the fileid).
+            size(int): Expected blob size in bytes.
+            read_range(Callable[[int, int], bytes]): Fetches bytes
+                ``start..end`` inclusive from upstream.
+            chunk(int): Bytes per upstream request.
+            read_ahead(int): Upstream requests kept in flight at once.
+        """
+        with self._lock:
+            fill = self._fills.get(key)
+            if fill is not None:
+                return fill
+            fill = Fill(self.root / f"{key}.part", self.root / key, size)
+            handle = fill.part.open("wb")
+            self._fills[key] = fill
+        threading.Thread(
+            target=self._run_fill,
+            args=(key, fill, handle, read_range, chunk, max(1, read_ahead)),
+            daemon=True,
+        ).start()
+        return fill
+
+    def _run_fill(
+        self,
+        key: str,
+        fill: Fill,
+        handle: BinaryIO,
+        read_range: Callable[[int, int], bytes],
+        chunk: int,
+        read_ahead: int,
+    ) -> None:
+        error: Optional[BaseException] = None
+        try:
+            # One worker per request in flight; on failure the executor
+            # waits for those few before the part file is dropped.
+            with handle, ThreadPoolExecutor(max_workers=read_ahead) as executor:
+                pending: deque[Future] = deque()
+                ranges = ((start, min(start + chunk, fill.size) - 1) for start in range(0, fill.size, chunk))
+                for start, end in itertools.islice(ranges, read_ahead):
+                    pending.append(executor.submit(read_range, start, end))
+                try:
+                    offset = 0
+                    while pending:
+                        data = pending.popleft().result()
+                        expected = min(chunk, fill.size - offset)
+                        if len(data) != expected:
+                            raise IOError(f"upstream returned {len(data)} of {expected} bytes at {offset}")
+                        for start, end in itertools.islice(ranges, 1):
+                            pending.append(executor.submit(read_range, start, end))
+                        handle.write(data)
+                        handle.flush()
+                        offset += len(data)
+                        fill.advance(len(data))
+                finally:
+                    # On failure, skip the reads not started yet.
+                    for future in pending:
+                        future.cancel()
+        except BaseException as exc:
+            error = exc
+
+        with self._lock:
+            self._fills.pop(key, None)
+            if error is None and not fill.discard:
+                fill.part.replace(fill.final)
+                self._entries[key] = fill.size
+                self._bytes += fill.size
+                self._evict_locked()
+            else:
+                fill.part.unlink(missing_ok=True)
+        fill.finish(error)
+
+    def invalidate(self, key: str) -> None:
+        """Drop ``key``'s blob; an in-flight fill for it is discarded when done."""
+        with self._lock:
+            fill = self._fills.get(key)
+            if fill is not None:
+                fill.discard = True
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+                (self.root / key).unlink(missing_ok=True)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "filling": len(self._fills),
+            }
+
+    def _evict_locked(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            (self.root / key).unlink(missing_ok=True)
+
+
+def _claim_slot(base: Path) -> tuple[Path, BinaryIO]:
+    """Lock the first free ``base/<n>`` directory for this process.
+
+    The lock is an exclusive ``flock`` on ``<n>/.lock`` held through the
+    returned handle, so it is released when the process exits, however it
+    exits.
+
+    Return:
+        slot(tuple[Path, BinaryIO]): The claimed directory and its open
+            lock file, which must stay open while the directory is in use.
+    """
+    n = 0
+    while True:
+        slot = base / str(n)
+        slot.mkdir(exist_ok=True)
+        lock = (slot / _SLOT_LOCK).open("a+b")
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            n += 1
+            continue
+        return slot, lock
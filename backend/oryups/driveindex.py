@@ -0,0 +1,155 @@
+import threading
+from typing import Optional
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+class DriveFolderIndex:
+    """In-memory map of the Drive root: fileid → folder gid → children.
+
+    Every stored file lives in a folder named after its fileid directly
+    under the configured root. Resolving a fileid used to cost a listing
+    of the whole root; this index answers it from memory instead. It is
+    seeded with one root listing, updated by the backend's own writes and
+    kept in step with other processes through the Drive changes feed
+    (:meth:`apply_change`).
+
+    Children are only known for folders this process created, listed or
+    saw in the changes feed; :meth:`children` returns None for the rest so
+    the caller can list them once and :meth:`set_children`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.loaded = False
+        self.page_token: str = ""
+        self._folders: dict[str, str] = {}
+        self._names: dict[str, str] = {}
+        self._children: dict[str, dict[str, str]] = {}
+        self._parent_of: dict[str, tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, folders: dict[str, str], page_token: str) -> None:
+        """Replace the root folder map (``name → gid``) wholesale."""
+        with self._lock:
+            self._folders = dict(folders)
+            self._names = {gid: name for name, gid in folders.items()}
+            self._children = {}
+            self._parent_of = {}
+            self.page_token = page_token
+            self.loaded = True
+
+    def folder(self, fileid: str) -> Optional[str]:
+        with self._lock:
+            return self._folders.get(fileid)
+
+    def folders(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._folders)
+
+    def put_folder(self, fileid: str, gid: str, empty: bool = False) -> None:
+        """Record a root folder; ``empty`` marks its (empty) children as known."""
+        with self._lock:
+            self._folders[fileid] = gid
+            self._names[gid] = fileid
+            if empty:
+                self._children.setdefault(gid, {})
+
+    def drop_folder(self, fileid: str) -> None:
+        with self._lock:
+            gid = self._folders.pop(fileid, None)
+            if gid is not None:
+                self._forget_folder_locked(gid)
+
+    def children(self, folder_gid: str) -> Optional[dict[str, str]]:
+        """Return ``name → gid`` for a folder, or None when not yet known."""
+        with self._lock:
+            known = self._children.get(folder_gid)
+            return dict(known) if known is not None else None
+
+    def set_children(self, folder_gid: str, children: dict[str, str]) -> None:
+        with self._lock:
+            for name, gid in self._children.get(folder_gid, {}).items():
+                self._parent_of.pop(gid, None)
+            self._children[folder_gid] = dict(children)
+            for name, gid in children.items():
+                self._parent_of[gid] = (folder_gid, name)
+
+    def put_child(self, folder_gid: str, name: str, gid: str) -> None:
+        """Record a file under ``folder_gid``.
+
+        Ignored for folders whose children were never listed, so a partial
+        map is never mistaken for a complete one.
+        """
+        with self._lock:
+            self._drop_child_locked(gid)
+            known = self._children.get(folder_gid)
+            if known is None:
+                return
+            known[name] = gid
+            self._parent_of[gid] = (folder_gid, name)
+
+    def drop_child(self, gid: str) -> None:
+        with self._lock:
+            self._drop_child_locked(gid)
+
+    def apply_change(self, change: dict) -> None:
+        """Fold one ``changes.list`` entry into the index.
+
+        Args:
+            change(dict): A change resource requesting at least
+                ``fileId, removed, file(id, name, mimeType, parents, trashed)``.
+        """
+        gid = change.get("fileId") or change.get("file", {}).get("id", "")
+        file = change.get("file") or {}
+        if change.get("removed") or file.get("trashed"):
+            with self._lock:
+                name = self._names.get(gid)
+                if name is not None and self._folders.get(name) == gid:
+                    del self._folders[name]
+                    self._forget_folder_locked(gid)
+                self._drop_child_locked(gid)
+            return
+
+        parents = file.get("parents") or []
+        name = file.get("name", "")
+        if file.get("mimeType") == FOLDER_MIME:
+            if self.root in parents:
+                with self._lock:
+                    # A rename shows up as the same gid under a new name.
+                    old = self._names.get(gid)
+                    if old is not None and old != name and self._folders.get(old) == gid:
+                        del self._folders[old]
+                    self._folders[name] = gid
+                    self._names[gid] = name
+            else:
+                # Moved out of the root: no longer a file folder.
+                with self._lock:
+                    old = self._names.get(gid)
+                    if old is not None and self._folders.get(old) == gid:
+                        del self._folders[old]
+                        self._forget_folder_locked(gid)
+            return
+
+        with self._lock:
+            self._drop_child_locked(gid)
+            for parent in parents:
+                known = self._children.get(parent)
+                if known is not None:
+                    known[name] = gid
+                    self._parent_of[gid] = (parent, name)
+                    break
+
+    def _drop_child_locked(self, gid: str) -> None:
+        location = self._parent_of.pop(gid, None)
+        if location is None:
+            return
+        parent, name = location
+        known = self._children.get(parent)
+        if known is not None and known.get(name) == gid:
+            del known[name]
+
+    def _forget_folder_locked(self, gid: str) -> None:
+        self._names.pop(gid, None)
+        for child in self._children.pop(gid, {}).values():
+            self._parent_of.pop(child, None)
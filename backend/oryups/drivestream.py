@@ -0,0 +1,89 @@
+import hashlib
+import queue
+import threading
+from typing import Callable, Optional
+
+# Drive requires every non-final resumable chunk to be a multiple of 256 KiB.
+RESUMABLE_ALIGNMENT: int = 256 * 1024
+DEFAULT_STREAM_CHUNK: int = 8 * 1024 * 1024
+
+
+class DriveStreamUpload:
+    """Forward a body to a Drive resumable session while it is still arriving.
+
+    :meth:`write` cuts the incoming bytes into ``chunk_size`` pieces (a
+    multiple of 256 KiB) and hands them to a sender thread, which PUTs them
+    to the session with ``send(data, offset, total)``; ``total`` is None
+    until the final chunk. At most ``depth`` chunks wait between the two,
+    so a slow Drive blocks :meth:`write` (and with it the client) instead
+    of growing memory, and a slow client leaves Drive idle only while it
+    is actually waiting for bytes.
+
+    ``target`` carries the backend's own bookkeeping for the upload.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[bytes, int, Optional[int]], Optional[dict]],
+        chunk_size: int = DEFAULT_STREAM_CHUNK,
+        depth: int = 2,
+        target: Optional[dict] = None,
+    ):
+        self.chunk_size = max(RESUMABLE_ALIGNMENT, chunk_size - chunk_size % RESUMABLE_ALIGNMENT)
+        self.target = target or {}
+        self.size = 0
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self._send = send
+        self._hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, depth))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes) -> None:
+        if self.error is not None:
+            raise self.error
+        self._hasher.update(data)
+        self.size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._queue.put((bytes(self._buffer[: self.chunk_size]), False))
+            del self._buffer[: self.chunk_size]
+
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    def finish(self) -> dict:
+        """Send the remaining bytes as the final chunk; returns the file resource."""
+        self._queue.put((bytes(self._buffer), True))
+        self._buffer.clear()
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.result is None:
+            raise IOError("Drive did not return the uploaded file")
+        return self.result
+
+    def abort(self) -> None:
+        """Stop the sender; chunks still queued are dropped."""
+        self.error = self.error or IOError("upload aborted")
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        offset = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            data, last = item
+            if self.error is None:
+                try:
+                    total = offset + len(data) if last else None
+                    self.result = self._send(data, offset, total)
+                    offset += len(data)
+                except BaseException as exc:
+                    self.error = exc
+            if last:
+                return
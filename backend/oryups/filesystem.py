@@ -1,19 +1,42 @@
 from pathlib import Path
 from json import loads, dumps
 from mimetypes import guess_type
-from threading import Thread, RLock
+from threading import BoundedSemaphore, Event, Lock, Thread, RLock
 from io import BytesIO
-from typing import IO, Any
+from typing import IO, Any, Callable, Iterator, Optional
+from contextlib import nullcontext
+import hashlib
+import logging
 import os
 import secrets
 import string
 import tempfile
 import time
 
+from oryups.drivestream import DEFAULT_STREAM_CHUNK, DriveStreamUpload
+from oryups.downloadcache import DEFAULT_DOWNLOAD_CACHE_BYTES, DownloadCache
+from oryups.driveindex import FOLDER_MIME, DriveFolderIndex
+from oryups.metaindex import MetadataIndex
+from oryups.uploadjournal import UploadJournal
+from oryups.uploadqueue import DEFAULT_BACKLOG_BYTES, UploadQueue
+from oryups.utils import buffers, clientpool
+from oryups.utils.expiry import expiry_deadline
+
 LimitedStream = Any
 
+logger = logging.getLogger("oryups.filesystem")
+
+# os.umask can only be read by setting it, so sample it once at import
+# (before any worker threads exist) rather than racing on every commit.
+_UMASK: int = os.umask(0)
+os.umask(_UMASK)
+
 storageTypes = ["gdrive", "local"]
 
+DEFAULT_READ_AHEAD: int = 2
+CACHE_RETRY_DELAY: float = 60.0
+RESUMABLE_UPLOAD_URI = "https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&supportsAllDrives=true&fields=id"
+
 class Metadata:
     id: str
     name: str
@@ -23,6 +46,7 @@ class Metadata:
     hidden: bool
     created_at: float
     delete_after: float
+    sha256: str = ""
 
     optional_parentfolderID: str
     optional_gfileID: str
@@ -36,11 +60,14 @@ class Metadata:
             "size": self.size,
             "hidden": self.hidden,
             "created_at": self.created_at,
-            "delete_after": self.delete_after
+            "delete_after": self.delete_after,
         }
 
         if private:
             data["delete"] = self.delete
+            # Kept off the wire: the digest alone is enough to claim a
+            # blob through a hash-first PUT.
+            data["sha256"] = self.sha256
 
         return data
 
@@ -57,10 +84,13 @@ class Metadata:
             self.hidden = bool(data["hidden"] if "hidden" in data else False)
             self.created_at = float(data["created_at"] if "created_at" in data else int(time.time()))
             self.delete_after = float(data["delete_after"] if "delete_after" in data else -1)
+            # Sidecars written before checksums were recorded have none.
+            self.sha256 = str(data.get("sha256") or "")
             return
         
         elif dataraw:
             data = loads(dataraw)
+            self.load(data)
         
         elif dataPath:
             data = loads(dataPath.read_text())
@@ -74,6 +104,9 @@ class storage():
     ownerkeylength: int
     chunksize: int
     cache: bool
+    # True when PUT bodies go to the backend as they arrive (open_stream)
+    # instead of being spooled first.
+    streams_uploads: bool = False
 
     def __init__(self, config: dict, configPath: Path):
         self.folderidlength = config["folderidlength"]
@@ -91,6 +124,12 @@ class storage():
         else:
             self.ownerkeylength = 12
         self.chunksize = config["chunk"]
+        # Copy loops use pooled buffers bounded independently of ``chunk``
+        # (which defaults to 100 MiB and sizes Drive upload requests).
+        self.buffers = buffers.shared_pool(
+            int(config.get("copy_buffer_size", buffers.DEFAULT_BUFFER_SIZE)),
+            int(config.get("copy_buffer_count", buffers.DEFAULT_BUFFER_COUNT)),
+        )
         
         if "delete" in config:
             self.delete_rule = config["delete"]
@@ -113,7 +152,7 @@ class storage():
         return fileid, mimetype, metadataname
     
     def remove(self, fileid: str, filename: str, deletepass: str, force: bool = False, permanently: bool = False) -> bool: ...
-    def save(self, file: LimitedStream | IO[bytes], filesize: int | None, filename: str, fileid: str = "") -> Metadata: ...
+    def save(self, file: LimitedStream | IO[bytes], filesize: int | None, filename: str, fileid: str = "", sha256: str = "") -> Metadata: ...
     def load_metadata(self, fileid: str, filename: str) -> Metadata: ...
     def update_metadata(self, metadata: Metadata) -> None:
         """Persist mutated metadata back to storage. Override in subclasses."""
@@ -121,6 +160,10 @@ class storage():
     def download(self, fileid: str, filename: str) -> Any: ...
     def get_list(self, path, dir) -> list[str]: ...
     def is_fid_exists(self, fileid: str) -> bool: ...
+    def staging_dir(self) -> Optional[Path]: return None
+    def save_by_digest(self, sha256: str, filename: str) -> Optional[Metadata]: return None
+    def reserve_upload(self, size: int) -> bool: return True
+    def release_upload(self, size: int) -> None: return None
     def is_cached(self, fileid: str, filename: str) -> bool: return False
     def get_cached(self, fileid: str, filename: str) -> Path: raise FileNotFoundError(f"Cache file not found: {fileid} {filename}")
 
@@ -148,12 +191,13 @@ class storage():
             return self.create_fileid()
         return folderid
 
-    def make_metadata(self, filesize: int, filename: str, fileid: str, mimetype: str) -> Metadata:
+    def make_metadata(self, filesize: int, filename: str, fileid: str, mimetype: str, sha256: str = "") -> Metadata:
         metadata = Metadata()
         metadata.id = fileid
         metadata.name = filename
         metadata.mimeType = mimetype
         metadata.size = filesize
+        metadata.sha256 = sha256
         metadata.delete = self._create_id(self.ownerkeylength)
         metadata.hidden = False
         metadata.created_at = int(time.time())
@@ -170,15 +214,59 @@ class storage():
     
     def write_stream(self, stream: LimitedStream, path: Path):
         with path.open("wb") as f:
-            while True:
-                chunk = stream.read(self.chunksize)
-                if not chunk: break
-                f.write(chunk)
+            buffers.copy_stream(stream, f.write, self.buffers)
+
+    def commit_stream(self, stream: LimitedStream, path: Path):
+        """Materialize ``stream`` at ``path`` with as few copies as possible.
+
+        A spooled upload that already sits in a named file (see
+        :class:`oryups.utils.upload.UploadSpool`) is hard-linked into place,
+        so its bytes are never written twice. Otherwise an on-disk source is
+        copied in-kernel with ``copy_file_range``; anything else falls back
+        to :meth:`write_stream`.
+        """
+        source = getattr(stream, "path", None)
+        if source is not None:
+            stream.flush()
+            try:
+                # mkstemp creates 0600 files; give the committed file the
+                # same mode a plain open() under the process umask would.
+                os.chmod(source, 0o666 & ~_UMASK)
+                os.link(source, path)
+                return
+            except OSError:
+                # EXDEV (staging on another filesystem) or a filesystem
+                # without hard links; fall through to a copy.
+                pass
+
+        try:
+            src_fd = stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd = None
+        if src_fd is not None and hasattr(os, "copy_file_range"):
+            start = stream.tell()
+            stream.flush()
+            try:
+                with path.open("wb") as f:
+                    offset = start
+                    while True:
+                        copied = os.copy_file_range(src_fd, f.fileno(), 1 << 30, offset)
+                        if not copied: break
+                        offset += copied
+                return
+            except OSError:
+                stream.seek(start)
+
+        self.write_stream(stream, path)
 
 class gdrive(storage):
     from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
     import googleapiclient.http
 
+    downloads: Optional[DownloadCache] = None
+    read_ahead: int = DEFAULT_READ_AHEAD
+    read_slots: Optional[BoundedSemaphore] = None
+
     class _UPSStreamSlice(object):
         """Truncated stream.
 
@@ -235,6 +323,12 @@ class gdrive(storage):
             self._resumable = resumable
             self._size = size
 
+    # Folders whose children one bulk listing query asks for; keeps the
+    # OR'ed ``q`` expression well below Drive's query length limit.
+    LIST_PARENTS_PER_QUERY = 40
+    # Drive accepts at most 100 calls in one batch request.
+    BATCH_LIMIT = 100
+
     #del(googleapiclient.http._StreamSlice)
     #googleapiclient.http._StreamSlice = _UPSStreamSlice
 
@@ -244,11 +338,42 @@ class gdrive(storage):
 
         from googleapiclient.discovery import build
         from google.oauth2 import service_account
+        from google_auth_httplib2 import AuthorizedHttp
+        import httplib2
         self.credential = service_account.Credentials.from_service_account_info(config["gdrive"]["credential"], scopes=config["gdrive"]["scopes"])
-        self.service = build('drive', 'v3', credentials=self.credential)
-        self._service_lock = RLock()
+        # httplib2 is not thread-safe, so every call checks out its own
+        # authorized client instead of sharing one behind a lock.
+        self.clients = clientpool.ClientPool(
+            lambda: build('drive', 'v3', http=AuthorizedHttp(self.credential, http=httplib2.Http()), cache_discovery=False),
+            int(config["gdrive"].get("pool_size", clientpool.DEFAULT_POOL_SIZE)),
+        )
         self.root: str = str(config["gdrive"]["root"])
         self.cache: bool = bool(config["gdrive"]["cache"])
+        self.upload_retries = int(config["gdrive"].get("upload_retries", 5))
+        # Without the local cache, PUT bodies are forwarded to a Drive
+        # resumable session chunk by chunk while the client still sends.
+        self.streams_uploads = not self.cache and bool(config["gdrive"].get("stream_uploads", True))
+        self.stream_chunk = int(config["gdrive"].get("stream_chunk", DEFAULT_STREAM_CHUNK))
+        self._stream_http = lambda: AuthorizedHttp(self.credential, http=httplib2.Http())
+        # fileid → folder gid (→ children) map, seeded lazily by the first
+        # lookup and then kept current from the Drive changes feed, polled
+        # at most every ``gdrive.changes_interval`` seconds.
+        self.folder_index = DriveFolderIndex(self.root)
+        self.changes_interval = float(config["gdrive"].get("changes_interval", 10))
+        self._index_lock = RLock()
+        self._changes_polled = 0.0
+        # Ranged chunks a single download keeps in flight, and a cap on
+        # ranged reads across all downloads. Both stay below the pool size
+        # so downloads alone can never check out every Drive client.
+        read_slots = max(1, self.clients.size - 1)
+        self.read_ahead = max(1, min(int(config["gdrive"].get("read_ahead", DEFAULT_READ_AHEAD)), read_slots))
+        self.read_slots = BoundedSemaphore(read_slots)
+        # Read-through LRU copy of downloaded bodies, so popular files are
+        # fetched from Drive once and then served from local disk.
+        download_max = int(config["gdrive"].get("download_cache_max", DEFAULT_DOWNLOAD_CACHE_BYTES))
+        if download_max > 0:
+            download_dir = config["gdrive"].get("download_cache_dir") or Path(__file__).parent / "download-cache"
+            self.downloads = DownloadCache(Path(download_dir), download_max)
         if self.cache:
             print("Cache setup")
             self._cache_setup(config)
@@ -256,7 +381,8 @@ class gdrive(storage):
             del(self.googleapiclient.http._StreamSlice)
             self.googleapiclient.http._StreamSlice = self._UPSStreamSlice
 
-    def add_cache(self, fileid: str, metadata: Metadata, file_info: dict, file_metadata_info: dict):
+    def add_cache(self, fileid: str, metadata: Metadata, file_info: dict, file_metadata_info: dict, journal: bool = True):
+        """Queue a cached body for upload; its bytes must already be reserved."""
         new = {
             "fileid": fileid,
             "metadata": metadata,
@@ -264,88 +390,179 @@ class gdrive(storage):
             "file_metadata_info": file_metadata_info
         }
 
-        # Populate the lookup dict before exposing the id to the worker via the queue;
-        # otherwise the worker can pop() and observe a half-initialized entry.
+        if journal:
+            self.journal.record(
+                "queued", fileid,
+                name=metadata.name, folder=file_info["parents"][0], size=int(metadata.size),
+            )
+        # Populate the lookup dict before exposing the id to the workers via
+        # the queue; otherwise a worker can get() a half-initialized entry.
         self.cachequeueID[fileid] = new
-        self.cachequeue.append(fileid)
+        self.cachequeue.put(fileid, int(metadata.size))
 
     def _cache_setup(self, config: dict):
         cache_config = config.copy()
         cache_config["storage"] = "local"
         cache_config["local"] = {"root": "cache"}
         self.cacheControl = local(cache_config, Path("cache.json"))
-        self.cachequeue = []
+        self.cachequeue = UploadQueue(int(config["gdrive"].get("cache_backlog_max", DEFAULT_BACKLOG_BYTES)))
         self.cachequeueID: dict[str, dict[str, str|dict[str,str]|Metadata]] = {}
+        self.journal = UploadJournal(self.cacheControl.root / ".journal")
 
-        self.cacheThread = Thread(target=self._cache_worker, daemon=True)
-        self.cacheThread.start()
-        print("Cache Worker Started")
+        # Requeue from the journal: it already knows every entry's Drive
+        # folder and upload progress, so start-up makes no Drive calls.
+        pending = self.journal.replay()
+        self.journal.compact()
+        for fileid, state in pending.items():
+            try:
+                metadata = self.cacheControl.load_metadata(fileid, state["name"])
+            except (FileNotFoundError, KeyError):
+                self.journal.record("done", fileid)
+                continue
+            self.cachequeue.reserve(int(metadata.size))
+            self.add_cache(fileid, metadata, *self._cache_infos(metadata.name, state["folder"]), journal=False)
+            print("Cache resumed", fileid, metadata.name)
 
-        g_files = self.get_list(dir=self.root, mimeType="application/vnd.google-apps.folder")
+        workers = max(1, int(config["gdrive"].get("upload_workers", 2)))
+        self.cacheThreads = [Thread(target=self._cache_worker, daemon=True) for _ in range(workers)]
+        for thread in self.cacheThreads:
+            thread.start()
+        print(f"Cache Workers Started ({workers})")
 
-        for fileid in self.cacheControl.get_list(self.cacheControl.root, dir=True):
-            filename: str | None = None
-            for file in self.cacheControl.get_list(self.cacheControl.root / fileid):
-                if not file.endswith(".metadata"):
-                    filename = file
-            
-            if not filename: continue
+        # Bodies cached before the journal existed still need their Drive
+        # folder resolved; do that off the start-up path.
+        Thread(target=self._requeue_unjournaled, args=(set(pending),), daemon=True).start()
 
-            metadata = self.cacheControl.load_metadata(fileid, filename)
-            folderid = g_files[fileid] if fileid in g_files else self.mkdir(fileid)
-            file_info = {
-                'name': filename,
-                'parents': [folderid]
-            }
-            file_metadata_info = {
-                'name': f"{filename}.metadata",
-                'parents': [folderid]
-            }
+    def _cache_infos(self, filename: str, folderid: str) -> tuple[dict, dict]:
+        file_info = {
+            'name': filename,
+            'parents': [folderid]
+        }
+        file_metadata_info = {
+            'name': f"{filename}.metadata",
+            'parents': [folderid]
+        }
+        return file_info, file_metadata_info
 
-            self.add_cache(fileid, metadata, file_info, file_metadata_info)
-            print("Cache added", fileid, filename)
+    def _requeue_unjournaled(self, journaled: set[str]) -> None:
+        try:
+            for metadata in self.cacheControl._walk_metadata():
+                if metadata.id in journaled or metadata.id in self.cachequeueID:
+                    continue
+                folderid = self.lookup_folder(metadata.id) or self.mkdir(metadata.id)
+                # Already on disk: account for it without blocking.
+                self.cachequeue.reserve(int(metadata.size))
+                self.add_cache(metadata.id, metadata, *self._cache_infos(metadata.name, folderid))
+                print("Cache added", metadata.id, metadata.name)
+        except Exception as exc:
+            print(f"[cache worker] requeue failed: {exc!r}")
 
-    
     def _cache_worker(self):
         # Any exception escaping this loop kills the daemon thread and silently
-        # strands all queued uploads for the rest of the process lifetime. Catch
-        # everything, log, and move on to the next item.
+        # strands its share of queued uploads for the rest of the process
+        # lifetime. Catch everything, log, and move on to the next item.
         while True:
+            fileid, size = self.cachequeue.get()
             try:
-                if len(self.cachequeue) == 0:
-                    time.sleep(1)
-                    continue
-
-                fileid = self.cachequeue.pop(0)
-
-                raw_metadata = self.cachequeueID.get(fileid, {}).get("metadata")
-                raw_info = self.cachequeueID.get(fileid, {}).get("file_info")
-                raw_metadata_info = self.cachequeueID.get(fileid, {}).get("file_metadata_info")
-
-                metadata: Metadata
-                file_info: dict
-                file_metadata_info: dict
-
-                if isinstance(raw_metadata, Metadata): metadata = raw_metadata
-                else: continue
-                if isinstance(raw_info, dict): file_info = raw_info
-                else: continue
-                if isinstance(raw_metadata_info, dict): file_metadata_info = raw_metadata_info
-                else: continue
+                self._upload_cached(fileid)
+            except Exception as exc:
+                # The body is still cached (and journaled), so its bytes
+                # stay in the backlog until a later attempt uploads it.
+                print(f"[cache worker] exception, retrying in {CACHE_RETRY_DELAY:.0f}s: {exc!r}")
+                self.cachequeue.requeue(fileid, size, CACHE_RETRY_DELAY)
+            else:
+                self.cachequeue.done(size)
+
+    def _upload_cached(self, fileid: str) -> None:
+        raw_metadata = self.cachequeueID.get(fileid, {}).get("metadata")
+        raw_info = self.cachequeueID.get(fileid, {}).get("file_info")
+        raw_metadata_info = self.cachequeueID.get(fileid, {}).get("file_metadata_info")
+
+        metadata: Metadata
+        file_info: dict
+        file_metadata_info: dict
+
+        if isinstance(raw_metadata, Metadata): metadata = raw_metadata
+        else: return
+        if isinstance(raw_info, dict): file_info = raw_info
+        else: return
+        if isinstance(raw_metadata_info, dict): file_metadata_info = raw_metadata_info
+        else: return
+
+        filePath = self.cacheControl.get_file_path(metadata.id, metadata.name)
+        metadataPath = self.cacheControl.get_file_path(metadata.id, metadata.name, metadata=True)
+
+        if not (filePath and metadataPath):
+            print(f"[cache worker] cache file missing: {metadata.id} {metadata.name}")
+            return
 
-                filePath = self.cacheControl.get_file_path(metadata.id, metadata.name)
-                metadataPath = self.cacheControl.get_file_path(metadata.id, metadata.name, metadata=True)
+        # Body and sidecar are retried separately so a sidecar failure
+        # never re-uploads (and duplicates) an already stored body.
+        self._with_backoff(lambda: self._upload_body(fileid, file_info, filePath, metadata.mimeType))
+        self._with_backoff(lambda: self.upload(file_metadata_info, self.MediaFileUpload(metadataPath, mimetype="application/json"), num_retries=self.upload_retries))
+        self.cacheControl.remove(metadata.id, metadata.name, metadata.delete, force=True, permanently=True)
+        self.cachequeueID.pop(fileid, None)
+        self.journal.record("done", fileid)
 
-                if not (filePath and metadataPath):
-                    print(f"[cache worker] cache file missing: {metadata.id} {metadata.name}")
-                    continue
+    def _upload_body(self, fileid: str, file_info: dict, path: Path, mimetype: str) -> str:
+        """Upload a cached body as a resumable upload, journaling its progress.
 
-                self.save_MediaFileUpload(filePath, metadataPath, metadata, file_info, file_metadata_info)
-                self.cacheControl.remove(metadata.id, metadata.name, metadata.delete, force=True, permanently=True)
-                self.cachequeueID.pop(fileid, None)
+        A journaled session is resumed from the offset Drive reports for it,
+        so a restart or retry only sends the bytes Drive has not acknowledged.
+        """
+        state = self.journal.state(fileid)
+        if state.get("gid"):
+            return state["gid"]
+
+        media = self.MediaFileUpload(path, mimetype=mimetype, chunksize=self.chunksize, resumable=True)
+        # Building the request sends nothing; the chunks then go over the
+        # upload's own connection (as in :meth:`open_stream`) so a long
+        # upload does not hold a pooled client away from downloads.
+        with self.clients.acquire() as service:
+            request = service.files().create(body=file_info, media_body=media, fields="id", supportsAllDrives=True)
+        http = self._stream_http()
+        response = None
+        uri = state.get("uri", "")
+        if uri:
+            status = _resumable_status(http, uri, media.size())
+            if isinstance(status, dict):
+                response = status
+            elif status is not None:
+                request.resumable_uri = uri
+                request.resumable_progress = status
+        while response is None:
+            _, response = request.next_chunk(http=http, num_retries=self.upload_retries)
+            if request.resumable_uri and request.resumable_uri != uri:
+                uri = request.resumable_uri
+                self.journal.record("session", fileid, uri=uri)
+            if response is None:
+                self.journal.record("progress", fileid, offset=request.resumable_progress)
+
+        gid = response["id"]
+        self.journal.record("body", fileid, gid=gid)
+        for parent in file_info.get("parents", []):
+            self.folder_index.put_child(parent, file_info["name"], gid)
+        return gid
+
+    def _with_backoff(self, call: Callable[[], Any]) -> Any:
+        """Run ``call``, retrying transient Drive errors with exponential backoff.
+
+        Waits 1s, 2s, 4s, ... (capped at 60s, with jitter) for up to
+        ``gdrive.upload_retries`` retries; other errors propagate at once.
+        """
+        delay = 1.0
+        for attempt in range(self.upload_retries + 1):
+            try:
+                return call()
             except Exception as exc:
-                print(f"[cache worker] exception: {exc!r}")
-                time.sleep(1)
+                if attempt == self.upload_retries or not _is_transient(exc):
+                    raise
+                print(f"[cache worker] transient error, retrying in {delay:.0f}s: {exc!r}")
+                time.sleep(delay * (0.5 + secrets.randbelow(1000) / 1000))
+                delay = min(delay * 2, 60.0)
+
+    def staging_dir(self) -> Optional[Path]:
+        return self.cacheControl.staging_dir() if self.cache else None
 
     def get_cached(self, fileid: str, filename: str) -> Path:
         if self.cache and fileid in self.cachequeueID:
@@ -368,10 +585,69 @@ class gdrive(storage):
 
         return config
 
-    def _get_files(self, **kwargs):
+    def _get_files(self, service, **kwargs):
         if "fields" not in kwargs:
-            kwargs["fields"] = "nextPageToken, files(id, name, mimeType)"
-        return self.service.files().list(includeItemsFromAllDrives=True, supportsAllDrives=True, pageSize=1000, **kwargs)
+            kwargs["fields"] = "nextPageToken, files(id, name)"
+        return service.files().list(includeItemsFromAllDrives=True, supportsAllDrives=True, pageSize=1000, **kwargs)
+
+    def iter_files(self, query: str, fields: str = "id, name") -> Iterator[dict]:
+        """Yield every file matching ``query``, following ``nextPageToken``.
+
+        Args:
+            query(str): Drive ``q`` expression.
+            fields(str): Per-file fields to request; keep it to what the
+                caller reads.
+
+        Return:
+            files(Iterator[dict]): File resources, one page fetched at a time.
+        """
+        token = ""
+        while True:
+            kwargs = {"q": query, "fields": f"nextPageToken, files({fields})"}
+            if token: kwargs["pageToken"] = token
+            with self.clients.acquire() as service:
+                results = self._get_files(service, **kwargs).execute()
+            yield from results.get("files", [])
+            token = results.get("nextPageToken", "")
+            if not token:
+                return
+
+    def list_folders(self) -> dict[str, tuple[str, dict[str, str]]]:
+        """Return every fileid folder with its children, listed in bulk.
+
+        Children are fetched for ``LIST_PARENTS_PER_QUERY`` folders per
+        query instead of one listing per folder. The result also seeds
+        :attr:`folder_index`, so follow-up lookups cost no listing at all.
+        The ``delete`` soft-delete bucket is skipped.
+
+        Return:
+            folders(dict[str, tuple[str, dict[str, str]]]):
+                ``fileid → (folder gid, {name: gid})``.
+        """
+        with self._index_lock:
+            token = "" if self.folder_index.loaded else self._start_page_token()
+            folders = self.get_list(dir=self.root, mimeType=FOLDER_MIME)
+            if token:
+                self.folder_index.load(folders, token)
+                self._changes_polled = time.monotonic()
+            else:
+                for fileid, gid in folders.items():
+                    self.folder_index.put_folder(fileid, gid)
+
+        folders.pop("delete", None)
+        children: dict[str, dict[str, str]] = {gid: {} for gid in folders.values()}
+        gids = list(children)
+        for start in range(0, len(gids), self.LIST_PARENTS_PER_QUERY):
+            batch = gids[start:start + self.LIST_PARENTS_PER_QUERY]
+            query = " or ".join(f"'{gid}' in parents" for gid in batch)
+            for file in self.iter_files(query, fields="id, name, parents"):
+                for parent in file.get("parents", []):
+                    if parent in children:
+                        children[parent][file["name"]] = file["id"]
+
+        for gid, names in children.items():
+            self.folder_index.set_children(gid, names)
+        return {fileid: (gid, children[gid]) for fileid, gid in folders.items()}
     
     def remove(self, fileid: str, filename: str, deletepass: str, force: bool = False, permanently: bool = False) -> bool:
         try:
@@ -382,21 +658,23 @@ class gdrive(storage):
         if metadata.delete != deletepass and not force:
             return False
 
-        rootList = self.get_list(dir=self.root, mimeType="application/vnd.google-apps.folder")
-        parentFolderID = rootList[metadata.id]
-        infiles = self.get_list(dir=parentFolderID)
+        parentFolderID = self.lookup_folder(metadata.id)
+        if parentFolderID is None:
+            return False
+        infiles = self.folder_children(parentFolderID)
 
         if permanently:
-            for name, gid in infiles.items():
-                with self._service_lock:
-                    self.service.files().delete(fileId=gid, supportsAllDrives=True).execute()
-            with self._service_lock:
-                self.service.files().delete(fileId=parentFolderID, supportsAllDrives=True).execute()
+            # One batched round trip. Drive also deletes a folder's
+            # descendants, so children may already be gone (404) by the
+            # time their own delete runs.
+            errors = self.execute_batch([_delete_call(gid) for gid in [*infiles.values(), parentFolderID]])
+            _raise_unless_gone(errors)
+            self.folder_index.drop_folder(metadata.id)
             return True
 
-        if "delete" in rootList:
-            deleteFolder = rootList["delete"]
-            deleteFolderList = self.get_list(dir=deleteFolder)
+        deleteFolder = self.lookup_folder("delete")
+        if deleteFolder is not None:
+            deleteFolderList = self.folder_children(deleteFolder)
         else:
             deleteFolder = self.mkdir("delete")
             deleteFolderList = {}
@@ -414,20 +692,77 @@ class gdrive(storage):
 
         filegid = infiles[metadata.name]
         metadatagid = infiles[f"{metadata.name}.metadata"]
-        with self._service_lock:
-            self.service.files().update(fileId=filegid, body={"name": newname}).execute()
-        with self._service_lock:
-            self.service.files().update(fileId=metadatagid, body={"name": f"{newname}.metadata"}).execute()
-        with self._service_lock:
-            self.service.files().update(fileId=filegid, addParents=deleteFolder, removeParents=parentFolderID).execute()
-        with self._service_lock:
-            self.service.files().update(fileId=metadatagid, addParents=deleteFolder, removeParents=parentFolderID).execute()
+        # Rename and reparent in a single update per file, both in one batch;
+        # the emptied folder goes in a second round trip once they are out.
+        errors = self.execute_batch([
+            _move_call(filegid, newname, deleteFolder, parentFolderID),
+            _move_call(metadatagid, f"{newname}.metadata", deleteFolder, parentFolderID),
+        ])
+        for error in errors:
+            if error is not None:
+                raise error
+        self.folder_index.put_child(deleteFolder, newname, filegid)
+        self.folder_index.put_child(deleteFolder, f"{newname}.metadata", metadatagid)
         if len(infiles) == 2:
-            with self._service_lock:
-                self.service.files().delete(fileId=parentFolderID).execute()
+            with self.clients.acquire() as service:
+                service.files().delete(fileId=parentFolderID, supportsAllDrives=True).execute()
+            self.folder_index.drop_folder(metadata.id)
 
         return True
         
+    def remove_many(self, entries: list[Metadata]) -> list[Metadata]:
+        """Permanently remove many files, batching the deletes across files.
+
+        Used by the reaper: up to ``BATCH_LIMIT`` deletes travel in one HTTP
+        request, whichever files they belong to. No owner key check.
+
+        Return:
+            removed(list[Metadata]): The entries that are now gone.
+        """
+        calls = []
+        plan: list[tuple[Metadata, range]] = []
+        for metadata in entries:
+            folder = self.lookup_folder(metadata.id)
+            if folder is None:
+                continue
+            gids = [*self.folder_children(folder).values(), folder]
+            plan.append((metadata, range(len(calls), len(calls) + len(gids))))
+            calls.extend(_delete_call(gid) for gid in gids)
+
+        errors = self.execute_batch(calls)
+        removed = []
+        for metadata, span in plan:
+            failed = [errors[i] for i in span if errors[i] is not None and not _is_not_found(errors[i])]
+            if failed:
+                print(f"[gdrive] failed to remove {metadata.id}/{metadata.name}: {failed[0]!r}")
+                continue
+            self.folder_index.drop_folder(metadata.id)
+            removed.append(metadata)
+        return removed
+
+    def execute_batch(self, calls: list[Callable[[Any], Any]]) -> list[Optional[Exception]]:
+        """Run Drive calls as batch requests, ``BATCH_LIMIT`` per round trip.
+
+        Args:
+            calls(list[Callable]): Each maps a Drive service to an unexecuted
+                request, so requests are built on the client that sends them.
+
+        Return:
+            errors(list[Exception | None]): Per-call outcome, in order.
+        """
+        errors: list[Optional[Exception]] = [None] * len(calls)
+
+        def _record(request_id, response, exception):
+            errors[int(request_id)] = exception
+
+        for start in range(0, len(calls), self.BATCH_LIMIT):
+            with self.clients.acquire() as service:
+                batch = service.new_batch_http_request(callback=_record)
+                for i in range(start, min(start + self.BATCH_LIMIT, len(calls))):
+                    batch.add(calls[i](service), request_id=str(i))
+                batch.execute()
+        return errors
+
     def get_list(self, dir: str, mimeType: str = "") -> dict[str, str]:
         """
         Return:
@@ -435,38 +770,124 @@ class gdrive(storage):
         """
         query = f"'{dir}' in parents"
         if mimeType: query += f" and mimeType='{mimeType}'"
-        with self._service_lock:
-            results = self._get_files(q=query).execute()
-        files = {}
-        for i in results["files"]:
-            files[i["name"]] = i["id"]
-        
-        return files
+        return {file["name"]: file["id"] for file in self.iter_files(query)}
 
     def is_fid_exists(self, fileid: str) -> bool:
-        with self._service_lock:
-            results = self._get_files(q=f"'{self.root}' in parents and mimeType='application/vnd.google-apps.folder' and name='{fileid}'").execute()
-        return len(results["files"]) > 0
+        # Answered from the index alone: a fileid created by another process
+        # since the last changes poll is astronomically unlikely to collide.
+        return self._folder_index().folder(fileid) is not None
+
+    def lookup_folder(self, fileid: str) -> Optional[str]:
+        """Return the gid of ``fileid``'s folder, or None when it does not exist.
+
+        Served from :attr:`folder_index`. A miss falls back to one
+        name query, in case the folder was created by another process
+        after the last changes poll.
+        """
+        gid = self._folder_index().folder(fileid)
+        if gid is not None:
+            return gid
+        with self.clients.acquire() as service:
+            results = self._get_files(service, q=f"'{self.root}' in parents and mimeType='{FOLDER_MIME}' and name='{fileid}'").execute()
+        if not results["files"]:
+            return None
+        gid = results["files"][0]["id"]
+        self.folder_index.put_folder(fileid, gid)
+        return gid
+
+    def folder_children(self, folder_gid: str) -> dict[str, str]:
+        """Return ``name → gid`` for a folder, listing it only on first use."""
+        children = self.folder_index.children(folder_gid)
+        if children is None:
+            children = self.get_list(dir=folder_gid)
+            self.folder_index.set_children(folder_gid, children)
+        return children
+
+    def sync_changes(self, if_due: bool = False) -> int:
+        """Apply every pending Drive change to :attr:`folder_index`.
+
+        Args:
+            if_due(bool): Skip the poll unless ``changes_interval`` has
+                passed since the last one. Checked under the index lock, so
+                lookups that raced to poll run ``changes.list`` only once.
+
+        Return:
+            applied(int): Number of change entries processed.
+        """
+        applied = 0
+        with self._index_lock:
+            if if_due and time.monotonic() - self._changes_polled < self.changes_interval:
+                return 0
+            self._changes_polled = time.monotonic()
+            token = self.folder_index.page_token
+            while token:
+                with self.clients.acquire() as service:
+                    page = service.changes().list(
+                        pageToken=token,
+                        pageSize=1000,
+                        includeItemsFromAllDrives=True,
+                        supportsAllDrives=True,
+                        fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, parents, trashed))",
+                    ).execute()
+                for change in page.get("changes", []):
+                    self.folder_index.apply_change(change)
+                    applied += 1
+                if "newStartPageToken" in page:
+                    self.folder_index.page_token = page["newStartPageToken"]
+                    break
+                token = page.get("nextPageToken", "")
+        return applied
+
+    def _folder_index(self) -> DriveFolderIndex:
+        """Return :attr:`folder_index`, seeding it or polling for changes first.
+
+        Seeding goes through :meth:`list_folders`, so every folder's
+        children are known up front and a cold lookup needs no listing.
+        """
+        index = self.folder_index
+        if not index.loaded:
+            with self._index_lock:
+                if not index.loaded:
+                    self.list_folders()
+        elif time.monotonic() - self._changes_polled >= self.changes_interval:
+            try:
+                self.sync_changes(if_due=True)
+            except Exception as exc:
+                print(f"[gdrive] changes poll failed: {exc!r}")
+        return index
+
+    def _start_page_token(self) -> str:
+        # Taken before the root is listed, so nothing that happens during
+        # the listing is missed by the next changes poll.
+        with self.clients.acquire() as service:
+            return service.changes().getStartPageToken(supportsAllDrives=True).execute()["startPageToken"]
     
-    def upload(self, metadata: dict, media = None) -> str:
+    def upload(self, metadata: dict, media = None, num_retries: int = 0) -> str:
         kwargs = {"body": metadata, "fields": "id"}
         if media: kwargs["media_body"] = media
-        with self._service_lock:
-            file = self.service.files().create(supportsAllDrives=True, **kwargs).execute()
-        return file.get('id')
+        with self.clients.acquire() as service:
+            # ``num_retries`` lets the client resume a resumable upload chunk
+            # after a transient failure instead of starting over.
+            file = service.files().create(supportsAllDrives=True, **kwargs).execute(num_retries=num_retries)
+        gid = file.get('id')
+        for parent in metadata.get("parents", []):
+            self.folder_index.put_child(parent, metadata["name"], gid)
+        return gid
 
     def mkdir(self, name: str) -> str:
         file_metadata = {
             'name': name,
-            'mimeType': 'application/vnd.google-apps.folder',
+            'mimeType': FOLDER_MIME,
             'parents': [self.root]
         }
-        return self.upload(file_metadata)
+        gid = self.upload(file_metadata)
+        self.folder_index.put_folder(name, gid, empty=True)
+        return gid
 
-    def save(self, file: LimitedStream, filesize: int, filename: str, fileid: str = "") -> Metadata:
+    def save(self, file: LimitedStream, filesize: int, filename: str, fileid: str = "", sha256: str = "") -> Metadata:
         fileid, mimetype, metadataname = self._save(filename, fileid)
         parentFolderID = self.mkdir(fileid)
-        metadata = self.make_metadata(filesize, filename, fileid, mimetype)
+        metadata = self.make_metadata(filesize, filename, fileid, mimetype, sha256)
 
         file_info = {
             'name': filename,
@@ -478,13 +899,122 @@ class gdrive(storage):
         }
 
         if self.cache:
-            metadata = self.cacheControl.save(file, filesize, filename, fileid)
+            # The caller reserved ``filesize`` with :meth:`reserve_upload`
+            # before reading the body; add_cache hands it to the queue.
+            metadata = self.cacheControl.save(file, filesize, filename, fileid, sha256)
             self.add_cache(fileid, metadata, file_info, file_metadata_info)
         else:
             metadata = self.save_BytesIO(file, metadata, file_info, file_metadata_info)
         
         return metadata
 
+    def reserve_upload(self, size: int) -> bool:
+        """Claim ``gdrive.cache_backlog_max`` room for a body headed for the local cache."""
+        return not self.cache or self.cachequeue.try_reserve(size)
+
+    def release_upload(self, size: int) -> None:
+        if self.cache:
+            self.cachequeue.release(size)
+
+    def open_stream(self, filename: str) -> DriveStreamUpload:
+        """Create the file's folder and a resumable session, ready for :meth:`DriveStreamUpload.write`."""
+        fileid, mimetype, metadataname = self._save(filename)
+        folder = self.mkdir(fileid)
+        http = self._stream_http()
+        try:
+            uri = _open_resumable(http, {"name": filename, "parents": [folder]}, mimetype)
+        except BaseException:
+            self._drop_stream_folder(fileid, folder)
+            raise
+        return DriveStreamUpload(
+            lambda data, offset, total: self._put_stream_chunk(http, uri, data, offset, total),
+            self.stream_chunk,
+            target={"fileid": fileid, "name": filename, "mimetype": mimetype, "folder": folder, "uri": uri, "http": http},
+        )
+
+    def finish_stream(self, upload: DriveStreamUpload) -> Metadata:
+        """Send the last chunk, then write the sidecar; returns the new metadata."""
+        file = upload.finish()
+        target = upload.target
+        self.folder_index.put_child(target["folder"], target["name"], file["id"])
+        metadata = self.make_metadata(upload.size, target["name"], target["fileid"], target["mimetype"], upload.sha256())
+        metadataIO = BytesIO(metadata.to_json(private=True).encode("utf-8"))
+        self.upload(
+            {"name": f"{target['name']}.metadata", "parents": [target["folder"]]},
+            self.MediaIoBaseUpload(metadataIO, mimetype="application/json"),
+            num_retries=self.upload_retries,
+        )
+        return metadata
+
+    def abort_stream(self, upload: DriveStreamUpload) -> None:
+        """Stop an unfinished streamed upload and remove what it created on Drive."""
+        upload.abort()
+        target = upload.target
+        try:
+            target["http"].request(target["uri"], method="DELETE")
+        except Exception as exc:
+            print(f"[gdrive] could not cancel upload session for {target['fileid']}: {exc!r}")
+        self._drop_stream_folder(target["fileid"], target["folder"])
+
+    def _drop_stream_folder(self, fileid: str, folder: str) -> None:
+        try:
+            _raise_unless_gone(self.execute_batch([_delete_call(folder)]))
+        except Exception as exc:
+            print(f"[gdrive] could not remove folder of aborted upload {fileid}: {exc!r}")
+        self.folder_index.drop_folder(fileid)
+
+    def _put_stream_chunk(self, http, uri: str, data: bytes, offset: int, total: Optional[int]) -> Optional[dict]:
+        """PUT ``data`` at ``offset`` of a resumable session.
+
+        Bytes Drive did not acknowledge are re-sent; transient failures are
+        retried with backoff after asking Drive where the session stands.
+
+        Return:
+            file(dict | None): The created file resource once ``total``
+                bytes are in, otherwise None.
+        """
+        end = offset + len(data)
+        length = "*" if total is None else str(total)
+        position = offset
+        delay = 1.0
+        attempt = 0
+        while True:
+            content_range = f"bytes {position}-{end - 1}/{length}" if position < end else f"bytes */{length}"
+            error: Optional[Exception] = None
+            try:
+                resp, content = http.request(
+                    uri,
+                    method="PUT",
+                    body=data[position - offset:],
+                    headers={"Content-Length": str(end - position), "Content-Range": content_range},
+                )
+                if resp.status in (200, 201):
+                    return loads(content)
+                if resp.status == 308:
+                    received = resp.get("range", "")
+                    acked = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+                    if acked >= end:
+                        return None
+                    if acked > position:
+                        position = acked
+                        continue
+                from googleapiclient.errors import HttpError
+                error = HttpError(resp, content, uri=uri)
+            except Exception as exc:
+                error = exc
+            if attempt >= self.upload_retries or not _is_transient(error):
+                raise error
+            print(f"[gdrive] transient error streaming upload, retrying in {delay:.0f}s: {error!r}")
+            time.sleep(delay * (0.5 + secrets.randbelow(1000) / 1000))
+            delay = min(delay * 2, 60.0)
+            attempt += 1
+            status = _resumable_status(http, uri, length)
+            if isinstance(status, dict):
+                return status
+            if status is None or status < offset:
+                raise error
+            position = status
+
     def save_BytesIO(self, file: LimitedStream, metadata: Metadata, file_info: dict, file_metadata_info: dict) -> Metadata:
         metadataIO = BytesIO(metadata.to_json(private=True).encode("utf-8"))
 
@@ -498,13 +1028,6 @@ class gdrive(storage):
 
         return metadata
 
-    def save_MediaFileUpload(self, file: Path, file_meta: Path, metadata: Metadata, file_info: dict, file_metadata_info: dict):
-        media = self.MediaFileUpload(file, mimetype=metadata.mimeType, resumable=True)
-        mtdata = self.MediaFileUpload(file_meta, mimetype="application/json")
-        self.upload(file_info, media)
-        self.upload(file_metadata_info, mtdata)
-
-
     def load_metadata(self, fileid: str, filename: str) -> Metadata:
         if self.cache and fileid in self.cachequeueID:
             raw_metadata = self.cachequeueID.get(fileid, {}).get("metadata")
@@ -517,20 +1040,28 @@ class gdrive(storage):
                 # update against the correct file id.
                 self._populate_metadata_gfileID(metadata, filename)
         else:
-            rootList = self.get_list(dir=self.root, mimeType="application/vnd.google-apps.folder")
-            if fileid not in rootList:
+            parentFolderID = self.lookup_folder(fileid)
+            if parentFolderID is None:
                 raise FileNotFoundError(f"File id {fileid} or name {filename} not found")
 
-            folderList = self.get_list(dir=rootList[fileid])
+            folderList = self.folder_children(parentFolderID)
             if f"{filename}.metadata" not in folderList:
                 raise FileNotFoundError(f"File id {fileid} or name {filename} not found")
 
             metadata = Metadata()
-            with self._service_lock:
-                raw = self.service.files().get_media(fileId=folderList[f"{filename}.metadata"]).execute()
+            try:
+                with self.clients.acquire() as service:
+                    raw = service.files().get_media(fileId=folderList[f"{filename}.metadata"]).execute()
+            except Exception as exc:
+                if not _is_not_found(exc):
+                    raise
+                # The index was stale; forget the folder so the next lookup
+                # asks Drive again.
+                self.folder_index.drop_folder(fileid)
+                raise FileNotFoundError(f"File id {fileid} or name {filename} not found") from exc
             metadata.load(dataraw=raw.decode("utf-8"))
 
-            metadata.optional_parentfolderID = rootList[fileid]
+            metadata.optional_parentfolderID = parentFolderID
             metadata.optional_gfileID = folderList[filename]
             metadata.optional_metadata_gfileID = folderList[f"{filename}.metadata"]
 
@@ -547,12 +1078,11 @@ class gdrive(storage):
         """
         parent = getattr(metadata, "optional_parentfolderID", "")
         if not parent:
-            rootList = self.get_list(dir=self.root, mimeType="application/vnd.google-apps.folder")
-            if metadata.id not in rootList:
+            parent = self.lookup_folder(metadata.id)
+            if parent is None:
                 raise FileNotFoundError(f"File id {metadata.id} not found in gdrive root")
-            parent = rootList[metadata.id]
             metadata.optional_parentfolderID = parent
-        folderList = self.get_list(dir=parent)
+        folderList = self.folder_children(parent)
         sidecar = folderList.get(f"{filename}.metadata")
         if not sidecar:
             raise FileNotFoundError(f"Metadata sidecar for {metadata.id}/{filename} not found")
@@ -569,17 +1099,98 @@ class gdrive(storage):
             self._populate_metadata_gfileID(metadata, metadata.name)
         payload = BytesIO(metadata.to_json(private=True).encode("utf-8"))
         media = self.MediaIoBaseUpload(payload, mimetype="application/json")
-        with self._service_lock:
-            self.service.files().update(
+        with self.clients.acquire() as service:
+            service.files().update(
                 fileId=metadata.optional_metadata_gfileID,
                 media_body=media,
                 supportsAllDrives=True,
             ).execute()
 
+    def read_range(self, gfile_id: str, start: int, end: int, cancelled: Optional[Event] = None) -> bytes:
+        """Download bytes ``start``..``end`` (inclusive) of a Drive file.
+
+        Each call checks out its own pooled client, so one long download
+        never holds a client (or blocks other Drive traffic) between chunks.
+        Reads first wait for one of :attr:`read_slots`; a read whose
+        ``cancelled`` event is set by then returns ``b""`` without touching
+        Drive. A request already sent cannot be interrupted.
+        """
+        with self.read_slots or nullcontext():
+            if cancelled is not None and cancelled.is_set():
+                return b""
+            with self.clients.acquire() as service:
+                request = service.files().get_media(fileId=gfile_id, supportsAllDrives=True)
+                request.headers["Range"] = f"bytes={start}-{end}"
+                return request.execute()
+
     def download(self, fileid: str, filename: str) -> Any:
         raise NotImplementedError("storage.download is handled in routers/files.py for FastAPI")
 
 
+def _delete_call(gid: str) -> Callable[[Any], Any]:
+    return lambda service: service.files().delete(fileId=gid, supportsAllDrives=True)
+
+
+def _move_call(gid: str, name: str, new_parent: str, old_parent: str) -> Callable[[Any], Any]:
+    return lambda service: service.files().update(
+        fileId=gid,
+        body={"name": name},
+        addParents=new_parent,
+        removeParents=old_parent,
+        supportsAllDrives=True,
+    )
+
+
+def _open_resumable(http, file_info: dict, mimetype: str) -> str:
+    """Start a Drive resumable upload session; returns the session URI."""
+    resp, content = http.request(
+        RESUMABLE_UPLOAD_URI,
+        method="POST",
+        body=dumps(file_info),
+        headers={"Content-Type": "application/json; charset=UTF-8", "X-Upload-Content-Type": mimetype},
+    )
+    if resp.status != 200 or "location" not in resp:
+        from googleapiclient.errors import HttpError
+        raise HttpError(resp, content, uri=RESUMABLE_UPLOAD_URI)
+    return resp["location"]
+
+
+def _resumable_status(http, uri: str, size: int | str) -> Optional[int | dict]:
+    """Ask Drive how much of a resumable session it holds.
+
+    Return:
+        status(int | dict | None): Next offset to send; the created file
+            resource when the upload already completed; None when the
+            session is gone (expired or unknown) and must start over.
+    """
+    resp, content = http.request(uri, method="PUT", headers={"Content-Length": "0", "Content-Range": f"bytes */{size}"})
+    if resp.status in (200, 201):
+        return loads(content)
+    if resp.status == 308:
+        received = resp.get("range", "")
+        return int(received.rsplit("-", 1)[1]) + 1 if received else 0
+    return None
+
+
+def _is_transient(error: Exception) -> bool:
+    """True for errors worth retrying: throttling, 5xx and network failures."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        return int(status) in (408, 429, 500, 502, 503, 504)
+    return isinstance(error, (OSError, TimeoutError)) or type(error).__module__.startswith("httplib2")
+
+
+def _is_not_found(error: Exception) -> bool:
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return str(status) == "404"
+
+
+def _raise_unless_gone(errors: list[Optional[Exception]]) -> None:
+    for error in errors:
+        if error is not None and not _is_not_found(error):
+            raise error
+
+
 class local(storage):
     def __init__(self, config: dict, configPath: Path):
         super().__init__(config, configPath)
@@ -596,16 +1207,120 @@ class local(storage):
         self.root = root.resolve()
         self.cache = False
 
+        # Upload bodies spill into this directory so they can be linked
+        # into their final folder. Leftovers from a crashed process are
+        # swept once they are clearly stale; younger files may belong to
+        # another worker's in-flight upload.
+        self._staging = self.root / ".uploads"
+        self._staging.mkdir(exist_ok=True)
+        stale_before = time.time() - 86400
+        for leftover in self._staging.iterdir():
+            try:
+                if leftover.stat().st_mtime < stale_before:
+                    leftover.unlink()
+            except OSError:
+                pass
+
+        layout = config["local"].get("layout", "flat")
+        if layout not in ("flat", "sharded"):
+            raise ValueError(f"Invalid local.layout: {layout}")
+        self.sharded = layout == "sharded"
+
+        # Optional content-addressed store: bodies with a known SHA-256 live
+        # once under ``.blobs/ab/<sha256>`` and every fileid folder holds a
+        # hard link to it, so the link count doubles as the refcount.
+        self.dedup = bool(config["local"].get("dedup", False))
+        # Hash-first PUTs hand out a stored blob to anyone who knows its
+        # digest, so they need their own opt-in on top of dedup.
+        self.hash_first = self.dedup and bool(config["local"].get("hash_first", False))
+        self._blobs = self.root / ".blobs"
+        self._blob_lock = Lock()
+        if self.dedup:
+            self._blobs.mkdir(exist_ok=True)
+
+        # Optional SQLite index over the sidecars. A freshly created index
+        # file is empty, so seed it from the existing tree once.
+        self.index: Optional[MetadataIndex] = None
+        if config["local"].get("index", False):
+            index_path = self.root / ".index.sqlite3"
+            fresh = not index_path.exists()
+            self.index = MetadataIndex(index_path)
+            if fresh:
+                self.rebuild_index()
+
     def get_list(self, path: Path, dir: bool = False) -> list[str]:
         if dir:
             return [f.name for f in path.iterdir() if f.is_dir()]
         else:
             return [f.name for f in path.iterdir() if f.is_file()]
     
+    def staging_dir(self) -> Optional[Path]:
+        return self._staging
+
+    def folder_path(self, fileid: str) -> Path:
+        """Return the folder holding ``fileid``'s file and sidecar.
+
+        The flat layout keeps every folder directly under the root. The
+        sharded layout fans them out as ``root/ab/cd/<fileid>`` using the
+        first two bytes of ``md5(fileid)`` so no directory grows past a few
+        thousand entries. The hash (rather than the fileid's own prefix)
+        keeps the fan-out even and case-insensitive-filesystem safe.
+        """
+        if not self.sharded:
+            return self.root / fileid
+        digest = hashlib.md5(fileid.encode("utf-8")).hexdigest()
+        return self.root / digest[0:2] / digest[2:4] / fileid
+
     def is_fid_exists(self, fileid: str) -> bool:
-        return (self.root / fileid).exists()
+        return self.folder_path(fileid).exists()
+
+    def blob_path(self, sha256: str) -> Path:
+        return self._blobs / sha256[0:2] / sha256
+
+    def save(self, file: LimitedStream, filesize: int, filename: str, fileid: str = "", sha256: str = "") -> Metadata:
+        fileid, mimetype, metadataname, folder = self._allocate_folder(filename, fileid)
+        metadata = self.make_metadata(filesize, filename, fileid, mimetype, sha256)
+        if self.dedup and sha256:
+            self._commit_blob(file, sha256, folder / filename)
+        else:
+            self.commit_stream(file, folder / filename)
+        (folder / metadataname).write_text(metadata.to_json(private=True), encoding="utf-8")
+        self._index_put(metadata)
+        return metadata
+
+    def save_by_digest(self, sha256: str, filename: str) -> Optional[Metadata]:
+        """Create a new file from an already stored blob, without any body.
+
+        Backs the hash-first PUT (``local.hash_first``): a client that
+        announces the digest of a body this server already holds gets a
+        share URL straight away. A blob only kept alive by soft-deleted
+        files is treated as absent, so deleted content cannot be revived.
+
+        Return:
+            metadata(Metadata | None): The new file, or None when hash-first
+                is off or no live file holds that digest.
+        """
+        if not self.hash_first:
+            return None
+        blob = self.blob_path(sha256)
+        with self._blob_lock:
+            try:
+                stat = blob.stat()
+            except FileNotFoundError:
+                return None
+            # One link is the blob itself; the rest are file folders and
+            # soft-deleted copies.
+            if stat.st_nlink - 1 <= self._deleted_links(sha256):
+                return None
+            filesize = stat.st_size
+            fileid, mimetype, metadataname, folder = self._allocate_folder(filename)
+            os.link(blob, folder / filename)
+        metadata = self.make_metadata(filesize, filename, fileid, mimetype, sha256)
+        (folder / metadataname).write_text(metadata.to_json(private=True), encoding="utf-8")
+        self._index_put(metadata)
+        return metadata
 
-    def save(self, file: LimitedStream, filesize: int, filename: str, fileid: str = "") -> Metadata:
+    def _allocate_folder(self, filename: str, fileid: str = "") -> tuple[str, str, str, Path]:
         # When the caller did not pin a fileid, retry on TOCTOU collisions
         # between is_fid_exists and mkdir. With a CSPRNG and 6+ chars the
         # collision rate is astronomically low, but a defensive retry keeps
@@ -613,20 +1328,89 @@ class local(storage):
         explicit_fileid = bool(fileid)
         for attempt in range(8):
             fileid_candidate, mimetype, metadataname = self._save(filename, fileid)
-            folder = self.root / fileid_candidate
+            folder = self.folder_path(fileid_candidate)
+            if self.sharded:
+                folder.parent.mkdir(parents=True, exist_ok=True)
             try:
                 folder.mkdir(exist_ok=False)
             except FileExistsError:
                 if explicit_fileid:
                     raise
                 continue
-
-            metadata = self.make_metadata(filesize, filename, fileid_candidate, mimetype)
-            self.write_stream(file, folder / filename)
-            (folder / metadataname).write_text(metadata.to_json(private=True), encoding="utf-8")
-            return metadata
+            return fileid_candidate, mimetype, metadataname, folder
 
         raise RuntimeError("Failed to allocate a unique fileid after retries")
+
+    def _commit_blob(self, file: LimitedStream, sha256: str, path: Path) -> None:
+        """Link ``path`` to the blob for ``sha256``, storing the body only if new.
+
+        A new body is committed next to the blob under a private name and
+        then linked into place, so a half-written blob is never visible.
+        The copy runs outside :attr:`_blob_lock`; only the links take it.
+        """
+        blob = self.blob_path(sha256)
+        with self._blob_lock:
+            try:
+                os.link(blob, path)
+                return
+            except FileNotFoundError:
+                pass
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        partial = blob.parent / f".{sha256}.{self._create_id(8)}.part"
+        try:
+            self.commit_stream(file, partial)
+            with self._blob_lock:
+                try:
+                    os.link(partial, blob)
+                except FileExistsError:
+                    # Another upload stored the same body first.
+                    pass
+                os.link(blob, path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    def _deleted_count_path(self, sha256: str) -> Path:
+        return self._blobs / sha256[0:2] / f".{sha256}.deleted"
+
+    def _deleted_links(self, sha256: str) -> int:
+        """Return how many soft-deleted files in ``delete/`` link to the blob.
+
+        Kept as a small counter file next to the blob, bumped by
+        :meth:`remove`. Purging ``delete/`` by hand leaves it too high,
+        which only ever makes :meth:`save_by_digest` refuse a blob.
+        """
+        try:
+            return int(self._deleted_count_path(sha256).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _count_deleted_link(self, sha256: str, path: Path) -> None:
+        """Record that ``path``, now under ``delete/``, still links to the blob."""
+        blob = self.blob_path(sha256)
+        with self._blob_lock:
+            try:
+                if path.stat().st_ino != blob.stat().st_ino:
+                    return
+            except FileNotFoundError:
+                return
+            self._deleted_count_path(sha256).write_text(str(self._deleted_links(sha256) + 1), encoding="utf-8")
+
+    def _release_blob(self, sha256: str) -> None:
+        """Drop the blob for ``sha256`` once no file links to it any more.
+
+        Soft-deleted files keep their link in ``delete/`` and so keep the
+        blob alive until they are purged.
+        """
+        if not sha256:
+            return
+        blob = self.blob_path(sha256)
+        with self._blob_lock:
+            try:
+                if blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    self._deleted_count_path(sha256).unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
     
     def remove(self, fileid: str, filename: str, deletepass: str, force: bool = False, permanently: bool = False):
         try:
@@ -648,8 +1432,12 @@ class local(storage):
             if not (deleteFolder / newname).exists():
                 break
 
-        (self.root / fileid / filename).rename(deleteFolder / newname)
-        (self.root / fileid / f"{filename}.metadata").rename(deleteFolder / f"{newname}.metadata")
+        folder = self.folder_path(fileid)
+        (folder / filename).rename(deleteFolder / newname)
+        (folder / f"{filename}.metadata").rename(deleteFolder / f"{newname}.metadata")
+        self._index_drop(fileid)
+        if self.dedup and metadata.sha256:
+            self._count_deleted_link(metadata.sha256, deleteFolder / newname)
 
         return True
 
@@ -664,9 +1452,9 @@ class local(storage):
         # in-flight readers (FastAPI's FileResponse opens the FD lazily
         # inside its handler) keep their already-opened descriptors valid
         # even after we delete the renamed copies — and any new lookup
-        # against ``self.root / fileid`` cleanly 404s the moment the
+        # against ``self.folder_path(fileid)`` cleanly 404s the moment the
         # rename returns.
-        folder = self.root / fileid
+        folder = self.folder_path(fileid)
         if not folder.is_dir():
             return False
 
@@ -677,6 +1465,7 @@ class local(storage):
             folder.rename(tombstone)
         except FileNotFoundError:
             return False
+        self._index_drop(fileid)
 
         for entry in tombstone.iterdir():
             try:
@@ -687,11 +1476,19 @@ class local(storage):
             tombstone.rmdir()
         except OSError:
             pass
+        self._release_blob(metadata.sha256)
 
         return True
     
     def load_metadata(self, fileid: str, filename: str) -> Metadata:
-        folderPath = self.root / fileid
+        if self.index is not None:
+            data = self.index.get(fileid)
+            if data is not None and data.get("name") == filename:
+                metadata = Metadata()
+                metadata.load(data)
+                return metadata
+
+        folderPath = self.folder_path(fileid)
         if not folderPath.exists(): 
             raise FileNotFoundError(f"File id {fileid} or name {filename} not found")
         
@@ -704,7 +1501,10 @@ class local(storage):
 
         if metadata.name != filename:
             raise FileNotFoundError(f"File id {fileid} or name {filename} not found")
-        
+
+        # A sidecar without an index row means the index drifted (e.g. a
+        # crash between the two writes); heal it on the way through.
+        self._index_put(metadata)
         return metadata
     
     def update_metadata(self, metadata: Metadata) -> None:
@@ -716,7 +1516,7 @@ class local(storage):
         a torn read, and unique temp paths via :func:`tempfile.mkstemp`
         avoid races between simultaneous writers.
         """
-        folder = self.root / metadata.id
+        folder = self.folder_path(metadata.id)
         target = folder / f"{metadata.name}.metadata"
         if not folder.is_dir():
             raise FileNotFoundError(f"File id {metadata.id} not found")
@@ -734,6 +1534,7 @@ class local(storage):
         except Exception:
             tmp.unlink(missing_ok=True)
             raise
+        self._index_put(metadata)
 
     def download(self, fileid: str, filename: str) -> Any:
         raise NotImplementedError("storage.download is handled in routers/files.py for FastAPI")
@@ -742,6 +1543,133 @@ class local(storage):
         self.load_metadata(fileid, filename)
 
         if metadata:
-            return self.root / fileid / f"{filename}.metadata"
+            return self.folder_path(fileid) / f"{filename}.metadata"
         else:
-            return self.root / fileid / filename
+            return self.folder_path(fileid) / filename
+
+    def list_metadata(self) -> list[Metadata]:
+        """Return Metadata for every live file folder under the root.
+
+        Served from the index when it is enabled; otherwise walks the tree.
+        """
+        if self.index is not None:
+            return [self._from_row(data) for data in self.index.all()]
+        return list(self._walk_metadata())
+
+    def list_expiring(self) -> list[Metadata]:
+        """Return Metadata for every file that has a retention deadline.
+
+        Served from the index's ``expires_at`` column when it is enabled;
+        otherwise walks the tree and filters.
+        """
+        if self.index is not None:
+            return [self._from_row(data) for data in self.index.expiring()]
+        return [metadata for metadata in self._walk_metadata() if expiry_deadline(metadata) is not None]
+
+    def rebuild_index(self) -> int:
+        """Regenerate the index from the on-disk sidecars.
+
+        Return:
+            count(int): Number of entries indexed.
+        """
+        if self.index is None:
+            raise RuntimeError("local.index is not enabled")
+        return self.index.replace_all(
+            (metadata.to_dict(private=True), expiry_deadline(metadata))
+            for metadata in self._walk_metadata()
+        )
+
+    def _walk_metadata(self):
+        """Yield Metadata for each file folder by reading its sidecar.
+
+        Folders without a ``*.metadata`` sidecar are treated as
+        not-yet-finalized uploads.
+        """
+        for folder in self._iter_folders():
+            metadataPath = _find_metadata_path(folder)
+            if metadataPath is None:
+                continue
+            try:
+                metadata = Metadata()
+                metadata.load(dataPath=metadataPath)
+            except Exception as exc:
+                logger.warning("Failed to load %s: %r", metadataPath, exc)
+                continue
+            yield metadata
+
+    def _iter_folders(self):
+        """Yield every fileid folder for the configured layout.
+
+        Skips the ``delete`` soft-delete bucket and any name that begins
+        with a dot (covers ``.tombstones`` and the index).
+        """
+        level = [self.root]
+        for _ in range(2 if self.sharded else 0):
+            level = [shard for parent in level for shard in _list_dirs(parent) if _is_shard_name(shard.name)]
+        for parent in level:
+            for folder in _list_dirs(parent):
+                if folder.name == "delete" or folder.name.startswith("."):
+                    continue
+                yield folder
+
+    def migrate_layout(self) -> int:
+        """Move flat ``root/<fileid>`` folders into the sharded layout in place.
+
+        Each folder moves with a single same-filesystem rename, so an
+        interrupted migration leaves every file either at its old or its new
+        path and can simply be re-run.
+
+        Return:
+            moved(int): Number of folders relocated.
+        """
+        if not self.sharded:
+            raise RuntimeError("local.layout must be 'sharded' to migrate")
+        moved = 0
+        for folder in _list_dirs(self.root):
+            name = folder.name
+            if name == "delete" or name.startswith(".") or _is_shard_name(name):
+                continue
+            target = self.folder_path(name)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                folder.rename(target)
+            except OSError as exc:
+                print(f"[local] failed to migrate {name}: {exc!r}")
+                continue
+            moved += 1
+        return moved
+
+    def _from_row(self, data: dict) -> Metadata:
+        metadata = Metadata()
+        metadata.load(data)
+        return metadata
+
+    def _index_put(self, metadata: Metadata) -> None:
+        if self.index is not None:
+            self.index.upsert(metadata.to_dict(private=True), expiry_deadline(metadata))
+
+    def _index_drop(self, fileid: str) -> None:
+        if self.index is not None:
+            self.index.remove(fileid)
+
+
+def _list_dirs(path: Path) -> list[Path]:
+    try:
+        return [entry for entry in path.iterdir() if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
+def _is_shard_name(name: str) -> bool:
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def _find_metadata_path(folder: Path) -> Optional[Path]:
+    """Return the first ``*.metadata`` file in ``folder`` or None."""
+    try:
+        for entry in folder.iterdir():
+            if entry.is_file() and entry.name.endswith(".metadata"):
+                return entry
+    except FileNotFoundError:
+        return None
+    return None
@@ -12,10 +12,14 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from oryups.config import STATIC_DIR, get_config, load_config
 from oryups.response import make_response
-from oryups.routers import admin, api, api_v1, assets, files, root
+from oryups.routers import admin, api, api_v1, assets, files, root, uploads
+from oryups.services import cache
 from oryups.services.reaper import run_reaper
+from oryups.utils.upload import DEFAULT_UPLOAD_MEMORY_BUDGET, configure_spool_budget
 
 
+_EXPOSED_HEADERS: list[str] = ["X-Owner-Key", "Location", "Upload-Offset", "Upload-Length"]
+
 _BASELINE_SECURITY_HEADERS: dict[str, str] = {
     "X-Content-Type-Options": "nosniff",
     "X-Frame-Options": "SAMEORIGIN",
@@ -61,7 +65,7 @@ def _configure_middleware(app: FastAPI, config: dict) -> None:
                 allow_credentials=False,
                 allow_methods=["*"],
                 allow_headers=["*"],
-                expose_headers=["X-Owner-Key"],
+                expose_headers=_EXPOSED_HEADERS,
             )
         else:
             app.add_middleware(
@@ -70,7 +74,7 @@ def _configure_middleware(app: FastAPI, config: dict) -> None:
                 allow_credentials=True,
                 allow_methods=["*"],
                 allow_headers=["*"],
-                expose_headers=["X-Owner-Key"],
+                expose_headers=_EXPOSED_HEADERS,
             )
 
     if config["host"].get("proxy", False):
@@ -107,20 +111,24 @@ def _config_for_module_setup() -> Optional[dict]:
 
 _reaper_task: Optional[asyncio.Task] = None
 _reaper_stop: Optional[asyncio.Event] = None
+_sweeper_task: Optional[asyncio.Task] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Load configuration (if not already) and manage the reaper task.
+    """Load configuration (if not already) and manage the reaper and cache sweeper tasks.
 
     Middleware is installed at module import time, not here — Starlette
     locks the middleware stack once the lifespan starts, so any
     ``app.add_middleware`` call from this scope raises.
     """
-    global _reaper_task, _reaper_stop
+    global _reaper_task, _reaper_stop, _sweeper_task
 
     load_config()
     cfg = get_config()
+    configure_spool_budget(
+        int(cfg["host"].get("upload_memory_budget", DEFAULT_UPLOAD_MEMORY_BUDGET))
+    )
 
     delete_rule = cfg.get("delete", {})
     if delete_rule.get("enabled") and delete_rule.get("permanently"):
@@ -129,10 +137,15 @@ async def lifespan(app: FastAPI):
     else:
         _reaper_stop = None
         _reaper_task = None
+    sweeper_stop = asyncio.Event()
+    _sweeper_task = asyncio.create_task(cache.run_sweeper(sweeper_stop))
 
     try:
         yield
     finally:
+        sweeper_stop.set()
+        await _sweeper_task
+        _sweeper_task = None
         if _reaper_task is not None and _reaper_stop is not None:
             _reaper_stop.set()
             try:
@@ -154,6 +167,8 @@ if _module_cfg is not None:
 
 app.include_router(api.router)
 app.include_router(admin.router)
+# Before api_v1, whose /{fileid}/{filename} routes would shadow ours.
+app.include_router(uploads.router)
 app.include_router(api_v1.router)
 app.include_router(assets.router)
 app.include_router(root.router)
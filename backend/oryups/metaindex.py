@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+from json import dumps, loads
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_expires_at ON files (expires_at)
+    WHERE expires_at IS NOT NULL;
+"""
+
+
+class MetadataIndex:
+    """SQLite-backed index of every metadata sidecar under a local root.
+
+    The ``.metadata`` sidecars stay the source of truth; this index is a
+    derived copy that lets listing, expiry scans and lookups run as
+    indexed queries instead of walking the whole storage tree. It can
+    always be regenerated from the sidecars with :meth:`replace_all`.
+
+    Rows are stored as the private metadata dict (owner key included), so
+    callers must redact before handing entries to the wire.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def upsert(self, data: dict, expires_at: Optional[float]) -> None:
+        """Insert or replace the row for ``data["id"]``."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (id, name, created_at, expires_at, data) VALUES (?, ?, ?, ?, ?)",
+                _row(data, expires_at),
+            )
+
+    def remove(self, fileid: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE id = ?", (fileid,))
+
+    def get(self, fileid: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM files WHERE id = ?", (fileid,)).fetchone()
+        return loads(row[0]) if row else None
+
+    def all(self) -> list[dict]:
+        """Return every indexed entry, oldest upload first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM files ORDER BY created_at").fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def expiring(self) -> list[dict]:
+        """Return every entry with a retention deadline, soonest first.
+
+        Answered from the partial ``files_expires_at`` index, so files that
+        never expire are not read at all.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM files WHERE expires_at IS NOT NULL ORDER BY expires_at"
+            ).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0])
+
+    def replace_all(self, entries: Iterable[tuple[dict, Optional[float]]]) -> int:
+        """Atomically replace the whole index with ``entries``.
+
+        Args:
+            entries(Iterable[tuple[dict, float | None]]): ``(data, expires_at)``
+                pairs, typically produced by walking the sidecars.
+
+        Return:
+            count(int): Number of rows written.
+        """
+        rows = [_row(data, expires_at) for data, expires_at in entries]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM files")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (id, name, created_at, expires_at, data) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+
+def _row(data: dict, expires_at: Optional[float]) -> tuple:
+    return (
+        str(data["id"]),
+        str(data["name"]),
+        float(data.get("created_at", 0) or 0),
+        expires_at,
+        dumps(data, ensure_ascii=False),
+    )
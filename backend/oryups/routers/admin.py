@@ -421,3 +421,73 @@ async def get_admin_files(
             headers=_NO_STORE_HEADERS,
         )
     return _attach_no_store(make_response(200, "OK", data))
+
+
+@router.get(
+    "/stats",
+    responses={
+        200: {
+            "description": "Runtime counters for this worker process",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "success": {
+                            "summary": "Stats snapshot",
+                            "value": {
+                                "status": 200,
+                                "message": "OK",
+                                "data": {
+                                    "upload_spool": {
+                                        "limit": 268435456,
+                                        "used": 9437184,
+                                        "peak": 125829120,
+                                        "spills": 3,
+                                    },
+                                    "metadata_cache": {
+                                        "entries": 812,
+                                        "bytes": 660224,
+                                        "max_entries": 10000,
+                                        "max_bytes": 16777216,
+                                        "hits": 15230,
+                                        "stale_hits": 0,
+                                        "misses": 1904,
+                                        "evictions": 0,
+                                        "expirations": 1092,
+                                        "tombstones": 3,
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        401: {
+            "description": "Bearer missing, wrong, or expired",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "unauthorized": {
+                            "summary": "Re-login required",
+                            "value": {
+                                "status": 401,
+                                "message": "Unauthorized",
+                                "data": None,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
+async def get_admin_stats(
+    authorization: str = Header(default=""),
+) -> JSONResponse:
+    """Return runtime counters (upload spool memory usage, ...) for sizing.
+
+    Requires a valid bearer token issued by ``POST /api/v1/admin/login``.
+    Values are per worker process.
+    """
+    _verify_authorization(authorization)
+    return _attach_no_store(make_response(200, "OK", admin.collect_stats()))
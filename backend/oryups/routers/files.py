@@ -1,5 +1,9 @@
-import io
+import asyncio
+import os
+import re
 import secrets
+import threading
+from collections import deque
 from typing import AsyncIterator
 from urllib.parse import urlparse
 
@@ -17,8 +21,15 @@ from fastapi.responses import (
 from oryups.config import STATIC_DIR, get_config, get_storage
 from oryups.response import make_response
 from oryups.routers.admin import authorize_admin_optional
-from oryups.services import cache
-from oryups.utils.upload import buffer_request_body
+from oryups.services import cache, expiry_queue
+from oryups.utils.ranges import parse_range
+from oryups.utils.upload import (
+    SPOOL_THRESHOLD,
+    buffer_request_body,
+    check_declared_size,
+    reserve_backlog,
+    stream_request_body,
+)
 from oryups.utils.validation import (
     validate_fileid,
     validate_filename_for_read,
@@ -28,6 +39,8 @@ from oryups.utils.validation import (
 DEFAULT_MAX_UPLOAD_SIZE: int = 1 << 30
 GDRIVE_STREAM_CHUNK: int = 8 * 1024 * 1024
 
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
 # Mime types that browsers can render same-origin and that have been used as
 # reflected-XSS vectors when served from user uploads. We always downgrade
 # these on the download path.
@@ -96,27 +109,120 @@ def _resolve_base_url(request: Request, config: dict) -> str:
     return str(request.base_url)
 
 
-async def _stream_gdrive(storage, gfile_id: str) -> AsyncIterator[bytes]:
-    """Yield gdrive file bytes chunk-by-chunk without buffering the full payload."""
-    from googleapiclient.http import MediaIoBaseDownload
+async def _stream_gdrive(storage, gfile_id: str, start: int, stop: int) -> AsyncIterator[bytes]:
+    """Yield bytes ``start..stop`` of a gdrive file without buffering the payload.
+
+    Every chunk is its own ranged request on a pooled Drive client, and up
+    to ``storage.read_ahead`` of them are in flight at once, so Drive keeps
+    sending while earlier chunks are written to the client. Memory stays
+    bounded at ``read_ahead`` chunks per download.
+
+    When the client goes away, reads still waiting for a Drive slot are
+    dropped; ones already sent finish in the background and are discarded.
+    """
+    depth = max(1, storage.read_ahead)
+    cancelled = threading.Event()
+    pending: deque[asyncio.Future] = deque()
+    try:
+        for offset in range(start, stop, GDRIVE_STREAM_CHUNK):
+            end = min(offset + GDRIVE_STREAM_CHUNK, stop) - 1
+            pending.append(
+                asyncio.ensure_future(
+                    run_in_threadpool(storage.read_range, gfile_id, offset, end, cancelled=cancelled)
+                )
+            )
+            while len(pending) >= depth:
+                data = await pending.popleft()
+                if not data:
+                    return
+                yield data
+        while pending:
+            data = await pending.popleft()
+            if not data:
+                return
+            yield data
+    finally:
+        cancelled.set()
+        for future in pending:
+            future.cancel()
+
+
+async def _stream_gdrive_multipart(
+    storage, gfile_id: str, ranges: list[tuple[int, int]], parts: list[bytes], boundary: str
+) -> AsyncIterator[bytes]:
+    """Yield a ``multipart/byteranges`` body, one ranged Drive read per part."""
+    for (start, stop), part in zip(ranges, parts):
+        yield part
+        async for data in _stream_gdrive(storage, gfile_id, start, stop):
+            yield data
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode("latin-1")
+
+
+def _gdrive_range_response(
+    storage, metadata, ranges: list[tuple[int, int]], media_type: str, headers: dict[str, str]
+) -> StreamingResponse:
+    """206 response for ``ranges`` of a gdrive file, mapped onto Drive byte ranges."""
+    size = int(metadata.size)
+    gfile_id = metadata.optional_gfileID
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+        return StreamingResponse(
+            _stream_gdrive(storage, gfile_id, start, stop),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    boundary = secrets.token_hex(13)
+    parts = [
+        (
+            f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, stop in ranges
+    ]
+    length = sum(len(part) + (stop - start) + 2 for part, (start, stop) in zip(parts, ranges))
+    headers["Content-Length"] = str(length + len(boundary) + 6)
+    return StreamingResponse(
+        _stream_gdrive_multipart(storage, gfile_id, ranges, parts, boundary),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
 
-    request_obj = storage.service.files().get_media(fileId=gfile_id)
-    buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(buffer, request_obj, chunksize=GDRIVE_STREAM_CHUNK)
 
-    def _pull_chunk() -> tuple[bytes, bool]:
-        with storage._service_lock:
-            _, finished_now = downloader.next_chunk()
-        chunk = buffer.getvalue()
-        buffer.seek(0)
-        buffer.truncate()
-        return chunk, finished_now
+async def _tail_download(storage, gfile_id: str, fill) -> AsyncIterator[bytes]:
+    """Yield a download-cache fill's bytes as they land on disk.
 
-    finished = False
-    while not finished:
-        data, finished = await run_in_threadpool(_pull_chunk)
-        if data:
+    Every request for a file that is being fetched tails the same part
+    file, so concurrent first downloads share one Drive transfer.
+    """
+    offset = 0
+    try:
+        f = await run_in_threadpool(storage.downloads.open_fill, fill)
+    except FileNotFoundError:
+        # Discarded or evicted before this reader got to it.
+        async for data in _stream_gdrive(storage, gfile_id, 0, fill.size):
             yield data
+        return
+    try:
+        while offset < fill.size:
+            written, done, error = await run_in_threadpool(fill.wait, offset, 30.0)
+            if written > offset:
+                data = await run_in_threadpool(
+                    os.pread, f.fileno(), min(written - offset, GDRIVE_STREAM_CHUNK), offset
+                )
+                offset += len(data)
+                yield data
+            elif error is not None:
+                raise error
+            elif done:
+                break
+    finally:
+        f.close()
 
 
 async def _load_metadata(fileid: str, filename: str, *, bypass_expiry: bool = False):
@@ -126,13 +232,51 @@ async def _load_metadata(fileid: str, filename: str, *, bypass_expiry: bool = Fa
     )
 
 
+def _etag(metadata) -> str:
+    """Strong ETag derived from the upload's SHA-256, or "" when unknown."""
+    digest = getattr(metadata, "sha256", "")
+    return f'"{digest}"' if digest else ""
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Evaluate ``If-None-Match`` against ``etag`` (weak comparison, RFC 9110)."""
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
 async def _download_response(
     fileid: str,
     filename: str,
     *,
     bypass_expiry: bool = False,
+    if_none_match: str = "",
+    range_header: str = "",
+    if_range: str = "",
 ) -> Response:
-    """Build the file download response using the configured storage backend."""
+    """Build the file download response using the configured storage backend.
+
+    Files uploaded with a recorded SHA-256 carry it as a strong ``ETag``;
+    a matching ``If-None-Match`` is answered with 304 straight from the
+    (usually cached) metadata, before any file or Drive I/O.
+
+    ``FileResponse`` handles ``Range`` for files on local disk. For gdrive
+    bodies the requested ranges are fetched as Drive byte ranges and sent
+    as 206 (``multipart/byteranges`` for several); an ``If-Range`` that
+    does not equal the ETag gets the full body instead.
+    """
     config = get_config()
     validate_fileid(fileid, config["folderidlength"])
     validate_filename_for_read(filename)
@@ -143,12 +287,16 @@ async def _download_response(
         if storage.cache and storage.is_cached(fileid, filename):
             cached_path = storage.get_cached(fileid, filename)
             metadata = await _load_metadata(fileid, filename, bypass_expiry=bypass_expiry)
+            etag = _etag(metadata)
+            if _etag_matches(if_none_match, etag):
+                return _not_modified(etag)
             safe_mime = _safe_download_mime(metadata.mimeType)
             return FileResponse(
                 cached_path,
                 media_type=safe_mime,
                 filename=metadata.name,
                 content_disposition_type="attachment",
+                headers={"ETag": etag} if etag else None,
             )
 
         if config["host"]["cdn"]["enabled"]:
@@ -156,11 +304,14 @@ async def _download_response(
             return RedirectResponse(f"{cdn_url}/{fileid}/{filename}")
 
         metadata = await _load_metadata(fileid, filename, bypass_expiry=bypass_expiry)
+        etag = _etag(metadata)
+        if _etag_matches(if_none_match, etag):
+            return _not_modified(etag)
         storage_name = config["storage"]
         safe_mime = _safe_download_mime(metadata.mimeType)
 
         if storage_name == "local":
-            file_path = storage.root / fileid / filename
+            file_path = storage.folder_path(fileid) / filename
             if not file_path.is_file():
                 raise FileNotFoundError(f"{fileid}/{filename}")
             return FileResponse(
@@ -168,13 +319,46 @@ async def _download_response(
                 media_type=safe_mime,
                 filename=metadata.name,
                 content_disposition_type="attachment",
+                headers={"ETag": etag} if etag else None,
             )
 
         if storage_name == "gdrive":
+            headers = {"Content-Disposition": _content_disposition(metadata.name)}
+            if etag:
+                headers["ETag"] = etag
+            headers["Accept-Ranges"] = "bytes"
+            ranges = None
+            if range_header and (not if_range or (etag and if_range.strip() == etag)):
+                ranges = parse_range(range_header, int(metadata.size))
+            downloads = storage.downloads
+            gfile_id = metadata.optional_gfileID
+            if downloads is not None and downloads.cacheable(metadata.size):
+                cached_path = downloads.lookup(fileid)
+                if cached_path is not None:
+                    # FileResponse re-reads Range / If-Range from the request.
+                    return FileResponse(
+                        cached_path,
+                        media_type=safe_mime,
+                        filename=metadata.name,
+                        content_disposition_type="attachment",
+                        headers={"ETag": etag} if etag else None,
+                    )
+            if ranges is not None:
+                return _gdrive_range_response(storage, metadata, ranges, safe_mime, headers)
+            headers["Content-Length"] = str(metadata.size)
+            if downloads is not None and downloads.cacheable(metadata.size):
+                fill = downloads.fill(
+                    fileid,
+                    metadata.size,
+                    lambda start, end: storage.read_range(gfile_id, start, end),
+                    GDRIVE_STREAM_CHUNK,
+                    storage.read_ahead,
+                )
+                return StreamingResponse(_tail_download(storage, gfile_id, fill), media_type=safe_mime, headers=headers)
             return StreamingResponse(
-                _stream_gdrive(storage, metadata.optional_gfileID),
+                _stream_gdrive(storage, gfile_id, 0, int(metadata.size)),
                 media_type=safe_mime,
-                headers={"Content-Disposition": _content_disposition(metadata.name)},
+                headers=headers,
             )
 
         raise HTTPException(status_code=500, detail="Unknown storage backend")
@@ -187,7 +371,9 @@ async def _download_response(
 async def download_direct(
     fileid: str,
     filename: str,
+    request: Request,
     authorization: str = Header(default=""),
+    if_none_match: str = Header(default=""),
 ) -> Response:
     """Direct file download endpoint.
 
@@ -195,7 +381,37 @@ async def download_direct(
     operators download a file even after its retention window has passed.
     """
     bypass = authorize_admin_optional(authorization)
-    return await _download_response(fileid, filename, bypass_expiry=bypass)
+    return await _download_response(
+        fileid,
+        filename,
+        bypass_expiry=bypass,
+        if_none_match=if_none_match,
+        range_header=request.headers.get("range", ""),
+        if_range=request.headers.get("if-range", ""),
+    )
+
+
+async def _stream_upload(storage, request: Request, filename: str, digest: str, max_size: int):
+    """Forward a PUT body to the backend while it arrives (``storage.streams_uploads``).
+
+    The body is never spooled; a digest mismatch or a failed transfer
+    cancels the backend upload before anything is committed.
+    """
+    # Reject an oversized declared body before creating anything on Drive.
+    check_declared_size(request, max_size)
+    upload = await run_in_threadpool(storage.open_stream, filename)
+    try:
+        await stream_request_body(
+            request,
+            lambda data: run_in_threadpool(upload.write, bytes(data)),
+            max_size=max_size,
+        )
+        if digest and upload.sha256() != digest:
+            raise HTTPException(status_code=400, detail="Body does not match X-Content-SHA256")
+        return await run_in_threadpool(storage.finish_stream, upload)
+    except BaseException:
+        await run_in_threadpool(storage.abort_stream, upload)
+        raise
 
 
 @router.put("/{filename:path}")
@@ -206,22 +422,67 @@ async def upload(filename: str, request: Request) -> PlainTextResponse:
     response header so any client (curl, browser, scripts) can capture it
     at upload time and use it later to issue authenticated ``DELETE``
     requests. The header is never emitted from any other endpoint.
+
+    Hash-first mode: a client may send the body's hex SHA-256 in
+    ``X-Content-SHA256``. When hash-first is enabled (``local.hash_first``)
+    and the backend already stores that content, the share URL is returned
+    without reading the body, so a client using ``Expect: 100-continue``
+    never uploads it. Otherwise
+    the body is read as usual and must match the digest.
+
+    On gdrive without the local cache the body is not spooled: it is
+    forwarded to a Drive resumable upload chunk by chunk as it arrives.
     """
     validate_filename_for_write(filename)
 
     config = get_config()
     max_size = int(config["host"].get("max_upload_size", DEFAULT_MAX_UPLOAD_SIZE))
 
-    tmp, size = await buffer_request_body(request, max_size=max_size)
-
     storage = get_storage()
-    try:
-        metadata = await run_in_threadpool(storage.save, tmp, size, filename)
-    finally:
-        tmp.close()
+    digest = request.headers.get("x-content-sha256", "").strip().lower()
+    if digest and not _SHA256_HEX.fullmatch(digest):
+        raise HTTPException(status_code=400, detail="Invalid X-Content-SHA256")
+
+    metadata = None
+    if digest:
+        metadata = await run_in_threadpool(storage.save_by_digest, digest, filename)
+
+    if metadata is None and storage.streams_uploads:
+        metadata = await _stream_upload(storage, request, filename, digest, max_size)
+
+    if metadata is None:
+        # Claim backlog room from the declared size before anything is
+        # spooled; without a Content-Length it is claimed once the size is
+        # known.
+        declared = check_declared_size(request, max_size)
+        reserved = reserve_backlog(storage, declared) if declared is not None else 0
+        try:
+            tmp, size = await buffer_request_body(
+                request,
+                max_size=max_size,
+                spool_dir=storage.staging_dir(),
+                max_memory=int(config["host"].get("upload_spool_max", SPOOL_THRESHOLD)),
+            )
+
+            try:
+                if size != reserved:
+                    storage.release_upload(reserved)
+                    reserved = 0
+                    reserved = reserve_backlog(storage, size)
+                if digest and tmp.sha256() != digest:
+                    raise HTTPException(status_code=400, detail="Body does not match X-Content-SHA256")
+                metadata = await run_in_threadpool(
+                    storage.save, tmp, size, filename, sha256=tmp.sha256()
+                )
+            finally:
+                tmp.close()
+        except BaseException:
+            storage.release_upload(reserved)
+            raise
 
     owner_key = metadata.delete
     cache.store_cache(metadata)
+    expiry_queue.schedule(metadata)
 
     base_url = _resolve_base_url(request, config)
     host = urlparse(base_url).hostname
@@ -252,7 +513,14 @@ async def share_page(
     bypass = authorize_admin_optional(authorization)
 
     if _is_curl_ua(request):
-        return await _download_response(fileid, filename, bypass_expiry=bypass)
+        return await _download_response(
+            fileid,
+            filename,
+            bypass_expiry=bypass,
+            if_none_match=request.headers.get("if-none-match", ""),
+            range_header=request.headers.get("range", ""),
+            if_range=request.headers.get("if-range", ""),
+        )
 
     validate_fileid(fileid, config["folderidlength"])
     validate_filename_for_read(filename)
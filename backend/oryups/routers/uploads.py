@@ -0,0 +1,379 @@
+import fcntl
+import os
+from pathlib import Path
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
+
+from oryups.config import get_config, get_storage
+from oryups.response import make_response
+from oryups.routers.files import DEFAULT_MAX_UPLOAD_SIZE, _resolve_base_url
+from oryups.services import cache, expiry_queue, uploads
+from oryups.utils.upload import UploadSpool, receive_body, reserve_backlog
+from oryups.utils.validation import validate_filename_for_write
+
+router = APIRouter(prefix="/api/v1/uploads", tags=["Uploads"])
+
+
+class CreateUploadRequest(BaseModel):
+    """Request body for ``POST /api/v1/uploads``.
+
+    Args:
+        filename(str): Name the finished file is stored under.
+        length(int): Total body size in bytes, known up front.
+    """
+
+    filename: str
+    length: int = Field(..., ge=0)
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {"filename": "backup.tar.gz", "length": 5368709120},
+            ],
+        },
+    }
+
+
+def _session_ttl() -> int:
+    """Read ``host.upload_session_ttl`` from config, defaulting to one day."""
+    try:
+        return int(get_config()["host"].get("upload_session_ttl", uploads.DEFAULT_SESSION_TTL))
+    except (TypeError, ValueError):
+        return uploads.DEFAULT_SESSION_TTL
+
+
+def _sessions_root() -> Path:
+    return uploads.sessions_root(get_storage().staging_dir())
+
+
+async def _load_session(session_id: str) -> uploads.UploadSession:
+    try:
+        return await run_in_threadpool(uploads.load, _sessions_root(), session_id, _session_ttl())
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not Found!")
+
+
+def _lock_part(session: uploads.UploadSession):
+    """Open the part file holding an exclusive lock, or raise 409.
+
+    The lock is shared across worker processes, so two clients can never
+    append to (or finalize) the same session at once.
+    """
+    try:
+        part = session.part_path.open("r+b")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not Found!")
+    try:
+        fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        part.close()
+        raise HTTPException(status_code=409, detail="Upload is busy")
+    return part
+
+
+def _offset_headers(session: uploads.UploadSession, offset: int) -> dict[str, str]:
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(session.length),
+        "Cache-Control": "no-store",
+    }
+
+
+@router.post(
+    "",
+    status_code=201,
+    responses={
+        201: {
+            "description": "Upload session created",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "created": {
+                            "summary": "Empty session",
+                            "value": {
+                                "status": 201,
+                                "message": "Created",
+                                "data": {
+                                    "id": "dGhpcyBpcyBhbiBleGFtcGw",
+                                    "name": "backup.tar.gz",
+                                    "offset": 0,
+                                    "length": 5368709120,
+                                    "expires_at": 1735776000.0,
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        413: {
+            "description": "Declared length exceeds host.max_upload_size",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "too_large": {
+                            "summary": "Too large",
+                            "value": {
+                                "status": 413,
+                                "message": "Payload Too Large",
+                                "data": None,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
+async def create_upload(body: CreateUploadRequest) -> JSONResponse:
+    """Open a resumable upload session.
+
+    The returned ``id`` (also in ``Location``) is the only credential for
+    the session. Sessions idle for longer than ``host.upload_session_ttl``
+    seconds are discarded along with their staged bytes.
+    """
+    validate_filename_for_write(body.filename)
+    config = get_config()
+    max_size = int(config["host"].get("max_upload_size", DEFAULT_MAX_UPLOAD_SIZE))
+    if body.length > max_size:
+        raise HTTPException(status_code=413, detail="Payload Too Large")
+
+    root = _sessions_root()
+    ttl = _session_ttl()
+    await run_in_threadpool(uploads.sweep, root, ttl)
+    session = await run_in_threadpool(uploads.create, root, body.filename, body.length)
+
+    response = make_response(201, "Created", session.to_dict(ttl))
+    response.headers["Location"] = f"{router.prefix}/{session.id}"
+    return response
+
+
+@router.head("/{session_id}")
+async def get_upload_offset(session_id: str) -> Response:
+    """Report how many bytes the server holds, in ``Upload-Offset``."""
+    session = await _load_session(session_id)
+    return Response(status_code=200, headers=_offset_headers(session, session.offset))
+
+
+@router.patch(
+    "/{session_id}",
+    responses={
+        200: {
+            "description": "Chunk appended",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "appended": {
+                            "summary": "Offset advanced",
+                            "value": {
+                                "status": 200,
+                                "message": "OK",
+                                "data": {
+                                    "id": "dGhpcyBpcyBhbiBleGFtcGw",
+                                    "name": "backup.tar.gz",
+                                    "offset": 104857600,
+                                    "length": 5368709120,
+                                    "expires_at": 1735776000.0,
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        409: {
+            "description": "Upload-Offset does not match, or another request holds the session",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "offset_mismatch": {
+                            "summary": "Stale offset",
+                            "value": {
+                                "status": 409,
+                                "message": "Upload-Offset mismatch",
+                                "data": None,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
+async def append_upload(
+    session_id: str,
+    request: Request,
+    upload_offset: str = Header(default=""),
+) -> JSONResponse:
+    """Append the raw request body at ``Upload-Offset``.
+
+    The offset must equal the number of bytes already stored; a client
+    that lost track asks with ``HEAD`` first. Whatever arrived before a
+    dropped connection is kept, so the next ``PATCH`` resumes from there.
+    """
+    session = await _load_session(session_id)
+    try:
+        offset = int(upload_offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Upload-Offset")
+
+    part = _lock_part(session)
+    try:
+        current = os.fstat(part.fileno()).st_size
+        if offset != current:
+            raise HTTPException(
+                status_code=409,
+                detail="Upload-Offset mismatch",
+                headers=_offset_headers(session, current),
+            )
+        part.seek(current)
+        hasher = uploads.hasher_for(session, current)
+
+        def write(chunk) -> None:
+            part.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+
+        try:
+            await receive_body(request, write, max_size=session.length - current)
+        finally:
+            part.flush()
+            current = part.tell()
+            if hasher is not None:
+                uploads.record_hash(session, current, hasher)
+            session.touch()
+    finally:
+        part.close()
+
+    response = make_response(200, "OK", session.to_dict(_session_ttl()))
+    response.headers.update(_offset_headers(session, current))
+    return response
+
+
+@router.post(
+    "/{session_id}/finalize",
+    responses={
+        200: {
+            "description": "File stored; same result as a single PUT upload",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "stored": {
+                            "summary": "Share URL",
+                            "value": {
+                                "status": 200,
+                                "message": "OK",
+                                "data": {
+                                    "url": "https://upload.example.com/a1B2c3/backup.tar.gz",
+                                    "id": "a1B2c3",
+                                    "name": "backup.tar.gz",
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        409: {
+            "description": "Not every byte has been received yet",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "incomplete": {
+                            "summary": "Upload incomplete",
+                            "value": {
+                                "status": 409,
+                                "message": "Upload incomplete",
+                                "data": None,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        503: {
+            "description": "The storage backend's upload backlog is full; retry after ``Retry-After`` seconds",
+            "content": {
+                "application/json": {
+                    "examples": {
+                        "backlog_full": {
+                            "summary": "Upload backlog full",
+                            "value": {
+                                "status": 503,
+                                "message": "Upload backlog is full",
+                                "data": None,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
+async def finalize_upload(session_id: str, request: Request) -> JSONResponse:
+    """Store the completed body and return its share URL.
+
+    Goes through ``storage.save`` exactly like ``PUT /{filename}``; the
+    owner key comes back in ``X-Owner-Key``.
+    """
+    session = await _load_session(session_id)
+    part = _lock_part(session)
+    try:
+        offset = os.fstat(part.fileno()).st_size
+        if offset != session.length:
+            raise HTTPException(
+                status_code=409,
+                detail="Upload incomplete",
+                headers=_offset_headers(session, offset),
+            )
+        storage = get_storage()
+        reserve_backlog(storage, offset)
+        try:
+            spool = await run_in_threadpool(
+                UploadSpool.adopt, session.part_path, uploads.hasher_for(session, offset)
+            )
+        except BaseException:
+            storage.release_upload(offset)
+            raise
+        try:
+            metadata = await run_in_threadpool(
+                storage.save, spool, offset, session.filename, sha256=spool.sha256()
+            )
+        except BaseException:
+            # Leave the part file and session in place so finalize can be
+            # retried once the backend recovers.
+            storage.release_upload(offset)
+            spool.close(keep=True)
+            raise
+        spool.close()
+    finally:
+        part.close()
+    await run_in_threadpool(uploads.discard, session)
+
+    cache.store_cache(metadata)
+    expiry_queue.schedule(metadata)
+
+    base_url = _resolve_base_url(request, get_config())
+    response = make_response(200, "OK", {
+        "url": f"{base_url}{metadata.id}/{metadata.name}",
+        "id": metadata.id,
+        "name": metadata.name,
+    })
+    if metadata.delete:
+        response.headers["X-Owner-Key"] = metadata.delete
+    return response
+
+
+@router.delete("/{session_id}")
+async def abort_upload(session_id: str) -> JSONResponse:
+    """Abandon a session and drop its staged bytes."""
+    session = await _load_session(session_id)
+    part = _lock_part(session)
+    try:
+        await run_in_threadpool(uploads.discard, session)
+    finally:
+        part.close()
+    return make_response(200, "Deleted")
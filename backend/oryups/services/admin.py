@@ -1,12 +1,12 @@
 import logging
 import math
-from pathlib import Path
 from typing import Optional
 
 from oryups.config import get_config, get_storage
 from oryups.filesystem import Metadata, gdrive as GDriveStorage, local as LocalStorage
-from oryups.services import cache
+from oryups.services import cache, expiry_queue
 from oryups.utils.expiry import NEVER_EXPIRES_SENTINEL, is_expired
+from oryups.utils.upload import spool_budget
 
 
 logger = logging.getLogger("oryups.admin")
@@ -54,11 +54,12 @@ def list_all_files() -> dict[str, list[dict]]:
 
 
 def list_local_entries(storage: LocalStorage) -> list[Metadata]:
-    """Iterate the local storage root and yield Metadata for every file folder.
+    """Return Metadata for every file folder held by the local backend.
 
-    Skips the ``delete`` soft-delete bucket and any name that begins with a
-    dot (covers ``.tombstones``). Folders without a ``*.metadata`` sidecar
-    are treated as not-yet-finalized uploads and ignored.
+    Delegates to :meth:`LocalStorage.list_metadata`, which answers from the
+    SQLite index when ``local.index`` is enabled and otherwise walks the
+    storage root (skipping the ``delete`` bucket, dot-folders such as
+    ``.tombstones``, and folders without a ``*.metadata`` sidecar).
 
     Args:
         storage(LocalStorage): The configured local storage backend.
@@ -66,40 +67,15 @@ def list_local_entries(storage: LocalStorage) -> list[Metadata]:
     Return:
         entries(list[Metadata]): Loaded metadata, one per file folder.
     """
-    try:
-        folders = list(storage.root.iterdir())
-    except FileNotFoundError:
-        # The storage root has not been materialized yet (no uploads have
-        # happened on this fresh deployment). That's a legitimate "empty"
-        # state, not a failure, so we keep the bucket empty rather than
-        # surfacing 500 to the operator.
-        return []
-
-    entries: list[Metadata] = []
-    for folder in folders:
-        if not folder.is_dir():
-            continue
-        if folder.name == "delete" or folder.name.startswith("."):
-            continue
-        metadata_path = _find_metadata_path(folder)
-        if metadata_path is None:
-            continue
-        try:
-            metadata = Metadata()
-            metadata.load(dataPath=metadata_path)
-        except Exception as exc:
-            logger.warning("Failed to load %s: %r", metadata_path, exc)
-            continue
-        entries.append(metadata)
-    return entries
+    return storage.list_metadata()
 
 
 def list_gdrive_entries(storage: GDriveStorage) -> list[Metadata]:
     """Iterate the gdrive storage root and yield Metadata for every file folder.
 
-    Mirrors :func:`oryups.services.reaper._reap_gdrive`: list root subfolders,
-    list each subfolder's contents, locate the non-``.metadata`` filename,
-    then load metadata.
+    Folders and their children come from one bulk listing
+    (:meth:`GDriveStorage.list_folders`), so the only per-file request left
+    is the sidecar download inside ``load_metadata``.
 
     Args:
         storage(GDriveStorage): The configured gdrive storage backend.
@@ -107,20 +83,8 @@ def list_gdrive_entries(storage: GDriveStorage) -> list[Metadata]:
     Return:
         entries(list[Metadata]): Loaded metadata, one per file folder.
     """
-    root_list = storage.get_list(
-        dir=storage.root,
-        mimeType="application/vnd.google-apps.folder",
-    )
-
     entries: list[Metadata] = []
-    for fileid, folderid in root_list.items():
-        if fileid == "delete":
-            continue
-        try:
-            files = storage.get_list(dir=folderid)
-        except Exception as exc:
-            logger.warning("gdrive list %s failed: %r", fileid, exc)
-            continue
+    for fileid, (_, files) in storage.list_folders().items():
         filename = next((n for n in files if not n.endswith(".metadata")), None)
         if not filename:
             continue
@@ -157,15 +121,28 @@ def classify_metadata(metadata: Metadata, delete_rule: dict) -> dict:
     return base
 
 
-def _find_metadata_path(folder: Path) -> Optional[Path]:
-    """Return the first ``*.metadata`` file in ``folder`` or None."""
-    try:
-        for entry in folder.iterdir():
-            if entry.is_file() and entry.name.endswith(".metadata"):
-                return entry
-    except FileNotFoundError:
-        return None
-    return None
+def collect_stats() -> dict:
+    """Snapshot runtime counters useful for sizing workers.
+
+    Return:
+        stats(dict): ``{"upload_spool": {...}, "metadata_cache": {...}}``
+        where ``upload_spool`` is the process-wide in-memory spool budget
+        (limit, used, peak, spills) and ``metadata_cache`` the metadata LRU
+        (entries, bytes, limits, hits, stale_hits, misses, evictions,
+        expirations, tombstones, negative entries and hits).
+        With a cached gdrive backend, ``gdrive_upload_queue`` reports the
+        Drive upload backlog (queued, pending_bytes, max_bytes), and
+        ``gdrive_download_cache`` the LRU download cache (entries, bytes,
+        max_bytes, hits, misses, filling) when it is enabled.
+        Counters are per worker process.
+    """
+    stats = {"upload_spool": spool_budget().snapshot(), "metadata_cache": cache.stats()}
+    storage = get_storage()
+    if isinstance(storage, GDriveStorage) and storage.cache:
+        stats["gdrive_upload_queue"] = storage.cachequeue.snapshot()
+    if isinstance(storage, GDriveStorage) and storage.downloads is not None:
+        stats["gdrive_download_cache"] = storage.downloads.snapshot()
+    return stats
 
 
 def update_file_expiry(fileid: str, filename: str, delete_after: float) -> Metadata:
@@ -199,5 +176,6 @@ def update_file_expiry(fileid: str, filename: str, delete_after: float) -> Metad
     metadata = storage.load_metadata(fileid, filename)
     metadata.delete_after = float(delete_after)
     storage.update_metadata(metadata)
-    cache.invalidate(fileid)
+    cache.update_cache(metadata)
+    expiry_queue.schedule(metadata)
     return metadata
@@ -1,17 +1,119 @@
+import asyncio
 import copy
 import threading
 import time
+from collections import OrderedDict
 from typing import Optional
 
 from oryups.config import get_config, get_storage
 from oryups.filesystem import Metadata
 from oryups.utils.expiry import is_expired
 
-_cache: dict[str, dict] = {}
-_tombstones: dict[str, float] = {}
+DEFAULT_CACHE_MAX_ENTRIES: int = 10000
+DEFAULT_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+DEFAULT_CACHE_SWEEP_INTERVAL: float = 60.0
+DEFAULT_NEGATIVE_CACHETIME: float = 30.0
+DEFAULT_NEGATIVE_MAX_ENTRIES: int = 10000
+# Distinct missing filenames remembered per fileid.
+_NEGATIVE_NAMES_PER_ID: int = 8
+# Rough per-entry cost of the dict, Metadata object and key on top of
+# the serialized fields.
+_ENTRY_OVERHEAD: int = 512
+
+
+class _MetadataLRU:
+    """Size-bounded LRU of cache entries. Callers must hold ``_cache_lock``.
+
+    ``_entries`` is kept in recency order, so evicting the least recently
+    used entry is O(1). ``_stored`` is kept in store order; every entry
+    lives for the same ``host.cachetime``, so a TTL sweep only walks the
+    expired prefix.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._stored: OrderedDict[str, int] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, fileid: str) -> bool:
+        return fileid in self._entries
+
+    def peek(self, fileid: str) -> Optional[dict]:
+        """Return an entry without marking it recently used."""
+        return self._entries.get(fileid)
+
+    def get(self, fileid: str) -> Optional[dict]:
+        entry = self._entries.get(fileid)
+        if entry is not None:
+            self._entries.move_to_end(fileid)
+        return entry
+
+    def put(self, fileid: str, entry: dict, max_entries: int, max_bytes: int) -> None:
+        self.pop(fileid)
+        self._entries[fileid] = entry
+        self._stored[fileid] = entry["time"]
+        self.bytes += entry["size"]
+        while self._entries and (len(self._entries) > max_entries or self.bytes > max_bytes):
+            self.pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, fileid: str) -> Optional[dict]:
+        entry = self._entries.pop(fileid, None)
+        if entry is not None:
+            self._stored.pop(fileid, None)
+            self.bytes -= entry["size"]
+        return entry
+
+    def sweep(self, stored_before: float) -> int:
+        """Drop entries stored at or before ``stored_before``; returns the count."""
+        expired = 0
+        while self._stored:
+            fileid, stored = next(iter(self._stored.items()))
+            if stored > stored_before:
+                break
+            self.pop(fileid)
+            expired += 1
+        self.expirations += expired
+        return expired
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        self._entries.clear()
+        self._stored.clear()
+        self.bytes = 0
+        self.hits = self.stale_hits = self.misses = self.evictions = self.expirations = 0
+
+
+_cache = _MetadataLRU()
+_tombstones: OrderedDict[str, float] = OrderedDict()
+# fileid → (deadline, filenames recently answered with 404), oldest first.
+_negative: OrderedDict[str, tuple[float, set[str]]] = OrderedDict()
+_negative_hits: int = 0
+# Bumped by every cache write; entries and storage reads carry the value
+# they saw, so a read that started before a newer write cannot replace it.
+_version: int = 0
+# fileid → filename → storage read that concurrent misses wait on.
+_inflight: dict[str, dict[str, "_Flight"]] = {}
 _cache_lock: threading.Lock = threading.Lock()
 
 
+class _Flight:
+    """One in-progress storage read shared by every concurrent miss for its key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.metadata: Optional[Metadata] = None
+        self.error: Optional[BaseException] = None
+
+
 def _tombstone_ttl() -> int:
     """How long an invalidated fileid blocks new cache stores.
 
@@ -23,10 +125,106 @@ def _tombstone_ttl() -> int:
 
 
 def _prune_tombstones_locked(now: float) -> None:
-    """Drop expired tombstone entries. Caller must hold ``_cache_lock``."""
-    expired = [fileid for fileid, deadline in _tombstones.items() if deadline <= now]
-    for fileid in expired:
-        _tombstones.pop(fileid, None)
+    """Drop expired tombstone entries. Caller must hold ``_cache_lock``.
+
+    Tombstones are kept in deadline order (all share one TTL), so only
+    the expired prefix is visited.
+    """
+    while _tombstones:
+        fileid, deadline = next(iter(_tombstones.items()))
+        if deadline > now:
+            break
+        del _tombstones[fileid]
+
+
+def _prune_negative_locked(now: float) -> None:
+    """Drop expired negative entries. Caller must hold ``_cache_lock``."""
+    while _negative:
+        fileid, (deadline, _) = next(iter(_negative.items()))
+        if deadline > now:
+            break
+        del _negative[fileid]
+
+
+def _known_missing(fileid: str, filename: str) -> bool:
+    """True when (fileid, filename) answered 404 within ``host.negative_cachetime``."""
+    global _negative_hits
+    now = time.time()
+    with _cache_lock:
+        _prune_negative_locked(now)
+        entry = _negative.get(fileid)
+        if entry is None or filename not in entry[1]:
+            return False
+        _negative_hits += 1
+        return True
+
+
+def _remember_missing(fileid: str, filename: str) -> None:
+    """Record a 404 so repeats skip storage for ``host.negative_cachetime``.
+
+    Skipped when the fileid has a positive entry: an upload stored it
+    while this read was still looking, and its 404 is already stale.
+    """
+    host = get_config()["host"]
+    ttl = float(host.get("negative_cachetime", DEFAULT_NEGATIVE_CACHETIME))
+    if ttl <= 0:
+        return
+    max_entries = int(host.get("negative_cache_max_entries", DEFAULT_NEGATIVE_MAX_ENTRIES))
+    now = time.time()
+    with _cache_lock:
+        _prune_negative_locked(now)
+        if fileid in _cache:
+            return
+        entry = _negative.get(fileid)
+        if entry is None:
+            entry = _negative[fileid] = (now + ttl, set())
+        if len(entry[1]) < _NEGATIVE_NAMES_PER_ID:
+            entry[1].add(filename)
+        while len(_negative) > max_entries:
+            _negative.popitem(last=False)
+
+
+def _load_from_storage(fileid: str, filename: str) -> Metadata:
+    """Read metadata from storage, coalescing concurrent misses for one key.
+
+    The first miss for (fileid, filename) performs the read and caches the
+    result through :func:`store_cache`, so tombstones apply as usual; the
+    misses that arrive while it runs wait for it and share its result or
+    error. ``invalidate`` detaches the fileid's reads, so requests after a
+    DELETE never join a read that started before it.
+    """
+    with _cache_lock:
+        flights = _inflight.setdefault(fileid, {})
+        flight = flights.get(filename)
+        leader = flight is None
+        if leader:
+            flight = flights[filename] = _Flight()
+        version = _version
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return _redacted_copy(flight.metadata)
+
+    try:
+        metadata = get_storage().load_metadata(fileid, filename)
+        store_cache(metadata, read_version=version)
+        flight.metadata = _redacted_copy(metadata)
+        return _redacted_copy(metadata)
+    except BaseException as exc:
+        if isinstance(exc, FileNotFoundError):
+            _remember_missing(fileid, filename)
+        flight.error = exc
+        raise
+    finally:
+        with _cache_lock:
+            flights = _inflight.get(fileid)
+            if flights is not None and flights.get(filename) is flight:
+                del flights[filename]
+                if not flights:
+                    del _inflight[fileid]
+        flight.done.set()
 
 
 def _redacted_copy(metadata: Metadata) -> Metadata:
@@ -42,23 +240,95 @@ def _redacted_copy(metadata: Metadata) -> Metadata:
     return redacted
 
 
-def store_cache(metadata: Metadata) -> None:
+def store_cache(metadata: Metadata, read_version: Optional[int] = None) -> None:
     """Cache a redacted copy of metadata keyed by file id.
 
     Skips the store entirely when the fileid is currently tombstoned —
     that means a concurrent ``invalidate`` (typically a DELETE) ran
     between the storage read and this commit, and accepting the entry
     would poison the cache with metadata for an already-removed file.
+
+    ``read_version`` is the cache version seen when the storage read that
+    produced ``metadata`` began; the store is skipped if the cached entry
+    was written after that (see :func:`update_cache`). Omit it for
+    metadata that is itself the newest, e.g. a fresh upload.
+
+    The cache holds at most ``host.cache_max_entries`` entries and about
+    ``host.cache_max_bytes`` bytes; the least recently used entries are
+    evicted to make room.
+    """
+    _write_entry(metadata, read_version)
+
+
+def update_cache(metadata: Metadata) -> None:
+    """Write mutated metadata through to the cache after storage persisted it.
+
+    Replaces the cached entry in one step instead of invalidating it, so
+    reads stay served from the cache, and no tombstone is left behind —
+    those are for deletions. Storage reads still running from before the
+    update cannot overwrite it, and later requests do not join them.
     """
+    with _cache_lock:
+        _inflight.pop(metadata.id, None)
+    _write_entry(metadata, None)
+
+
+def _write_entry(metadata: Metadata, read_version: Optional[int]) -> None:
+    global _version
+    host = get_config()["host"]
+    max_entries = int(host.get("cache_max_entries", DEFAULT_CACHE_MAX_ENTRIES))
+    max_bytes = int(host.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES))
+    redacted = _redacted_copy(metadata)
+    size = len(redacted.to_json()) + _ENTRY_OVERHEAD
     now = time.time()
     with _cache_lock:
         _prune_tombstones_locked(now)
+        _negative.pop(metadata.id, None)
         if metadata.id in _tombstones:
             return
-        _cache[metadata.id] = {
-            "time": int(now),
-            "metadata": _redacted_copy(metadata),
-        }
+        current = _cache.peek(metadata.id)
+        if read_version is not None and current is not None and current["version"] > read_version:
+            return
+        _version += 1
+        _cache.put(
+            metadata.id,
+            {"time": int(now), "size": size, "version": _version, "metadata": redacted},
+            max_entries,
+            max_bytes,
+        )
+
+
+def _stale_window() -> float:
+    """Seconds past ``host.cachetime`` an entry may still be served while it refreshes."""
+    return float(get_config()["host"].get("cache_stale_while_revalidate", 0))
+
+
+def _lookup(fileid: str, filename: str, allow_stale: bool) -> tuple[Optional[Metadata], bool]:
+    """Return ``(metadata, stale)`` for a cached entry, or ``(None, False)`` on a miss.
+
+    Entries older than ``host.cachetime`` are stale; they are returned only
+    with ``allow_stale`` and within the stale-while-revalidate window, and
+    evicted once past it.
+    """
+    cachetime = get_config()["host"]["cachetime"]
+    window = _stale_window()
+    now = int(time.time())
+    with _cache_lock:
+        entry = _cache.get(fileid)
+        if entry is None or entry["metadata"].name != filename:
+            _cache.misses += 1
+            return None, False
+        if entry["time"] + cachetime > now:
+            _cache.hits += 1
+            return entry["metadata"], False
+        if entry["time"] + cachetime + window <= now:
+            _cache.pop(fileid)
+            _cache.expirations += 1
+        elif allow_stale:
+            _cache.stale_hits += 1
+            return entry["metadata"], True
+        _cache.misses += 1
+        return None, False
 
 
 def get_cache(fileid: str, filename: str) -> Optional[Metadata]:
@@ -71,30 +341,77 @@ def get_cache(fileid: str, filename: str) -> Optional[Metadata]:
     Return:
         metadata(Metadata | None): Cached metadata or None on miss/expiry.
     """
-    cachetime = get_config()["host"]["cachetime"]
-    now = int(time.time())
+    return _lookup(fileid, filename, allow_stale=False)[0]
+
+
+def _revalidate(fileid: str, filename: str) -> None:
+    """Refresh a stale entry in the background unless a read is already running."""
     with _cache_lock:
-        entry = _cache.get(fileid)
-        if entry is None:
-            return None
-        if entry["metadata"].name != filename:
-            return None
-        if entry["time"] + cachetime <= now:
-            _cache.pop(fileid, None)
-            return None
-        return entry["metadata"]
+        if filename in _inflight.get(fileid, {}):
+            return
+    threading.Thread(target=_refresh, args=(fileid, filename), daemon=True).start()
+
+
+def _refresh(fileid: str, filename: str) -> None:
+    try:
+        _load_from_storage(fileid, filename)
+    except FileNotFoundError:
+        # Gone from storage: stop serving the stale copy.
+        with _cache_lock:
+            _cache.pop(fileid)
+    except Exception as exc:
+        print(f"[cache] refresh of {fileid} failed: {exc!r}")
 
 
 def clear_cache() -> None:
-    """Evict all expired cache entries and tombstones."""
+    """Evict all expired cache entries, tombstones and negative entries."""
     cachetime = get_config()["host"]["cachetime"]
     now = time.time()
     with _cache_lock:
-        for fileid in list(_cache.keys()):
-            entry = _cache.get(fileid)
-            if entry is not None and entry["time"] + cachetime < now:
-                _cache.pop(fileid, None)
+        _cache.sweep(now - cachetime - _stale_window())
         _prune_tombstones_locked(now)
+        _prune_negative_locked(now)
+
+
+def stats() -> dict:
+    """Snapshot the metadata cache size and hit/miss/eviction counters."""
+    host = get_config()["host"]
+    with _cache_lock:
+        return {
+            "entries": len(_cache),
+            "bytes": _cache.bytes,
+            "max_entries": int(host.get("cache_max_entries", DEFAULT_CACHE_MAX_ENTRIES)),
+            "max_bytes": int(host.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES)),
+            "hits": _cache.hits,
+            "stale_hits": _cache.stale_hits,
+            "misses": _cache.misses,
+            "evictions": _cache.evictions,
+            "expirations": _cache.expirations,
+            "tombstones": len(_tombstones),
+            "negative_entries": len(_negative),
+            "negative_hits": _negative_hits,
+        }
+
+
+async def run_sweeper(stop_event: asyncio.Event) -> None:
+    """Sweep expired entries and tombstones until ``stop_event`` is set.
+
+    Runs :func:`clear_cache` every ``host.cache_sweep_interval`` seconds, so
+    entries for files nobody asks for again do not linger until the next
+    ``/api/v1/clearcache``.
+    """
+    while not stop_event.is_set():
+        try:
+            interval = float(get_config()["host"].get("cache_sweep_interval", DEFAULT_CACHE_SWEEP_INTERVAL))
+        except RuntimeError:
+            interval = DEFAULT_CACHE_SWEEP_INTERVAL
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(1.0, interval))
+        except asyncio.TimeoutError:
+            try:
+                clear_cache()
+            except Exception as exc:
+                print(f"[cache] sweep failed: {exc!r}")
 
 
 def invalidate(fileid: str) -> None:
@@ -103,14 +420,24 @@ def invalidate(fileid: str) -> None:
     The tombstone blocks concurrent readers (whose storage I/O began
     before this call) from later writing a stale cache entry. The
     tombstone TTL matches ``host.cachetime`` so any in-flight read is
-    safely contained.
+    safely contained. Such reads are also detached from single-flight
+    coalescing, so later requests start a fresh read.
+
+    A gdrive backend's download cache drops its copy of the body too, so
+    a deleted or expired file is never served from local disk.
     """
     now = time.time()
     deadline = now + _tombstone_ttl()
     with _cache_lock:
         _prune_tombstones_locked(now)
-        _cache.pop(fileid, None)
+        _cache.pop(fileid)
+        _negative.pop(fileid, None)
+        _inflight.pop(fileid, None)
         _tombstones[fileid] = deadline
+        _tombstones.move_to_end(fileid)
+    downloads = getattr(get_storage(), "downloads", None)
+    if downloads is not None:
+        downloads.invalidate(fileid)
 
 
 def load_metadata(
@@ -125,6 +452,16 @@ def load_metadata(
     the cache entry is evicted and ``FileNotFoundError`` is raised so the
     router returns 404.
 
+    404s (unknown or expired) are remembered for ``host.negative_cachetime``
+    seconds, so repeated probes for the same URL do not reach storage;
+    storing or invalidating the fileid forgets them.
+
+    With ``host.cache_stale_while_revalidate`` set, an entry up to that many
+    seconds past ``host.cachetime`` is still served (retention is checked
+    as usual) while one background read refreshes it. ``invalidate`` drops
+    the entry and tombstones the fileid, so a DELETE is never undone by a
+    refresh.
+
     Args:
         fileid(str): File id
         filename(str): Filename
@@ -136,14 +473,17 @@ def load_metadata(
     Return:
         metadata(Metadata): Metadata object.
     """
-    metadata = get_cache(fileid, filename)
+    metadata, stale = _lookup(fileid, filename, allow_stale=True)
+    if stale:
+        _revalidate(fileid, filename)
     if metadata is None:
-        metadata = get_storage().load_metadata(fileid, filename)
-        store_cache(metadata)
-        metadata = get_cache(fileid, filename) or _redacted_copy(metadata)
+        if not bypass_expiry and _known_missing(fileid, filename):
+            raise FileNotFoundError(f"{fileid}/{filename} recently not found")
+        metadata = _load_from_storage(fileid, filename)
 
     if not bypass_expiry and is_expired(metadata, get_config().get("delete", {})):
         with _cache_lock:
-            _cache.pop(fileid, None)
+            _cache.pop(fileid)
+        _remember_missing(fileid, filename)
         raise FileNotFoundError(f"{fileid}/{filename} expired")
     return metadata
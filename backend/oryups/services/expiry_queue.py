@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import threading
+from typing import Optional
+
+from oryups.filesystem import Metadata
+from oryups.utils.expiry import expiry_deadline
+
+_heap: list[tuple[float, str, str]] = []
+_deadlines: dict[str, float] = {}
+_lock: threading.Lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wake: Optional[asyncio.Event] = None
+
+
+def attach(loop: asyncio.AbstractEventLoop, wake: asyncio.Event) -> None:
+    """Start accepting deadlines; ``wake`` is set whenever the head moves earlier.
+
+    Until a reaper attaches, :func:`schedule` is a no-op so processes that
+    never reap (``delete.permanently`` off) do not accumulate a heap.
+    """
+    global _loop, _wake
+    with _lock:
+        _loop = loop
+        _wake = wake
+
+
+def detach() -> None:
+    """Stop accepting deadlines and drop everything queued."""
+    global _loop, _wake
+    with _lock:
+        _loop = None
+        _wake = None
+        _heap.clear()
+        _deadlines.clear()
+
+
+def schedule(metadata: Metadata) -> None:
+    """Track (or re-track) the retention deadline of ``metadata``.
+
+    Re-scheduling a fileid supersedes its previous deadline; the stale heap
+    entry is skipped lazily when it reaches the top. Files that never
+    expire are simply forgotten.
+    """
+    deadline = expiry_deadline(metadata)
+    with _lock:
+        if _loop is None:
+            return
+        if deadline is None:
+            _deadlines.pop(metadata.id, None)
+            return
+        _deadlines[metadata.id] = deadline
+        heapq.heappush(_heap, (deadline, metadata.id, metadata.name))
+        moved_earlier = _heap[0][1] == metadata.id and _heap[0][0] == deadline
+        loop, wake = _loop, _wake
+    if moved_earlier and wake is not None:
+        loop.call_soon_threadsafe(wake.set)
+
+
+def defer(fileid: str, filename: str, deadline: float) -> None:
+    """Re-queue a fileid at an explicit deadline (used to retry failed reaps)."""
+    with _lock:
+        if _loop is None:
+            return
+        _deadlines[fileid] = deadline
+        heapq.heappush(_heap, (deadline, fileid, filename))
+
+
+def unschedule(fileid: str) -> None:
+    """Forget a fileid, e.g. after it was removed through another path."""
+    with _lock:
+        _deadlines.pop(fileid, None)
+
+
+def next_deadline() -> Optional[float]:
+    """Return the earliest live deadline, or None when nothing is queued."""
+    with _lock:
+        while _heap:
+            deadline, fileid, _ = _heap[0]
+            if _deadlines.get(fileid) == deadline:
+                return deadline
+            heapq.heappop(_heap)
+    return None
+
+
+def pop_due(now: float) -> list[tuple[str, str]]:
+    """Remove and return every ``(fileid, filename)`` due at or before ``now``."""
+    due: list[tuple[str, str]] = []
+    with _lock:
+        while _heap and _heap[0][0] <= now:
+            deadline, fileid, filename = heapq.heappop(_heap)
+            if _deadlines.get(fileid) != deadline:
+                continue
+            _deadlines.pop(fileid, None)
+            due.append((fileid, filename))
+    return due
+
+
+def size() -> int:
+    """Number of fileids currently tracked."""
+    with _lock:
+        return len(_deadlines)
@@ -1,32 +1,68 @@
 import asyncio
-from pathlib import Path
+import time
 from typing import Optional
 
 from fastapi.concurrency import run_in_threadpool
 
 from oryups.config import get_config, get_storage
 from oryups.filesystem import Metadata, gdrive as GDriveStorage, local as LocalStorage
-from oryups.services import cache
+from oryups.services import cache, expiry_queue
+from oryups.services.admin import list_gdrive_entries
 from oryups.utils.expiry import is_expired
 
+RETRY_DELAY: float = 60.0
+
 
 async def run_reaper(stop_event: asyncio.Event) -> None:
-    """Run the periodic reaper loop until ``stop_event`` is set.
+    """Run the reaper until ``stop_event`` is set.
+
+    Storage is scanned once at startup (:func:`reap_once`), which removes
+    everything already expired and seeds :mod:`expiry_queue` with the
+    deadlines of the rest. After that the loop sleeps until the earliest
+    queued deadline, woken early whenever an upload or expiry update
+    schedules an earlier one, and only touches the files that are due.
 
     Args:
         stop_event(asyncio.Event): Set by the lifespan to request shutdown.
     """
-    while not stop_event.is_set():
+    wake = asyncio.Event()
+    expiry_queue.attach(asyncio.get_running_loop(), wake)
+    try:
         try:
             await run_in_threadpool(reap_once)
         except Exception as exc:
             print(f"[reaper] exception: {exc!r}")
 
-        interval = _get_reaper_interval()
-        try:
-            await asyncio.wait_for(stop_event.wait(), timeout=max(60, interval))
-        except asyncio.TimeoutError:
-            continue
+        while not stop_event.is_set():
+            await _wait_for_next_deadline(stop_event, wake)
+            if stop_event.is_set():
+                break
+            try:
+                await run_in_threadpool(reap_due)
+            except Exception as exc:
+                print(f"[reaper] exception: {exc!r}")
+    finally:
+        expiry_queue.detach()
+
+
+async def _wait_for_next_deadline(stop_event: asyncio.Event, wake: asyncio.Event) -> None:
+    """Sleep until the head deadline, a wake-up, or shutdown — whichever is first.
+
+    ``delete.reaper_interval`` caps a single sleep so a long-idle queue
+    still wakes up periodically.
+    """
+    wake.clear()
+    timeout = float(max(60, _get_reaper_interval()))
+    deadline = expiry_queue.next_deadline()
+    if deadline is not None:
+        timeout = min(timeout, max(0.0, deadline - time.time()))
+
+    waiters = [asyncio.ensure_future(stop_event.wait()), asyncio.ensure_future(wake.wait())]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
 
 
 def _get_reaper_interval() -> int:
@@ -40,6 +76,9 @@ def _get_reaper_interval() -> int:
 def reap_once() -> int:
     """Scan storage once, deleting every expired file.
 
+    Every surviving file's deadline is handed to :mod:`expiry_queue`, so
+    when the reaper loop is running this doubles as the startup seed.
+
     Return:
         removed(int): Number of files permanently removed.
     """
@@ -49,86 +88,95 @@ def reap_once() -> int:
         return 0
 
     storage = get_storage()
-    if isinstance(storage, LocalStorage):
-        return _reap_local(storage, delete_rule)
-    if isinstance(storage, GDriveStorage):
-        return _reap_gdrive(storage, delete_rule)
-    return 0
+    expired: list[Metadata] = []
+    for metadata in _list_entries(storage):
+        if not is_expired(metadata, delete_rule):
+            expiry_queue.schedule(metadata)
+            continue
+        expired.append(metadata)
+    return len(_remove_expired_many(storage, expired))
 
 
-def _reap_local(storage: LocalStorage, delete_rule: dict) -> int:
-    removed = 0
-    try:
-        entries = list(storage.root.iterdir())
-    except FileNotFoundError:
+def reap_due() -> int:
+    """Remove the files whose queued deadline has passed.
+
+    Each due entry is re-read from storage first: if its retention was
+    extended in the meantime (possibly by another worker process) it is
+    re-queued at the new deadline instead of being removed.
+
+    Return:
+        removed(int): Number of files permanently removed.
+    """
+    delete_rule = get_config().get("delete", {})
+    if not (delete_rule.get("enabled") and delete_rule.get("permanently")):
         return 0
 
-    for folder in entries:
-        if not folder.is_dir():
-            continue
-        if folder.name == "delete" or folder.name.startswith("."):
-            continue
-        metadata_path = _find_metadata_path(folder)
-        if metadata_path is None:
-            continue
+    storage = get_storage()
+    expired: list[Metadata] = []
+    for fileid, filename in expiry_queue.pop_due(time.time()):
         try:
-            metadata = Metadata()
-            metadata.load(dataPath=metadata_path)
+            metadata = storage.load_metadata(fileid, filename)
+        except FileNotFoundError:
+            continue
         except Exception as exc:
-            print(f"[reaper] failed to load {metadata_path}: {exc!r}")
+            print(f"[reaper] failed to load {fileid}/{filename}: {exc!r}")
+            expiry_queue.defer(fileid, filename, time.time() + RETRY_DELAY)
             continue
         if not is_expired(metadata, delete_rule):
+            expiry_queue.schedule(metadata)
             continue
+        expired.append(metadata)
+
+    removed = _remove_expired_many(storage, expired)
+    gone = {metadata.id for metadata in removed}
+    for metadata in expired:
+        if metadata.id not in gone:
+            expiry_queue.defer(metadata.id, metadata.name, time.time() + RETRY_DELAY)
+    return len(removed)
+
+
+def _list_entries(storage) -> list[Metadata]:
+    if isinstance(storage, LocalStorage):
+        # Files that never expire need neither reaping nor a heap entry.
+        return storage.list_expiring()
+    if isinstance(storage, GDriveStorage):
         try:
-            if storage._remove_permanent(metadata.id, metadata.name):
-                cache.invalidate(metadata.id)
-                removed += 1
+            return list_gdrive_entries(storage)
         except Exception as exc:
-            print(f"[reaper] failed to remove {metadata.id}/{metadata.name}: {exc!r}")
-    return removed
+            print(f"[reaper] gdrive list failed: {exc!r}")
+    return []
 
 
-def _find_metadata_path(folder: Path) -> Optional[Path]:
-    """Return the first ``*.metadata`` file in ``folder`` or None."""
-    try:
-        for entry in folder.iterdir():
-            if entry.is_file() and entry.name.endswith(".metadata"):
-                return entry
-    except FileNotFoundError:
-        return None
-    return None
+def _remove_expired_many(storage, expired: list[Metadata]) -> list[Metadata]:
+    """Permanently remove expired files; gdrive batches the deletes.
+
+    Return:
+        removed(list[Metadata]): The entries actually removed.
+    """
+    if not expired:
+        return []
+    if isinstance(storage, GDriveStorage):
+        try:
+            removed = storage.remove_many(expired)
+        except Exception as exc:
+            print(f"[reaper] gdrive batch remove failed: {exc!r}")
+            return []
+        for metadata in removed:
+            cache.invalidate(metadata.id)
+        return removed
+    return [metadata for metadata in expired if _remove_expired(storage, metadata)]
 
 
-def _reap_gdrive(storage: GDriveStorage, delete_rule: dict) -> int:
-    removed = 0
+def _remove_expired(storage, metadata: Metadata) -> bool:
+    """Permanently remove one expired file and drop its cache entry."""
     try:
-        root_list = storage.get_list(dir=storage.root, mimeType="application/vnd.google-apps.folder")
+        if isinstance(storage, LocalStorage):
+            removed: Optional[bool] = storage._remove_permanent(metadata.id, metadata.name)
+        else:
+            removed = storage.remove(metadata.id, metadata.name, metadata.delete, force=True, permanently=True)
     except Exception as exc:
-        print(f"[reaper] gdrive list failed: {exc!r}")
-        return 0
-
-    for fileid, folderid in root_list.items():
-        if fileid == "delete":
-            continue
-        try:
-            files = storage.get_list(dir=folderid)
-        except Exception as exc:
-            print(f"[reaper] gdrive list {fileid} failed: {exc!r}")
-            continue
-        filename = next((n for n in files if not n.endswith(".metadata")), None)
-        if not filename:
-            continue
-        try:
-            metadata = storage.load_metadata(fileid, filename)
-        except Exception as exc:
-            print(f"[reaper] gdrive metadata {fileid} failed: {exc!r}")
-            continue
-        if not is_expired(metadata, delete_rule):
-            continue
-        try:
-            if storage.remove(fileid, filename, metadata.delete, force=True, permanently=True):
-                cache.invalidate(fileid)
-                removed += 1
-        except Exception as exc:
-            print(f"[reaper] gdrive remove {fileid} failed: {exc!r}")
-    return removed
+        print(f"[reaper] failed to remove {metadata.id}/{metadata.name}: {exc!r}")
+        return False
+    if removed:
+        cache.invalidate(metadata.id)
+    return bool(removed)
@@ -0,0 +1,186 @@
+import hashlib
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from json import dumps, loads
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_SESSION_TTL: int = 86400
+
+_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{22}")
+
+# Running SHA-256 per session, keyed by id and valid up to the recorded
+# offset. Another worker (or a restart) simply means finalize re-hashes
+# the part file once.
+_hashers: dict[str, tuple[int, "hashlib._Hash"]] = {}
+_lock: threading.Lock = threading.Lock()
+
+
+class UploadSession:
+    """One resumable upload staged on disk.
+
+    A session is a directory holding ``part`` (the bytes received so far)
+    and ``session.json`` (filename, declared length, timestamps). The
+    offset is always the size of ``part``, so it survives restarts and is
+    shared by every worker process.
+
+    Args:
+        id(str): Opaque session id; knowing it is the only credential.
+        folder(pathlib.Path): The session directory.
+        filename(str): Final filename passed to ``storage.save``.
+        length(int): Declared total size in bytes.
+        created_at(float): Unix time the session was created.
+        updated_at(float): Unix time of the last accepted chunk.
+    """
+
+    def __init__(self, id: str, folder: Path, filename: str, length: int, created_at: float, updated_at: float):
+        self.id = id
+        self.folder = folder
+        self.filename = filename
+        self.length = length
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def part_path(self) -> Path:
+        return self.folder / "part"
+
+    @property
+    def offset(self) -> int:
+        try:
+            return self.part_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def expires_at(self, ttl: int) -> float:
+        return self.updated_at + ttl
+
+    def to_dict(self, ttl: int) -> dict:
+        return {
+            "id": self.id,
+            "name": self.filename,
+            "offset": self.offset,
+            "length": self.length,
+            "expires_at": self.expires_at(ttl),
+        }
+
+    def touch(self) -> None:
+        self.updated_at = time.time()
+        self._write()
+
+    def _write(self) -> None:
+        tmp = self.folder / "session.json.tmp"
+        tmp.write_text(
+            dumps({
+                "name": self.filename,
+                "length": self.length,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+            }),
+            encoding="utf-8",
+        )
+        tmp.replace(self.folder / "session.json")
+
+
+def sessions_root(staging_dir: Optional[Path]) -> Path:
+    """Directory holding every session.
+
+    Lives inside the backend's staging directory when it has one, so a
+    finished part file can be hard-linked into storage like a spilled PUT.
+    """
+    base = staging_dir if staging_dir is not None else Path(tempfile.gettempdir()) / "oryups"
+    root = base / "sessions"
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def create(root: Path, filename: str, length: int) -> UploadSession:
+    now = time.time()
+    session_id = secrets.token_urlsafe(16)
+    folder = root / session_id
+    folder.mkdir()
+    session = UploadSession(session_id, folder, filename, length, now, now)
+    session.part_path.touch()
+    session._write()
+    with _lock:
+        _hashers[session_id] = (0, hashlib.sha256())
+    return session
+
+
+def load(root: Path, session_id: str, ttl: int) -> UploadSession:
+    """Return a live session.
+
+    Raises:
+        FileNotFoundError: Unknown id, malformed id, or expired session.
+    """
+    if not _SESSION_ID.fullmatch(session_id):
+        raise FileNotFoundError(session_id)
+    folder = root / session_id
+    try:
+        data = loads((folder / "session.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        raise FileNotFoundError(session_id)
+    session = UploadSession(
+        session_id,
+        folder,
+        str(data["name"]),
+        int(data["length"]),
+        float(data["created_at"]),
+        float(data["updated_at"]),
+    )
+    if session.expires_at(ttl) <= time.time():
+        discard(session)
+        raise FileNotFoundError(session_id)
+    return session
+
+
+def hasher_for(session: UploadSession, offset: int) -> Optional["hashlib._Hash"]:
+    """Return the running hash if it covers exactly ``offset`` bytes."""
+    with _lock:
+        entry = _hashers.get(session.id)
+    if entry is None or entry[0] != offset:
+        return None
+    return entry[1]
+
+
+def record_hash(session: UploadSession, offset: int, hasher: "hashlib._Hash") -> None:
+    with _lock:
+        _hashers[session.id] = (offset, hasher)
+
+
+def discard(session: UploadSession) -> None:
+    """Delete a session's directory and forget its running hash."""
+    with _lock:
+        _hashers.pop(session.id, None)
+    shutil.rmtree(session.folder, ignore_errors=True)
+
+
+def sweep(root: Path, ttl: int) -> int:
+    """Remove every session idle for longer than ``ttl`` seconds.
+
+    Return:
+        removed(int): Number of sessions discarded.
+    """
+    removed = 0
+    stale_before = time.time() - ttl
+    for folder in root.iterdir():
+        try:
+            data = loads((folder / "session.json").read_text(encoding="utf-8"))
+            updated_at = float(data["updated_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Half-created session: fall back to the directory mtime.
+            try:
+                updated_at = folder.stat().st_mtime
+            except OSError:
+                continue
+        if updated_at > stale_before:
+            continue
+        with _lock:
+            _hashers.pop(folder.name, None)
+        shutil.rmtree(folder, ignore_errors=True)
+        removed += 1
+    return removed
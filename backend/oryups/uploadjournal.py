@@ -0,0 +1,107 @@
+import os
+import threading
+from json import dumps, loads
+from pathlib import Path
+
+# ``done`` records between automatic compactions.
+COMPACT_AFTER: int = 256
+
+
+class UploadJournal:
+    """Append-only record of the gdrive write-behind queue.
+
+    One JSON object per line, each naming an ``op`` for a fileid:
+
+    * ``queued`` — body cached locally; carries ``name``, ``folder`` (the
+      Drive folder gid) and ``size``.
+    * ``session`` — a resumable upload session was opened at ``uri``.
+    * ``progress`` — Drive acknowledged the body up to ``offset``.
+    * ``body`` — the body is stored as Drive file ``gid``.
+    * ``done`` — sidecar uploaded and local copy removed.
+
+    The file is folded once when the journal is opened; after that every
+    :meth:`record` updates the in-memory state as well, so :meth:`replay`
+    and :meth:`state` never re-read the file. A restart therefore neither
+    re-lists Drive nor re-sends acknowledged bytes. Every ``compact_after``
+    ``done`` records the file is rewritten down to the unfinished entries.
+    A torn last line from a crash is ignored.
+    """
+
+    def __init__(self, path: Path, compact_after: int = COMPACT_AFTER):
+        self.path = path
+        self.compact_after = max(1, compact_after)
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._finished = 0
+
+    def record(self, op: str, fileid: str, **fields) -> None:
+        line = dumps({"op": op, "id": fileid, **fields}, ensure_ascii=False) + "\n"
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            _apply(self._entries, op, fileid, fields)
+            if op == "done":
+                self._finished += 1
+                if self._finished >= self.compact_after:
+                    self._compact_locked()
+
+    def replay(self) -> dict[str, dict]:
+        """Return ``fileid → state`` for every entry not yet ``done``."""
+        with self._lock:
+            return {fileid: dict(state) for fileid, state in self._entries.items()}
+
+    def state(self, fileid: str) -> dict:
+        """Return the state of one unfinished entry (empty when unknown)."""
+        with self._lock:
+            return dict(self._entries.get(fileid, {}))
+
+    def compact(self) -> None:
+        """Atomically rewrite the journal as one ``queued`` line per entry."""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for fileid, state in self._entries.items():
+                f.write(dumps({"op": "queued", "id": fileid, **state}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+        self._finished = 0
+
+    def _load(self) -> dict[str, dict]:
+        entries: dict[str, dict] = {}
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return entries
+        for line in lines:
+            try:
+                record = loads(line)
+                op, fileid = record.pop("op"), record.pop("id")
+            except (ValueError, KeyError, AttributeError):
+                continue
+            _apply(entries, op, fileid, record)
+        return entries
+
+
+def _apply(entries: dict[str, dict], op: str, fileid: str, record: dict) -> None:
+    """Fold one journal record into ``entries``."""
+    if op == "done":
+        entries.pop(fileid, None)
+    elif op == "queued":
+        entries[fileid] = dict(record)
+    elif fileid in entries:
+        state = entries[fileid]
+        if op == "session":
+            state["uri"] = record.get("uri", "")
+            state["offset"] = 0
+        elif op == "progress":
+            state["offset"] = int(record.get("offset", 0))
+        elif op == "body":
+            state["gid"] = record.get("gid", "")
+            state.pop("uri", None)
+            state.pop("offset", None)
@@ -0,0 +1,69 @@
+import queue
+import threading
+from typing import Any
+
+DEFAULT_BACKLOG_BYTES: int = 4 * 1024 * 1024 * 1024
+
+
+class UploadQueue:
+    """Work queue whose bound is the bytes waiting on disk.
+
+    Producers claim room for a body with :meth:`try_reserve` *before* it is
+    read from the client, using its declared size; when the pending backlog
+    would exceed ``max_bytes`` the claim is refused and the upload is turned
+    away (503) instead of being spooled. A body larger than the whole limit
+    is still admitted once the backlog is empty. Workers block in
+    :meth:`get` and call :meth:`done` once the body has left the disk, which
+    frees its bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_BACKLOG_BYTES):
+        self.max_bytes = max_bytes
+        self._queue: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size: int) -> bool:
+        """Claim ``size`` bytes unless that would overfill the backlog; never blocks."""
+        with self._lock:
+            if self._pending > 0 and self._pending + size > self.max_bytes:
+                return False
+            self._pending += size
+            return True
+
+    def reserve(self, size: int) -> None:
+        """Claim ``size`` bytes unconditionally, e.g. for bodies already on disk."""
+        with self._lock:
+            self._pending += size
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self._pending = max(0, self._pending - size)
+
+    def put(self, item: Any, size: int) -> None:
+        """Enqueue an item whose ``size`` bytes were already reserved."""
+        self._queue.put((item, size))
+
+    def get(self) -> tuple[Any, int]:
+        """Block until an item is available; returns ``(item, size)``."""
+        return self._queue.get()
+
+    def done(self, size: int) -> None:
+        self.release(size)
+        self._queue.task_done()
+
+    def requeue(self, item: Any, size: int, delay: float) -> None:
+        """Finish this attempt and put ``item`` back after ``delay`` seconds.
+
+        Unlike :meth:`done` its bytes stay reserved: the body is still on
+        disk until a later attempt succeeds.
+        """
+        self._queue.task_done()
+        timer = threading.Timer(delay, self._queue.put, ((item, size),))
+        timer.daemon = True
+        timer.start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {"queued": self._queue.qsize(), "pending_bytes": pending, "max_bytes": self.max_bytes}
@@ -0,0 +1,95 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+DEFAULT_BUFFER_SIZE: int = 1024 * 1024
+DEFAULT_BUFFER_COUNT: int = 16
+
+_shared: Optional["BufferPool"] = None
+_shared_lock: threading.Lock = threading.Lock()
+
+
+class BufferPool:
+    """Fixed set of reusable ``bytearray`` buffers handed out as memoryviews.
+
+    At most ``count`` buffers of ``size`` bytes ever exist, so the memory
+    spent on copy loops is bounded by ``size * count`` no matter how many
+    transfers run at once. When every buffer is checked out, :meth:`acquire`
+    blocks until one is returned.
+    """
+
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE, count: int = DEFAULT_BUFFER_COUNT):
+        if size <= 0 or count <= 0:
+            raise ValueError("buffer size and count must be positive")
+        self.size = size
+        self.count = count
+        self._free: list[bytearray] = []
+        self._allocated = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def acquire(self) -> Iterator[memoryview]:
+        """Check out one buffer for the duration of the ``with`` block."""
+        with self._cond:
+            while not self._free and self._allocated >= self.count:
+                self._cond.wait()
+            if self._free:
+                buffer = self._free.pop()
+            else:
+                buffer = bytearray(self.size)
+                self._allocated += 1
+        view = memoryview(buffer)
+        try:
+            yield view
+        finally:
+            view.release()
+            with self._cond:
+                self._free.append(buffer)
+                self._cond.notify()
+
+    def in_use(self) -> int:
+        with self._cond:
+            return self._allocated - len(self._free)
+
+
+def shared_pool(size: int = DEFAULT_BUFFER_SIZE, count: int = DEFAULT_BUFFER_COUNT) -> BufferPool:
+    """Return the process-wide pool, creating it on first use.
+
+    Every storage backend (including the gdrive cache's nested local
+    backend) asks for the pool with the same configured values, so they
+    all share one set of buffers. A call with different values replaces
+    the pool; buffers checked out from the old one are simply dropped
+    when returned.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None or _shared.size != size or _shared.count != count:
+            _shared = BufferPool(size, count)
+        return _shared
+
+
+def copy_stream(stream: Any, write: Callable[[memoryview], Any], pool: BufferPool) -> int:
+    """Copy ``stream`` to ``write`` through one pooled buffer.
+
+    Uses ``readinto`` when the source supports it so no per-chunk byte
+    strings are allocated; otherwise reads at most one buffer's worth at a
+    time.
+
+    Return:
+        copied(int): Number of bytes copied.
+    """
+    copied = 0
+    with pool.acquire() as buffer:
+        readinto = getattr(stream, "readinto", None)
+        while True:
+            if readinto is not None:
+                n = readinto(buffer)
+                if not n: break
+                write(buffer[:n])
+            else:
+                chunk = stream.read(len(buffer))
+                if not chunk: break
+                n = len(chunk)
+                write(chunk)
+            copied += n
+    return copied
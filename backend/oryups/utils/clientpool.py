@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+DEFAULT_POOL_SIZE: int = 4
+
+
+class ClientPool:
+    """Bounded set of independent, non-thread-safe clients checked out per call.
+
+    Clients are built lazily by ``factory`` up to ``size``; once all are
+    checked out, :meth:`acquire` blocks until one is returned. Each client
+    is only ever used by one thread at a time, so clients wrapping a
+    non-thread-safe transport (httplib2) can serve requests in parallel.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = DEFAULT_POOL_SIZE):
+        if size <= 0:
+            raise ValueError("pool size must be positive")
+        self.size = size
+        self._factory = factory
+        self._free: list[Any] = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Check out one client for the duration of the ``with`` block."""
+        with self._cond:
+            while not self._free and self._created >= self.size:
+                self._cond.wait()
+            if self._free:
+                client = self._free.pop()
+            else:
+                # Reserve the slot before building outside the lock.
+                self._created += 1
+                client = None
+        if client is None:
+            try:
+                client = self._factory()
+            except BaseException:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield client
+        finally:
+            with self._cond:
+                self._free.append(client)
+                self._cond.notify()
+
+    def in_use(self) -> int:
+        with self._cond:
+            return self._created - len(self._free)
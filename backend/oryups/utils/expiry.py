@@ -1,12 +1,31 @@
 import time
+from typing import TYPE_CHECKING, Optional
 
-from oryups.filesystem import Metadata
+if TYPE_CHECKING:
+    from oryups.filesystem import Metadata
 
 
 NEVER_EXPIRES_SENTINEL: float = -1.0
 
 
-def is_expired(metadata: Metadata, delete_rule: dict) -> bool:
+def expiry_deadline(metadata: "Metadata") -> Optional[float]:
+    """Return the unix timestamp at which the metadata's retention ends.
+
+    Args:
+        metadata(Metadata): Loaded metadata object.
+
+    Return:
+        deadline(float | None): ``created_at + delete_after``, or None when
+        ``delete_after`` is the never-sentinel.
+    """
+    after = float(getattr(metadata, "delete_after", NEVER_EXPIRES_SENTINEL) or NEVER_EXPIRES_SENTINEL)
+    if after == NEVER_EXPIRES_SENTINEL:
+        return None
+    created = float(getattr(metadata, "created_at", 0) or 0)
+    return created + after
+
+
+def is_expired(metadata: "Metadata", delete_rule: dict) -> bool:
     """Return True when the metadata has passed its retention window.
 
     Only ``delete_after == -1`` is treated as "never expires". Any other
@@ -24,8 +43,7 @@ def is_expired(metadata: Metadata, delete_rule: dict) -> bool:
     """
     if not delete_rule.get("enabled", False):
         return False
-    after = float(getattr(metadata, "delete_after", NEVER_EXPIRES_SENTINEL) or NEVER_EXPIRES_SENTINEL)
-    if after == NEVER_EXPIRES_SENTINEL:
+    deadline = expiry_deadline(metadata)
+    if deadline is None:
         return False
-    created = float(getattr(metadata, "created_at", 0) or 0)
-    return (created + after) <= time.time()
+    return deadline <= time.time()
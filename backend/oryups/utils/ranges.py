@@ -0,0 +1,66 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+MAX_RANGES: int = 16
+
+
+def parse_range(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """Parse a ``Range`` request header into half-open byte ranges.
+
+    Overlapping and adjacent ranges are merged and the result is sorted,
+    as RFC 9110 allows, so a client cannot make one request fetch the same
+    bytes many times over.
+
+    Args:
+        header(str): ``Range`` header value, e.g. ``bytes=0-99,-500``.
+        size(int): Full size of the representation.
+
+    Return:
+        ranges(list[tuple[int, int]] | None): ``[(start, stop), ...]``, or
+        None when the header must be ignored (not ``bytes``, malformed or
+        more than ``MAX_RANGES`` ranges) and the full body sent instead.
+
+    Raises:
+        HTTPException: 416 (with ``Content-Range: bytes */size``) if no
+        range overlaps the representation.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges: list[tuple[int, int]] = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash or not (first.isdigit() or last.isdigit()):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            suffix = int(last)
+            if suffix > 0 and size > 0:
+                ranges.append((max(0, size - suffix), size))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last) + 1, size) if last else size))
+
+    if not ranges:
+        raise HTTPException(
+            status_code=416,
+            detail="Range Not Satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    merged: list[tuple[int, int]] = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
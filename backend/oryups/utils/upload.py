@@ -1,11 +1,232 @@
 import asyncio
-from tempfile import SpooledTemporaryFile
-from typing import IO, Optional, Tuple
+import hashlib
+import inspect
+import io
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
 
 from fastapi import HTTPException, Request
+from starlette.requests import ClientDisconnect
 
 SPOOL_THRESHOLD: int = 10 * 1024 * 1024
+DEFAULT_UPLOAD_MEMORY_BUDGET: int = 256 * 1024 * 1024
 DEFAULT_UPLOAD_IDLE_TIMEOUT: float = 60.0
+COALESCE_SIZE: int = 256 * 1024
+BACKLOG_RETRY_AFTER: int = 30
+
+
+class SpoolBudget:
+    """Process-wide allowance for upload bytes held in RAM.
+
+    Every in-memory :class:`UploadSpool` reserves from this budget as it
+    grows. A spool whose reservation fails spills to disk immediately, so
+    the total RAM pinned by concurrent uploads never exceeds ``limit``
+    regardless of how many are in flight.
+    """
+
+    def __init__(self, limit: int = DEFAULT_UPLOAD_MEMORY_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.spills = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n: int) -> bool:
+        with self._lock:
+            if self.used + n > self.limit:
+                self.spills += 1
+                return False
+            self.used += n
+            self.peak = max(self.peak, self.used)
+            return True
+
+    def release(self, n: int) -> None:
+        with self._lock:
+            self.used = max(0, self.used - n)
+
+    def snapshot(self) -> dict:
+        """Return current usage for the admin stats endpoint."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "used": self.used,
+                "peak": self.peak,
+                "spills": self.spills,
+            }
+
+
+_budget: SpoolBudget = SpoolBudget()
+
+
+def configure_spool_budget(limit: int) -> SpoolBudget:
+    """Set the process-wide in-memory spool limit (``host.upload_memory_budget``)."""
+    with _budget._lock:
+        _budget.limit = max(0, int(limit))
+    return _budget
+
+
+def spool_budget() -> SpoolBudget:
+    """Return the process-wide spool budget."""
+    return _budget
+
+
+class UploadSpool:
+    """Seekable upload buffer that spills from RAM into a *named* temp file.
+
+    Behaves like :class:`tempfile.SpooledTemporaryFile`, except that once
+    the body outgrows ``max_memory`` it moves into a file created with
+    :func:`tempfile.mkstemp` inside ``dir``. Because that file has a real
+    path, a storage backend on the same filesystem can commit it with a
+    hard link instead of copying the bytes a second time. :attr:`path` is
+    None while the body is still in memory.
+
+    The temp file is unlinked on :meth:`close`; anything hard-linked from
+    it beforehand keeps the data.
+
+    While in memory the spool also reserves its bytes from ``budget``; when
+    the budget is exhausted it spills early, even below ``max_memory``.
+
+    Every written byte also feeds a running SHA-256, so the content digest
+    is known as soon as the body has streamed in (:meth:`sha256`).
+    """
+
+    def __init__(
+        self,
+        max_memory: int = SPOOL_THRESHOLD,
+        dir: Optional[Path] = None,
+        budget: Optional[SpoolBudget] = None,
+    ):
+        self._max_memory = max_memory
+        self._dir = dir
+        self._budget = budget
+        self._reserved = 0
+        self._hash = hashlib.sha256()
+        self._file: io.BufferedRandom | io.BytesIO = io.BytesIO()
+        self.path: Optional[Path] = None
+
+    @classmethod
+    def adopt(cls, path: Path, hasher: Optional["hashlib._Hash"] = None) -> "UploadSpool":
+        """Wrap an existing on-disk body (e.g. a finished resumable upload).
+
+        The spool takes ownership of ``path`` and unlinks it on close
+        (pass ``keep=True`` to :meth:`close` to hand it back). When
+        no running ``hasher`` is supplied the file is hashed once here.
+        """
+        spool = cls()
+        spool._file = open(path, "r+b")
+        spool.path = Path(path)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            while chunk := spool._file.read(COALESCE_SIZE):
+                hasher.update(chunk)
+            spool._file.seek(0)
+        spool._hash = hasher
+        return spool
+
+    def rollover(self) -> None:
+        """Move the in-memory body into the named temp file."""
+        if self.path is not None:
+            return
+        memory = self._file
+        assert isinstance(memory, io.BytesIO)
+        fd, name = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=self._dir)
+        disk = os.fdopen(fd, "w+b")
+        try:
+            disk.write(memory.getbuffer())
+            disk.seek(memory.tell())
+        except BaseException:
+            disk.close()
+            os.unlink(name)
+            raise
+        memory.close()
+        self._file = disk
+        self.path = Path(name)
+        self._release()
+
+    def write(self, data: bytes) -> int:
+        if self.path is None:
+            if self._file.tell() + len(data) > self._max_memory:
+                self.rollover()
+            elif self._budget is not None:
+                if self._budget.reserve(len(data)):
+                    self._reserved += len(data)
+                else:
+                    self.rollover()
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def sha256(self) -> str:
+        """Hex SHA-256 of everything written so far."""
+        return self._hash.hexdigest()
+
+    def _release(self) -> None:
+        if self._budget is not None and self._reserved:
+            self._budget.release(self._reserved)
+            self._reserved = 0
+
+    def read(self, n: int = -1) -> bytes:
+        return self._file.read(n)
+
+    def readinto(self, buffer) -> int:
+        return self._file.readinto(buffer)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def fileno(self) -> int:
+        """Return the OS descriptor; only available once spilled to disk."""
+        if self.path is None:
+            raise io.UnsupportedOperation("fileno")
+        return self._file.fileno()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def close(self, keep: bool = False) -> None:
+        """Close the spool, unlinking its temp file unless ``keep`` is set."""
+        self._file.close()
+        self._release()
+        if self.path is not None and not keep:
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "UploadSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def reserve_backlog(storage: Any, size: int) -> int:
+    """Claim ``size`` bytes of the storage backend's upload backlog.
+
+    Args:
+        storage(oryups.filesystem.storage): The configured backend.
+        size(int): Body size in bytes.
+
+    Return:
+        size(int): The bytes claimed; hand them back with
+            ``storage.release_upload`` if the upload does not get saved.
+
+    Raises:
+        HTTPException: 503 with ``Retry-After`` while the backlog is full.
+    """
+    if not storage.reserve_upload(size):
+        raise HTTPException(
+            status_code=503,
+            detail="Upload backlog is full",
+            headers={"Retry-After": str(BACKLOG_RETRY_AFTER)},
+        )
+    return size
 
 
 def _parse_content_length(header_value: Optional[str]) -> Optional[int]:
@@ -21,16 +242,38 @@ def _parse_content_length(header_value: Optional[str]) -> Optional[int]:
     return value
 
 
+def check_declared_size(request: Request, max_size: Optional[int] = None) -> Optional[int]:
+    """Validate the request's Content-Length before any of the body is read.
+
+    Lets callers reject an oversized upload before they set anything up
+    for it (a backend session, backlog room).
+
+    Return:
+        declared(int | None): The declared body size, or None when absent.
+
+    Raises:
+        HTTPException: 400 on a malformed Content-Length; 413 when it
+            exceeds ``max_size``.
+    """
+    declared = _parse_content_length(request.headers.get("content-length"))
+    if max_size is not None and declared is not None and declared > max_size:
+        raise HTTPException(status_code=413, detail="Payload Too Large")
+    return declared
+
+
 async def buffer_request_body(
     request: Request,
     *,
     max_size: Optional[int] = None,
     idle_timeout: float = DEFAULT_UPLOAD_IDLE_TIMEOUT,
-) -> Tuple[IO[bytes], int]:
-    """Buffer a raw request body into a SpooledTemporaryFile.
+    spool_dir: Optional[Path] = None,
+    max_memory: int = SPOOL_THRESHOLD,
+) -> Tuple[UploadSpool, int]:
+    """Buffer a raw request body into an :class:`UploadSpool`.
 
     Reads the incoming PUT body chunk-by-chunk so memory usage stays bounded;
-    files larger than SPOOL_THRESHOLD spill to disk automatically. When
+    bodies larger than ``max_memory`` spill to disk automatically, and so
+    does any body once the process-wide :class:`SpoolBudget` runs out. When
     ``max_size`` is set, both the declared Content-Length and the actual
     received byte count are enforced. An idle timeout caps how long a peer
     may stall between chunks before we abort the upload, preventing slow-
@@ -41,38 +284,167 @@ async def buffer_request_body(
         max_size(int, optional): Maximum accepted body size in bytes.
         idle_timeout(float): Maximum seconds to wait for the next chunk
             before raising 408. Defaults to ``DEFAULT_UPLOAD_IDLE_TIMEOUT``.
+        spool_dir(pathlib.Path, optional): Directory for the spilled temp
+            file. Pass the storage backend's staging directory so the final
+            commit can be a rename/link instead of a copy.
+        max_memory(int): Per-request in-memory ceiling before spilling.
+            Defaults to ``SPOOL_THRESHOLD``.
 
     Return:
-        result(tuple[IO[bytes], int]): (file-like object positioned at 0,
-            total size in bytes).
+        result(tuple[UploadSpool, int]): (spool positioned at 0, total
+            size in bytes).
 
     Raises:
         HTTPException: 400 on a malformed Content-Length header; 408 on
             idle timeout; 413 when the body exceeds ``max_size``.
     """
-    declared = _parse_content_length(request.headers.get("content-length"))
-    if max_size is not None and declared is not None and declared > max_size:
-        raise HTTPException(status_code=413, detail="Payload Too Large")
+    check_declared_size(request, max_size)
 
-    tmp: SpooledTemporaryFile = SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
-    size = 0
+    tmp = UploadSpool(max_memory=max_memory, dir=spool_dir, budget=_budget)
     try:
-        stream = request.stream().__aiter__()
-        while True:
-            try:
-                chunk = await asyncio.wait_for(stream.__anext__(), timeout=idle_timeout)
-            except StopAsyncIteration:
-                break
-            except asyncio.TimeoutError:
-                raise HTTPException(status_code=408, detail="Upload idle timeout")
-            if not chunk:
-                continue
-            size += len(chunk)
-            if max_size is not None and size > max_size:
-                raise HTTPException(status_code=413, detail="Payload Too Large")
-            tmp.write(chunk)
+        size = await receive_body(request, tmp.write, max_size=max_size, idle_timeout=idle_timeout)
         tmp.seek(0)
         return tmp, size
     except BaseException:
         tmp.close()
         raise
+
+
+class _IdleTimer:
+    """Cancel the current task once it has been idle for ``timeout`` seconds.
+
+    :meth:`touch` only records the time of the latest activity. The single
+    timer handle checks it when it fires and, if there was activity since,
+    re-arms itself for ``last activity + timeout`` instead of cancelling.
+    While :meth:`pause` is in effect the timer never cancels.
+    """
+
+    def __init__(self, timeout: float):
+        self.task = asyncio.current_task()
+        self.expired = False
+        self._loop = asyncio.get_running_loop()
+        self._timeout = timeout
+        self._last = self._loop.time()
+        self._paused = False
+        self._handle = self._loop.call_at(self._last + timeout, self._fire)
+
+    def touch(self) -> None:
+        self._last = self._loop.time()
+
+    def pause(self) -> None:
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+        self.touch()
+
+    def close(self) -> None:
+        self._handle.cancel()
+
+    def _fire(self) -> None:
+        now = self._loop.time()
+        if self._paused:
+            self._handle = self._loop.call_at(now + self._timeout, self._fire)
+        elif now < self._last + self._timeout:
+            self._handle = self._loop.call_at(self._last + self._timeout, self._fire)
+        else:
+            self.expired = True
+            self.task.cancel()
+
+
+async def receive_body(
+    request: Request,
+    write: Callable[[bytes], Any],
+    *,
+    max_size: Optional[int] = None,
+    idle_timeout: float = DEFAULT_UPLOAD_IDLE_TIMEOUT,
+) -> int:
+    """Pump the request body straight from the ASGI ``receive`` channel.
+
+    Bypasses ``request.stream()`` and the per-chunk ``asyncio.wait_for``
+    it used to need: each message only records the time in an
+    :class:`_IdleTimer`, whose one timer handle re-arms itself, so a
+    multi-GB body costs no extra task or timer handle per chunk. Errors
+    raised by ``write`` (including its own ``TimeoutError``) propagate
+    unchanged. Small messages are coalesced into
+    ``COALESCE_SIZE`` writes; larger ones are passed through as received.
+
+    Args:
+        request(fastapi.Request): Incoming request whose body is unread.
+        write(Callable[[bytes], Any]): Sink for the body. Receives a
+            reused buffer, so it must copy (file writes do). An awaitable
+            result is awaited before more of the body is read.
+        max_size(int, optional): Maximum accepted body size in bytes.
+        idle_timeout(float): Maximum seconds to wait for the next message;
+            time spent awaiting ``write`` does not count.
+
+    Return:
+        size(int): Total body size in bytes.
+
+    Raises:
+        HTTPException: 408 on idle timeout; 413 when the body exceeds
+            ``max_size``.
+        starlette.requests.ClientDisconnect: When the peer goes away.
+    """
+    receive = request.receive
+    pending = bytearray()
+    size = 0
+    timer = _IdleTimer(idle_timeout)
+    try:
+        while True:
+            message = await receive()
+            timer.touch()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnect()
+            body = message.get("body", b"")
+            if body:
+                size += len(body)
+                if max_size is not None and size > max_size:
+                    raise HTTPException(status_code=413, detail="Payload Too Large")
+                if pending or len(body) < COALESCE_SIZE:
+                    pending += body
+                    body = pending if len(pending) >= COALESCE_SIZE else b""
+                # A message that is already large enough goes through
+                # without being copied into ``pending``.
+                if body:
+                    result = write(body)
+                    if inspect.isawaitable(result):
+                        # A slow sink is backpressure, not an idle client.
+                        timer.pause()
+                        await result
+                        timer.resume()
+                    pending.clear()
+            if not message.get("more_body", False):
+                break
+    except asyncio.CancelledError:
+        # Only our own timer's cancellation becomes a 408; anything else
+        # (client task cancelled, server shutdown) propagates unchanged.
+        if timer.expired and timer.task.uncancel() == 0:
+            raise HTTPException(status_code=408, detail="Upload idle timeout") from None
+        raise
+    finally:
+        timer.close()
+    if pending:
+        result = write(pending)
+        if inspect.isawaitable(result):
+            await result
+    return size
+
+
+async def stream_request_body(
+    request: Request,
+    write: Callable[[bytes], Any],
+    *,
+    max_size: Optional[int] = None,
+    idle_timeout: float = DEFAULT_UPLOAD_IDLE_TIMEOUT,
+) -> int:
+    """Hand a raw request body to ``write`` as it arrives, without spooling.
+
+    Applies the same Content-Length, size and idle checks as
+    :func:`buffer_request_body`; see :func:`receive_body` for ``write``.
+
+    Return:
+        size(int): Total body size in bytes.
+    """
+    check_declared_size(request, max_size)
+    return await receive_body(request, write, max_size=max_size, idle_timeout=idle_timeout)
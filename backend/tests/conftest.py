@@ -59,11 +59,17 @@ def test_config(tmp_path: Path) -> Generator[dict[str, Any], None, None]:
 
     config_module.load_config(path=config_path)
     cache._cache.clear()
+    cache._tombstones.clear()
+    cache._negative.clear()
+    cache._inflight.clear()
 
     try:
         yield config
     finally:
         cache._cache.clear()
+        cache._tombstones.clear()
+        cache._negative.clear()
+        cache._inflight.clear()
         config_module._config = {}
         config_module._storage = None
         config_module._config_path = None
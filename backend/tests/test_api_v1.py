@@ -131,7 +131,7 @@ class TestPatchExpiry:
         assert response.status_code == 200
         assert response.json()["data"]["delete_after"] == -1.0
 
-    def test_patch_invalidates_cache(
+    def test_patch_writes_through_cache(
         self,
         client: TestClient,
         test_config: dict[str, Any],
@@ -152,6 +152,9 @@ class TestPatchExpiry:
 
         again = client.get(f"/api/v1/{fileid}/cached.txt")
         assert again.json()["data"]["delete_after"] == 60.0
+        # Updated in place: still cached, and no tombstone left behind.
+        assert cache.get_cache(fileid, "cached.txt") is not None
+        assert fileid not in cache._tombstones
 
     def test_patch_rejects_below_sentinel(self, client: TestClient) -> None:
         fileid, _ = upload_file(client, "validate.txt", b"x")
@@ -230,3 +233,24 @@ class TestPatchExpiry:
         )
 
         assert response.status_code == 404
+
+
+def test_admin_stats_reports_upload_spool(client: TestClient) -> None:
+    bearer = _login_and_get_bearer(client)
+
+    response = client.get(
+        "/api/v1/admin/stats",
+        headers={"Authorization": f"Bearer {bearer}"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-store"
+    spool = response.json()["data"]["upload_spool"]
+    assert spool["limit"] == 268435456
+    assert spool["used"] == 0
+
+
+def test_admin_stats_requires_bearer(client: TestClient) -> None:
+    response = client.get("/api/v1/admin/stats")
+
+    assert response.status_code == 401
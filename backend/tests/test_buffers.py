@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import io
+import threading
+
+from oryups.utils.buffers import BufferPool, copy_stream
+
+
+def test_copy_stream_reuses_one_bounded_buffer() -> None:
+    pool = BufferPool(size=4, count=1)
+    out = io.BytesIO()
+
+    assert copy_stream(io.BytesIO(b"hello world"), out.write, pool) == 11
+    assert copy_stream(io.BytesIO(b"again"), out.write, pool) == 5
+
+    assert out.getvalue() == b"hello worldagain"
+    assert pool.in_use() == 0
+    assert pool._allocated == 1
+
+
+def test_acquire_blocks_until_a_buffer_is_returned() -> None:
+    pool = BufferPool(size=4, count=1)
+    acquired = threading.Event()
+
+    def _second() -> None:
+        with pool.acquire():
+            acquired.set()
+
+    with pool.acquire():
+        worker = threading.Thread(target=_second)
+        worker.start()
+        assert not acquired.wait(0.1)
+    worker.join(timeout=1)
+
+    assert acquired.is_set()
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+import oryups.config as config_module
+from oryups.filesystem import Metadata
+from oryups.services import cache
+
+
+def _metadata(fileid: str) -> Metadata:
+    metadata = Metadata()
+    metadata.load(
+        data={
+            "id": fileid,
+            "name": f"{fileid}.txt",
+            "mimeType": "text/plain",
+            "size": 1,
+            "delete": "secret",
+            "hidden": False,
+            "created_at": int(time.time()),
+            "delete_after": -1.0,
+        }
+    )
+    return metadata
+
+
+def test_least_recently_used_entry_is_evicted(test_config: dict[str, Any]) -> None:
+    config_module.get_config()["host"]["cache_max_entries"] = 2
+    for fileid in ("aaaaaa", "bbbbbb"):
+        cache.store_cache(_metadata(fileid))
+    assert cache.get_cache("aaaaaa", "aaaaaa.txt") is not None
+
+    cache.store_cache(_metadata("cccccc"))
+
+    assert cache.get_cache("bbbbbb", "bbbbbb.txt") is None
+    assert cache.get_cache("aaaaaa", "aaaaaa.txt") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_byte_budget_bounds_the_cache(test_config: dict[str, Any]) -> None:
+    cache.store_cache(_metadata("aaaaaa"))
+    one_entry = cache.stats()["bytes"]
+    config_module.get_config()["host"]["cache_max_bytes"] = one_entry * 2
+
+    for fileid in ("bbbbbb", "cccccc", "dddddd"):
+        cache.store_cache(_metadata(fileid))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= one_entry * 2
+
+
+def test_sweep_drops_expired_entries_and_tombstones(test_config: dict[str, Any]) -> None:
+    config_module.get_config()["host"]["cachetime"] = 0
+    cache.store_cache(_metadata("aaaaaa"))
+    cache.invalidate("bbbbbb")
+
+    cache.clear_cache()
+
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["bytes"] == 0
+    assert stats["expirations"] == 1
+    assert stats["tombstones"] == 0
+
+
+def test_repeated_404_is_answered_without_storage(test_config: dict[str, Any], monkeypatch) -> None:
+    import pytest
+
+    storage = config_module.get_storage()
+    calls: list[str] = []
+    original = storage.load_metadata
+
+    def _counting(fileid: str, filename: str) -> Metadata:
+        calls.append(fileid)
+        return original(fileid, filename)
+
+    monkeypatch.setattr(storage, "load_metadata", _counting)
+    hits_before = cache.stats()["negative_hits"]
+    for _ in range(3):
+        with pytest.raises(FileNotFoundError):
+            cache.load_metadata("zzzzzz", "probe.txt")
+
+    assert calls == ["zzzzzz"]
+    assert cache.stats()["negative_hits"] - hits_before == 2
+
+    cache.store_cache(_metadata("zzzzzz"))
+    assert cache.load_metadata("zzzzzz", "zzzzzz.txt").id == "zzzzzz"
+    with pytest.raises(FileNotFoundError):
+        cache.load_metadata("zzzzzz", "probe.txt")
+    assert calls == ["zzzzzz", "zzzzzz"]
+
+
+def test_concurrent_misses_share_one_storage_read(test_config: dict[str, Any], monkeypatch) -> None:
+    import threading
+
+    storage = config_module.get_storage()
+    started = threading.Event()
+    release = threading.Event()
+    calls: list[str] = []
+
+    def _slow(fileid: str, filename: str) -> Metadata:
+        calls.append(fileid)
+        started.set()
+        release.wait(5)
+        return _metadata(fileid)
+
+    monkeypatch.setattr(storage, "load_metadata", _slow)
+    results: list[Metadata] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.load_metadata("ssssss", "ssssss.txt")))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Give the followers time to join the leader's read.
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["ssssss"]
+    assert len(results) == 5
+    assert all(metadata.id == "ssssss" and metadata.delete == "" for metadata in results)
+    assert cache._inflight == {}
+
+
+def test_invalidate_detaches_in_flight_read(test_config: dict[str, Any], monkeypatch) -> None:
+    import threading
+
+    storage = config_module.get_storage()
+    started = threading.Event()
+    release = threading.Event()
+    calls: list[str] = []
+
+    def _slow(fileid: str, filename: str) -> Metadata:
+        calls.append(fileid)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        return _metadata(fileid)
+
+    monkeypatch.setattr(storage, "load_metadata", _slow)
+    first = threading.Thread(target=lambda: cache.load_metadata("tttttt", "tttttt.txt"))
+    first.start()
+    assert started.wait(5)
+    cache.invalidate("tttttt")
+
+    cache.load_metadata("tttttt", "tttttt.txt")
+    release.set()
+    first.join(5)
+
+    assert calls == ["tttttt", "tttttt"]
+    assert cache.get_cache("tttttt", "tttttt.txt") is None
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(test_config: dict[str, Any], monkeypatch) -> None:
+    import threading
+
+    host = config_module.get_config()["host"]
+    host["cachetime"] = 10
+    host["cache_stale_while_revalidate"] = 60
+    storage = config_module.get_storage()
+    refreshed = threading.Event()
+    calls: list[str] = []
+
+    def _load(fileid: str, filename: str) -> Metadata:
+        calls.append(fileid)
+        metadata = _metadata(fileid)
+        metadata.hidden = True
+        return metadata
+
+    def _store(metadata: Metadata, **kwargs: Any) -> None:
+        original_store(metadata, **kwargs)
+        refreshed.set()
+
+    cache.store_cache(_metadata("wwwwww"))
+    cache._cache.get("wwwwww")["time"] -= 30
+    monkeypatch.setattr(storage, "load_metadata", _load)
+    original_store = cache.store_cache
+    monkeypatch.setattr(cache, "store_cache", _store)
+
+    stale = cache.load_metadata("wwwwww", "wwwwww.txt")
+
+    assert stale.hidden is False
+    assert refreshed.wait(5)
+    assert calls == ["wwwwww"]
+    assert cache.load_metadata("wwwwww", "wwwwww.txt").hidden is True
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_stale_entry_is_not_served_after_invalidate(test_config: dict[str, Any]) -> None:
+    import pytest
+
+    host = config_module.get_config()["host"]
+    host["cachetime"] = 10
+    host["cache_stale_while_revalidate"] = 60
+    cache.store_cache(_metadata("vvvvvv"))
+    cache._cache.get("vvvvvv")["time"] -= 30
+
+    cache.invalidate("vvvvvv")
+
+    with pytest.raises(FileNotFoundError):
+        cache.load_metadata("vvvvvv", "vvvvvv.txt")
+
+
+def test_update_keeps_reads_hot_and_beats_older_reads(test_config: dict[str, Any], monkeypatch) -> None:
+    import threading
+
+    storage = config_module.get_storage()
+    started = threading.Event()
+    release = threading.Event()
+
+    def _slow(fileid: str, filename: str) -> Metadata:
+        started.set()
+        release.wait(5)
+        return _metadata(fileid)
+
+    monkeypatch.setattr(storage, "load_metadata", _slow)
+    reader = threading.Thread(target=lambda: cache.load_metadata("uuuuuu", "uuuuuu.txt"))
+    reader.start()
+    assert started.wait(5)
+
+    updated = _metadata("uuuuuu")
+    updated.delete_after = 42.0
+    cache.update_cache(updated)
+    release.set()
+    reader.join(5)
+
+    cached = cache.get_cache("uuuuuu", "uuuuuu.txt")
+    assert cached is not None and cached.delete_after == 42.0
+    assert cached.delete == ""
+    assert cache.stats()["tombstones"] == 0
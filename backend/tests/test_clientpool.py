@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from oryups.utils.clientpool import ClientPool
+
+
+def test_clients_are_built_lazily_and_reused() -> None:
+    built: list[object] = []
+    pool = ClientPool(lambda: built.append(object()) or built[-1], size=2)
+
+    with pool.acquire() as first:
+        with pool.acquire() as second:
+            assert first is not second
+            assert pool.in_use() == 2
+    with pool.acquire() as again:
+        assert again in (first, second)
+
+    assert len(built) == 2
+    assert pool.in_use() == 0
+
+
+def test_acquire_blocks_while_every_client_is_checked_out() -> None:
+    pool = ClientPool(object, size=1)
+    acquired = threading.Event()
+
+    def _second() -> None:
+        with pool.acquire():
+            acquired.set()
+
+    with pool.acquire():
+        worker = threading.Thread(target=_second)
+        worker.start()
+        assert not acquired.wait(0.1)
+    worker.join(timeout=1)
+
+    assert acquired.is_set()
+
+
+def test_failed_build_frees_the_slot() -> None:
+    calls = iter([RuntimeError("boom"), None])
+
+    def _factory() -> object:
+        error = next(calls)
+        if error is not None:
+            raise error
+        return object()
+
+    pool = ClientPool(_factory, size=1)
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            pass
+    with pool.acquire() as client:
+        assert client is not None
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+from oryups.downloadcache import DownloadCache
+
+
+def _finish(fill) -> None:
+    fill.wait(fill.size, 5)
+    assert fill.done and fill.error is None
+
+
+def test_concurrent_misses_share_one_upstream_download(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=100)
+    body = b"0123456789"
+    gate = threading.Event()
+    calls: list[tuple[int, int]] = []
+
+    def _read_range(start: int, end: int) -> bytes:
+        gate.wait(5)
+        calls.append((start, end))
+        return body[start : end + 1]
+
+    first = cache.fill("abc", len(body), _read_range, 4)
+    second = cache.fill("abc", len(body), _read_range, 4)
+    gate.set()
+    _finish(first)
+
+    assert first is second
+    assert calls == [(0, 3), (4, 7), (8, 9)]
+    assert cache.lookup("abc").read_bytes() == body
+    assert not first.part.exists()
+
+
+def test_least_recently_used_blob_is_evicted(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10)
+    for key in ("a", "b"):
+        _finish(cache.fill(key, 4, lambda start, end: b"x" * (end - start + 1), 4))
+    assert cache.lookup("a") is not None
+
+    _finish(cache.fill("c", 4, lambda start, end: b"y" * (end - start + 1), 4))
+
+    assert cache.lookup("b") is None
+    assert not (cache.root / "b").exists()
+    assert cache.lookup("a") is not None
+    assert cache.snapshot()["bytes"] == 8
+
+
+def test_invalidate_discards_blob_and_in_flight_fill(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=100)
+    _finish(cache.fill("a", 3, lambda start, end: b"abc", 3))
+    cache.invalidate("a")
+    assert cache.lookup("a") is None
+    assert not (cache.root / "a").exists()
+
+    gate = threading.Event()
+
+    def _slow(start: int, end: int) -> bytes:
+        gate.wait(5)
+        return b"def"
+
+    fill = cache.fill("b", 3, _slow, 3)
+    cache.invalidate("b")
+    gate.set()
+    _finish(fill)
+
+    assert cache.lookup("b") is None
+    assert [entry.name for entry in cache.root.iterdir()] == [".lock"]
+
+
+def test_index_is_rebuilt_from_disk(tmp_path: Path) -> None:
+    (tmp_path / "0").mkdir()
+    (tmp_path / "0" / "kept").write_bytes(b"1234")
+    (tmp_path / "0" / "torn.part").write_bytes(b"12")
+
+    cache = DownloadCache(tmp_path, max_bytes=100)
+
+    assert cache.root == tmp_path / "0"
+    assert cache.lookup("kept") is not None
+    assert not (cache.root / "torn.part").exists()
+
+
+def test_each_cache_claims_its_own_directory(tmp_path: Path) -> None:
+    first = DownloadCache(tmp_path, max_bytes=100)
+    _finish(first.fill("a", 3, lambda start, end: b"abc", 3))
+
+    second = DownloadCache(tmp_path, max_bytes=100)
+
+    assert first.root != second.root
+    assert second.lookup("a") is None
+    assert first.lookup("a") is not None
+
+
+def test_missing_blob_is_a_miss(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=100)
+    _finish(cache.fill("a", 3, lambda start, end: b"abc", 3))
+    (cache.root / "a").unlink()
+
+    assert cache.lookup("a") is None
+    assert cache.snapshot()["bytes"] == 0
+
+
+def test_read_ahead_keeps_requests_in_flight_and_writes_in_order(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=100)
+    body = bytes(range(12))
+    started = threading.Barrier(3, timeout=5)
+
+    def _read_range(start: int, end: int) -> bytes:
+        if start < 9:
+            # The first three chunks only return once all are requested.
+            started.wait()
+        return body[start : end + 1]
+
+    fill = cache.fill("abc", len(body), _read_range, 3, read_ahead=3)
+    _finish(fill)
+
+    assert cache.lookup("abc").read_bytes() == body
+
+
+def test_open_fill_after_it_finished_reads_the_final_blob(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=100)
+    fill = cache.fill("a", 3, lambda start, end: b"abc", 3)
+    _finish(fill)
+
+    with cache.open_fill(fill) as f:
+        assert f.read() == b"abc"
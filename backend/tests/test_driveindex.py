@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from oryups.driveindex import FOLDER_MIME, DriveFolderIndex
+
+
+def _index() -> DriveFolderIndex:
+    index = DriveFolderIndex("root-gid")
+    index.load({"abc123": "folder-1"}, "token-1")
+    index.set_children("folder-1", {"a.txt": "file-1", "a.txt.metadata": "meta-1"})
+    return index
+
+
+def test_changes_feed_adds_folders_and_children() -> None:
+    index = _index()
+
+    index.apply_change({
+        "fileId": "folder-2",
+        "file": {"id": "folder-2", "name": "xyz789", "mimeType": FOLDER_MIME, "parents": ["root-gid"]},
+    })
+    index.set_children("folder-2", {})
+    index.apply_change({
+        "fileId": "file-2",
+        "file": {"id": "file-2", "name": "b.txt", "mimeType": "text/plain", "parents": ["folder-2"]},
+    })
+
+    assert index.folder("xyz789") == "folder-2"
+    assert index.children("folder-2") == {"b.txt": "file-2"}
+
+
+def test_changes_feed_removals_and_moves() -> None:
+    index = _index()
+    index.put_folder("delete", "trash-folder", empty=True)
+
+    index.apply_change({
+        "fileId": "file-1",
+        "file": {"id": "file-1", "name": "xa_a.txt", "mimeType": "text/plain", "parents": ["trash-folder"]},
+    })
+    assert index.children("folder-1") == {"a.txt.metadata": "meta-1"}
+    assert index.children("trash-folder") == {"xa_a.txt": "file-1"}
+
+    index.apply_change({"fileId": "folder-1", "removed": True})
+    assert index.folder("abc123") is None
+    assert index.children("folder-1") is None
+
+
+def test_unlisted_folders_stay_unknown() -> None:
+    index = _index()
+    index.put_folder("new000", "folder-3")
+
+    index.put_child("folder-3", "c.txt", "file-3")
+
+    assert index.children("folder-3") is None
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from typing import Optional
+
+import pytest
+
+from oryups.drivestream import RESUMABLE_ALIGNMENT, DriveStreamUpload
+
+
+def test_chunks_are_aligned_and_final_chunk_carries_total() -> None:
+    sent: list[tuple[int, int, Optional[int]]] = []
+
+    def _send(data: bytes, offset: int, total: Optional[int]) -> Optional[dict]:
+        sent.append((offset, len(data), total))
+        return {"id": "gid"} if total is not None else None
+
+    upload = DriveStreamUpload(_send, chunk_size=RESUMABLE_ALIGNMENT + 1000)
+    body = b"x" * (RESUMABLE_ALIGNMENT * 2 + 10)
+    for start in range(0, len(body), 100_000):
+        upload.write(body[start : start + 100_000])
+
+    assert upload.finish() == {"id": "gid"}
+    assert upload.chunk_size == RESUMABLE_ALIGNMENT
+    assert sent == [
+        (0, RESUMABLE_ALIGNMENT, None),
+        (RESUMABLE_ALIGNMENT, RESUMABLE_ALIGNMENT, None),
+        (RESUMABLE_ALIGNMENT * 2, 10, len(body)),
+    ]
+    assert upload.size == len(body)
+    assert upload.sha256() == hashlib.sha256(body).hexdigest()
+
+
+def test_writes_continue_while_a_chunk_is_being_sent() -> None:
+    release = threading.Event()
+
+    def _send(data: bytes, offset: int, total: Optional[int]) -> Optional[dict]:
+        release.wait(5)
+        return {"id": "gid"} if total is not None else None
+
+    upload = DriveStreamUpload(_send, chunk_size=RESUMABLE_ALIGNMENT, depth=2)
+    # One chunk in the sender plus ``depth`` queued fit without blocking.
+    upload.write(b"a" * RESUMABLE_ALIGNMENT * 3)
+    release.set()
+
+    assert upload.finish() == {"id": "gid"}
+
+
+def test_send_failure_surfaces_on_next_write() -> None:
+    def _send(data: bytes, offset: int, total: Optional[int]) -> Optional[dict]:
+        raise IOError("drive down")
+
+    upload = DriveStreamUpload(_send, chunk_size=RESUMABLE_ALIGNMENT)
+    upload.write(b"a" * RESUMABLE_ALIGNMENT)
+    with pytest.raises(IOError):
+        for _ in range(10):
+            upload.write(b"a" * RESUMABLE_ALIGNMENT)
+    upload.abort()
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import string
+from collections.abc import Generator
 from pathlib import Path
 from typing import Any
 
+import pytest
 from fastapi.testclient import TestClient
 
-from oryups.config import get_config
-from oryups.services import cache
-from oryups.services.reaper import reap_once
+from oryups.config import get_config, get_storage
+from oryups.services import cache, expiry_queue
+from oryups.services.reaper import reap_due, reap_once
 from tests.conftest import upload_file
 
 
@@ -177,3 +180,60 @@ def test_reap_once_noop_when_permanently_false(
 
     assert removed == 0
     assert (Path(test_config["local"]["root"]) / fileid / "keep2.txt").exists()
+
+
+@pytest.fixture()
+def attached_queue() -> Generator[asyncio.Event, None, None]:
+    """Attach the expiry queue as a running reaper would."""
+    loop = asyncio.new_event_loop()
+    wake = asyncio.Event()
+    expiry_queue.attach(loop, wake)
+    try:
+        yield wake
+    finally:
+        expiry_queue.detach()
+        loop.close()
+
+
+def test_reap_due_removes_only_queued_deadlines(
+    client: TestClient,
+    test_config: dict[str, Any],
+    attached_queue: asyncio.Event,
+) -> None:
+    get_config()["delete"]["permanently"] = True
+    storage = get_storage()
+    fileid, _ = upload_file(client, "due.txt", b"due")
+    keep_id, _ = upload_file(client, "later.txt", b"later")
+    assert expiry_queue.size() == 2
+
+    metadata = storage.load_metadata(fileid, "due.txt")
+    metadata.created_at = 0
+    metadata.delete_after = 1
+    storage.update_metadata(metadata)
+    expiry_queue.schedule(metadata)
+
+    assert reap_due() == 1
+    assert not (Path(test_config["local"]["root"]) / fileid).exists()
+    assert (Path(test_config["local"]["root"]) / keep_id).exists()
+    assert expiry_queue.size() == 1
+
+
+def test_reap_due_requeues_extended_retention(
+    client: TestClient,
+    test_config: dict[str, Any],
+    attached_queue: asyncio.Event,
+) -> None:
+    get_config()["delete"]["permanently"] = True
+    storage = get_storage()
+    fileid, _ = upload_file(client, "extend.txt", b"extend")
+
+    stale = storage.load_metadata(fileid, "extend.txt")
+    stale.created_at = 0
+    stale.delete_after = 1
+    expiry_queue.schedule(stale)
+
+    assert reap_due() == 0
+    assert (Path(test_config["local"]["root"]) / fileid / "extend.txt").exists()
+    assert expiry_queue.next_deadline() == pytest.approx(
+        storage.load_metadata(fileid, "extend.txt").created_at + 3600
+    )
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import hashlib
+import json
 from pathlib import Path
 from typing import Any
 
+import pytest
 from fastapi.testclient import TestClient
 
+from oryups.config import get_config, get_storage
 from tests.conftest import upload_file
 
 
@@ -46,6 +50,30 @@ def test_direct_get_returns_uploaded_bytes(client: TestClient) -> None:
     assert response.headers["content-type"].startswith("text/plain")
 
 
+def test_direct_get_sends_sha256_etag_and_honours_if_none_match(
+    client: TestClient,
+    test_config: dict[str, Any],
+) -> None:
+    content = b"etag me"
+    fileid, _ = upload_file(client, "etag.txt", content)
+    digest = hashlib.sha256(content).hexdigest()
+
+    metadata = json.loads(Path(test_config["local"]["root"], fileid, "etag.txt.metadata").read_text())
+    assert metadata["sha256"] == digest
+
+    response = client.get(f"/get/{fileid}/etag.txt")
+    assert response.headers["etag"] == f'"{digest}"'
+
+    cached = client.get(f"/get/{fileid}/etag.txt", headers={"if-none-match": f'W/"{digest}"'})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == f'"{digest}"'
+
+    stale = client.get(f"/get/{fileid}/etag.txt", headers={"if-none-match": '"other"'})
+    assert stale.status_code == 200
+    assert stale.content == content
+
+
 def test_direct_get_missing_returns_html_404(client: TestClient) -> None:
     response = client.get(
         "/get/abc123/missing.txt",
@@ -106,3 +134,49 @@ def test_share_page_missing_valid_length_id_returns_html_404(client: TestClient)
     assert "text/html" in response.headers["content-type"]
     assert "404" in response.text
     assert "not found" in response.text.lower()
+
+
+def test_put_is_refused_before_reading_when_backlog_is_full(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    storage = get_storage()
+    claims: list[int] = []
+    releases: list[int] = []
+    monkeypatch.setattr(storage, "reserve_upload", lambda size: claims.append(size) or len(claims) > 1)
+    monkeypatch.setattr(storage, "release_upload", releases.append)
+
+    refused = client.put("/full.txt", content=b"backlog")
+    assert refused.status_code == 503
+    assert refused.headers["retry-after"]
+
+    def _failing_save(*args: Any, **kwargs: Any) -> Any:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "save", _failing_save)
+    with pytest.raises(OSError):
+        client.put("/full.txt", content=b"backlog")
+
+    assert claims == [7, 7]
+    assert releases == [7]
+
+
+def test_oversized_streamed_put_is_rejected_before_opening_a_session(
+    client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    storage = get_storage()
+    opened: list[str] = []
+    monkeypatch.setitem(get_config()["host"], "max_upload_size", 4)
+    monkeypatch.setattr(storage, "streams_uploads", True, raising=False)
+    monkeypatch.setattr(storage, "open_stream", opened.append, raising=False)
+
+    response = client.put("/huge.bin", content=b"too large")
+
+    assert response.status_code == 413
+    assert opened == []
+
+
+def test_oversized_put_is_413_even_when_backlog_is_full(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    storage = get_storage()
+    monkeypatch.setitem(get_config()["host"], "max_upload_size", 4)
+    monkeypatch.setattr(storage, "reserve_upload", lambda size: False)
+
+    assert client.put("/huge.bin", content=b"too large").status_code == 413
@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from threading import RLock
+from typing import Any
+
+from oryups.driveindex import FOLDER_MIME, DriveFolderIndex
+from oryups.filesystem import Metadata, gdrive as GDriveStorage
+from oryups.uploadjournal import UploadJournal
+from oryups.utils.clientpool import ClientPool
+
+
+class _Call:
+    def __init__(self, result: Any) -> None:
+        self.result = result
+
+    def execute(self) -> Any:
+        return self.result
+
+
+class FakeDrive:
+    """Just enough of the Drive v3 client for listing, with tiny pages."""
+
+    page_size = 2
+
+    def __init__(self, files: list[dict]) -> None:
+        self.files_data = files
+        self.list_calls: list[dict] = []
+        self.change_polls = 0
+        self.batches: list[int] = []
+
+    def files(self) -> "FakeDrive":
+        return self
+
+    def changes(self) -> "FakeChanges":
+        return FakeChanges(self)
+
+    def list(self, q: str, fields: str, pageToken: str = "", **_: Any) -> _Call:
+        self.list_calls.append({"q": q, "fields": fields})
+        parents = set(re.findall(r"'([^']+)' in parents", q))
+        mime = re.search(r"mimeType='([^']+)'", q)
+        name = re.search(r"name='([^']+)'", q)
+        matches = [
+            f for f in self.files_data
+            if parents & set(f["parents"])
+            and (mime is None or f["mimeType"] == mime.group(1))
+            and (name is None or f["name"] == name.group(1))
+        ]
+        start = int(pageToken or 0)
+        page = {"files": matches[start:start + self.page_size]}
+        if start + self.page_size < len(matches):
+            page["nextPageToken"] = str(start + self.page_size)
+        return _Call(page)
+
+    def get_media(self, fileId: str, **_: Any) -> _Call:
+        for f in self.files_data:
+            if f["id"] == fileId:
+                return _Call(f["content"])
+        raise _not_found()
+
+    def delete(self, fileId: str, **_: Any) -> _Call:
+        if not any(f["id"] == fileId for f in self.files_data):
+            raise _not_found()
+        self.files_data = [f for f in self.files_data if f["id"] != fileId and fileId not in f["parents"]]
+        return _Call({})
+
+    def new_batch_http_request(self, callback: Any) -> "FakeBatch":
+        return FakeBatch(self, callback)
+
+
+class FakeChanges:
+    def __init__(self, drive: FakeDrive) -> None:
+        self.drive = drive
+
+    def getStartPageToken(self, **_: Any) -> _Call:
+        return _Call({"startPageToken": "1"})
+
+    def list(self, pageToken: str, **_: Any) -> _Call:
+        self.drive.change_polls += 1
+        return _Call({"changes": [], "newStartPageToken": pageToken})
+
+
+def _not_found() -> Exception:
+    error = Exception("not found")
+    error.resp = type("Resp", (), {"status": 404})()  # type: ignore[attr-defined]
+    return error
+
+
+class FakeBatch:
+    def __init__(self, drive: FakeDrive, callback: Any) -> None:
+        self.drive = drive
+        self.callback = callback
+        self.calls: list[tuple[Any, str]] = []
+
+    def add(self, request: Any, request_id: str) -> None:
+        self.calls.append((request, request_id))
+
+    def execute(self) -> None:
+        self.drive.batches.append(len(self.calls))
+        for request, request_id in self.calls:
+            self.callback(request_id, {}, None)
+
+
+def _storage(files: list[dict]) -> GDriveStorage:
+    storage = GDriveStorage.__new__(GDriveStorage)
+    storage.service = FakeDrive(files)
+    storage.clients = ClientPool(lambda: storage.service, 2)
+    storage.root = "root"
+    storage._index_lock = RLock()
+    storage.folder_index = DriveFolderIndex("root")
+    storage.changes_interval = 3600
+    storage._changes_polled = 0.0
+    return storage
+
+
+def _tree(count: int) -> list[dict]:
+    files = []
+    for n in range(count):
+        files.append({"id": f"g{n}", "name": f"fid{n:03d}", "mimeType": FOLDER_MIME, "parents": ["root"]})
+        files.append({"id": f"f{n}", "name": "a.txt", "mimeType": "text/plain", "parents": [f"g{n}"]})
+        files.append({
+            "id": f"m{n}", "name": "a.txt.metadata", "mimeType": "application/json", "parents": [f"g{n}"],
+            "content": json.dumps({"id": f"fid{n:03d}", "name": "a.txt", "mimeType": "text/plain", "size": 1, "delete": "pw"}).encode(),
+        })
+    return files
+
+
+def test_get_list_follows_every_page() -> None:
+    storage = _storage(_tree(5))
+
+    folders = storage.get_list(dir="root", mimeType=FOLDER_MIME)
+
+    assert len(folders) == 5
+    assert len(storage.service.list_calls) == 3
+    assert all(call["fields"] == "nextPageToken, files(id, name)" for call in storage.service.list_calls)
+
+
+def test_list_folders_batches_children_and_seeds_index() -> None:
+    storage = _storage(_tree(45))
+
+    folders = storage.list_folders()
+
+    assert len(folders) == 45
+    assert folders["fid044"] == ("g44", {"a.txt": "f44", "a.txt.metadata": "m44"})
+    child_queries = {call["q"] for call in storage.service.list_calls if "mimeType" not in call["q"]}
+    assert len(child_queries) == 2
+    calls = len(storage.service.list_calls)
+    assert storage.lookup_folder("fid007") == "g7"
+    assert storage.folder_children("g7") == {"a.txt": "f7", "a.txt.metadata": "m7"}
+    assert len(storage.service.list_calls) == calls
+
+
+def test_cold_load_metadata_is_one_request_after_seeding() -> None:
+    storage = _storage(_tree(45))
+    storage.cache = False
+
+    storage._folder_index()
+    calls = len(storage.service.list_calls)
+    metadata = storage.load_metadata("fid012", "a.txt")
+
+    assert (metadata.id, metadata.optional_gfileID, metadata.optional_metadata_gfileID) == ("fid012", "f12", "m12")
+    assert len(storage.service.list_calls) == calls
+
+
+def test_stale_index_load_metadata_is_not_found_and_forgets_the_folder() -> None:
+    storage = _storage(_tree(3))
+    storage.cache = False
+    storage._folder_index()
+    # Removed by another process since the last changes poll.
+    storage.service.files_data = [f for f in storage.service.files_data if f["id"] not in ("g1", "f1", "m1")]
+
+    try:
+        storage.load_metadata("fid001", "a.txt")
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("expected FileNotFoundError")
+    assert storage.folder_index.folder("fid001") is None
+    assert storage.lookup_folder("fid001") is None
+
+
+def test_concurrent_lookups_poll_changes_once() -> None:
+    storage = _storage(_tree(2))
+    storage._folder_index()
+    storage.changes_interval = 0.05
+    time.sleep(0.1)
+
+    with storage._index_lock:
+        lookups = [threading.Thread(target=storage.lookup_folder, args=("fid000",)) for _ in range(4)]
+        for lookup in lookups:
+            lookup.start()
+        # Let every lookup see the poll as due and queue on the index lock.
+        time.sleep(0.02)
+    for lookup in lookups:
+        lookup.join(timeout=5)
+
+    assert storage.service.change_polls == 1
+
+
+def test_remove_many_batches_deletes_across_files() -> None:
+    storage = _storage(_tree(40))
+    entries = storage.list_folders()
+    expired = []
+    for fileid in sorted(entries)[:35]:
+        metadata = Metadata()
+        metadata.id, metadata.name = fileid, "a.txt"
+        expired.append(metadata)
+
+    removed = storage.remove_many(expired)
+
+    assert [m.id for m in removed] == [m.id for m in expired]
+    assert storage.service.batches == [100, 5]
+    assert storage.lookup_folder("fid039") == "g39"
+    assert storage.folder_index.folder("fid000") is None
+
+
+def test_stream_gdrive_reads_ahead_and_yields_in_order(monkeypatch) -> None:
+    import asyncio
+    import threading
+
+    from oryups.routers import files
+
+    monkeypatch.setattr(files, "GDRIVE_STREAM_CHUNK", 4)
+    body = bytes(range(10))
+    started = threading.Barrier(3, timeout=5)
+    storage = GDriveStorage.__new__(GDriveStorage)
+    storage.read_ahead = 3
+
+    def _read_range(gfile_id: str, start: int, end: int, **_: Any) -> bytes:
+        # Blocks until all three chunks are requested at once.
+        started.wait()
+        return body[start : end + 1]
+
+    storage.read_range = _read_range
+
+    async def _collect() -> list[bytes]:
+        return [chunk async for chunk in files._stream_gdrive(storage, "g", 0, len(body))]
+
+    assert asyncio.run(_collect()) == [body[0:4], body[4:8], body[8:10]]
+
+
+def _drive_backed(monkeypatch, client, name: str, content: bytes) -> str:
+    """Upload locally, then serve the same file through a stub gdrive backend."""
+    import oryups.config as config_module
+    from oryups.services import cache
+    from tests.conftest import upload_file
+
+    fileid, _ = upload_file(client, name, content)
+    local = config_module.get_storage()
+    body_path = local.folder_path(fileid) / name
+    storage = GDriveStorage.__new__(GDriveStorage)
+    storage.cache = False
+
+    def _load_metadata(fileid: str, filename: str) -> Metadata:
+        metadata = local.load_metadata(fileid, filename)
+        metadata.optional_gfileID = "g-" + fileid
+        return metadata
+
+    def _read_range(gfile_id: str, start: int, end: int, **_: Any) -> bytes:
+        with body_path.open("rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    storage.load_metadata = _load_metadata
+    storage.read_range = _read_range
+    monkeypatch.setitem(config_module.get_config(), "storage", "gdrive")
+    monkeypatch.setattr(config_module, "_storage", storage)
+    cache._cache.clear()
+    return fileid
+
+
+def test_gdrive_download_serves_single_and_multiple_ranges(monkeypatch, client) -> None:
+    content = bytes(range(200))
+    fileid = _drive_backed(monkeypatch, client, "video.bin", content)
+
+    full = client.get(f"/get/{fileid}/video.bin")
+    assert full.status_code == 200
+    assert full.headers["content-length"] == "200"
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.content == content
+
+    single = client.get(f"/get/{fileid}/video.bin", headers={"range": "bytes=10-19"})
+    assert single.status_code == 206
+    assert single.headers["content-range"] == "bytes 10-19/200"
+    assert single.content == content[10:20]
+
+    multi = client.get(f"/get/{fileid}/video.bin", headers={"range": "bytes=0-1,-3"})
+    assert multi.status_code == 206
+    boundary = multi.headers["content-type"].split("boundary=")[1]
+    assert int(multi.headers["content-length"]) == len(multi.content)
+    assert multi.content == (
+        f"--{boundary}\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 0-1/200\r\n\r\n".encode()
+        + content[:2]
+        + f"\r\n--{boundary}\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 197-199/200\r\n\r\n".encode()
+        + content[197:]
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+
+def test_gdrive_download_cache_fills_then_serves_and_recovers_lost_blobs(monkeypatch, client, tmp_path) -> None:
+    import oryups.config as config_module
+    from oryups.downloadcache import DownloadCache
+
+    content = bytes(range(100))
+    fileid = _drive_backed(monkeypatch, client, "cached.bin", content)
+    storage = config_module.get_storage()
+    storage.downloads = DownloadCache(tmp_path, max_bytes=1000)
+
+    assert client.get(f"/get/{fileid}/cached.bin").content == content
+    for _ in range(50):
+        if storage.downloads.snapshot()["entries"]:
+            break
+        time.sleep(0.01)
+    assert client.get(f"/get/{fileid}/cached.bin").content == content
+    assert storage.downloads.hits == 1
+
+    (storage.downloads.root / fileid).unlink()
+    assert client.get(f"/get/{fileid}/cached.bin").content == content
+
+
+def test_gdrive_range_honours_if_range_and_rejects_unsatisfiable(monkeypatch, client) -> None:
+    import hashlib
+
+    content = b"0123456789"
+    fileid = _drive_backed(monkeypatch, client, "digits.bin", content)
+    etag = f'"{hashlib.sha256(content).hexdigest()}"'
+
+    matched = client.get(f"/get/{fileid}/digits.bin", headers={"range": "bytes=5-", "if-range": etag})
+    assert matched.status_code == 206
+    assert matched.content == b"56789"
+
+    changed = client.get(f"/get/{fileid}/digits.bin", headers={"range": "bytes=5-", "if-range": '"other"'})
+    assert changed.status_code == 200
+    assert changed.content == content
+
+    unsatisfiable = client.get(f"/get/{fileid}/digits.bin", headers={"range": "bytes=50-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */10"
+
+
+class _Resp(dict):
+    def __init__(self, status: int, **headers: str) -> None:
+        super().__init__(headers)
+        self.status = status
+
+
+def test_put_stream_chunk_resends_unacknowledged_bytes() -> None:
+    storage = GDriveStorage.__new__(GDriveStorage)
+    storage.upload_retries = 0
+    requests: list[tuple[bytes, str]] = []
+    replies = [(_Resp(308, range="bytes=0-5"), b""), (_Resp(200), b'{"id": "gid"}')]
+
+    class _Http:
+        def request(self, uri: str, method: str, body: bytes, headers: dict) -> tuple:
+            requests.append((body, headers["Content-Range"]))
+            return replies.pop(0)
+
+    assert storage._put_stream_chunk(_Http(), "uri", b"0123456789", 0, 10) == {"id": "gid"}
+    assert requests == [(b"0123456789", "bytes 0-9/10"), (b"6789", "bytes 6-9/10")]
+
+
+def test_cached_upload_runs_on_its_own_connection(tmp_path) -> None:
+    storage = _storage([])
+    storage.journal = UploadJournal(tmp_path / ".journal")
+    storage.upload_retries = 0
+    storage.chunksize = 4
+    storage.MediaFileUpload = lambda path, **_: path
+    upload_http = object()
+    storage._stream_http = lambda: upload_http
+    seen: list[tuple[Any, int]] = []
+
+    class _Request:
+        resumable_uri = "session-uri"
+        resumable_progress = 0
+
+        def next_chunk(self, http: Any = None, num_retries: int = 0) -> tuple:
+            seen.append((http, storage.clients.in_use()))
+            self.resumable_progress += 4
+            return None, ({"id": "gid"} if len(seen) == 2 else None)
+
+    storage.service.create = lambda **_: _Request()
+
+    gid = storage._upload_body("fid", {"name": "a.bin", "parents": ["g"]}, tmp_path / "a.bin", "text/plain")
+
+    assert gid == "gid"
+    assert seen == [(upload_http, 0), (upload_http, 0)]
+
+
+def test_read_range_skips_cancelled_reads_waiting_for_a_slot() -> None:
+    import threading
+
+    storage = _storage([])
+    storage.read_slots = threading.BoundedSemaphore(1)
+    cancelled = threading.Event()
+    storage.read_slots.acquire()
+    result: list[bytes] = []
+    reader = threading.Thread(target=lambda: result.append(storage.read_range("g", 0, 3, cancelled=cancelled)))
+    reader.start()
+
+    cancelled.set()
+    storage.read_slots.release()
+    reader.join(timeout=5)
+
+    # FakeDrive has no get_media, so reaching Drive would have raised.
+    assert result == [b""]
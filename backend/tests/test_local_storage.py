@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import stat
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import oryups.config as config_module
+from oryups import filesystem
+from oryups.config import get_config, get_storage
+from oryups.filesystem import local as LocalStorage
+from oryups.services import admin as admin_service
+from oryups.services.reaper import reap_once
+from oryups.utils.upload import UploadSpool
+from tests.conftest import upload_file
+
+
+@pytest.fixture()
+def indexed_storage(client: TestClient) -> Generator[LocalStorage, None, None]:
+    """Swap the configured backend for one with ``local.index`` enabled."""
+    config = get_config()
+    config["local"]["index"] = True
+    storage = LocalStorage(config, config_module.get_config_path())
+    config_module._storage = storage
+    try:
+        yield storage
+    finally:
+        assert storage.index is not None
+        storage.index.close()
+
+
+def test_upload_and_delete_keep_index_in_sync(
+    client: TestClient,
+    indexed_storage: LocalStorage,
+) -> None:
+    put = client.put("/indexed.txt", content=b"indexed")
+    owner_key = put.headers["X-Owner-Key"]
+    fileid = put.text.rstrip("/").split("/")[-2]
+
+    assert indexed_storage.index is not None
+    assert indexed_storage.index.get(fileid)["name"] == "indexed.txt"
+    assert [m.id for m in admin_service.list_local_entries(indexed_storage)] == [fileid]
+
+    client.delete(f"/api/v1/{fileid}/indexed.txt", headers={"X-Owner-Key": owner_key})
+
+    assert indexed_storage.index.get(fileid) is None
+    assert admin_service.list_local_entries(indexed_storage) == []
+
+
+def test_reaper_uses_index_deadlines(
+    client: TestClient,
+    indexed_storage: LocalStorage,
+) -> None:
+    get_config()["delete"]["permanently"] = True
+    fileid, _ = upload_file(client, "due.txt", b"due")
+    keep_id, _ = upload_file(client, "keep.txt", b"keep")
+
+    metadata = indexed_storage.load_metadata(fileid, "due.txt")
+    metadata.created_at = 0
+    metadata.delete_after = 1
+    indexed_storage.update_metadata(metadata)
+    never = indexed_storage.load_metadata(keep_id, "keep.txt")
+    never.delete_after = -1
+    indexed_storage.update_metadata(never)
+
+    assert indexed_storage.index is not None
+    assert [data["id"] for data in indexed_storage.index.expiring()] == [fileid]
+    assert reap_once() == 1
+    assert not (indexed_storage.root / fileid).exists()
+    assert (indexed_storage.root / keep_id).exists()
+
+
+def test_rebuild_index_from_sidecars(
+    client: TestClient,
+    test_config: dict[str, Any],
+    indexed_storage: LocalStorage,
+) -> None:
+    fileid, _ = upload_file(client, "rebuilt.txt", b"rebuilt")
+    sidecar = Path(test_config["local"]["root"]) / fileid / "rebuilt.txt.metadata"
+    data = json.loads(sidecar.read_text())
+    data["delete_after"] = -1
+    sidecar.write_text(json.dumps(data))
+
+    assert indexed_storage.rebuild_index() == 1
+    assert indexed_storage.index is not None
+    assert indexed_storage.index.get(fileid)["delete_after"] == -1
+    assert indexed_storage.list_metadata()[0].delete_after == -1
+
+
+@pytest.fixture()
+def sharded_storage(client: TestClient) -> LocalStorage:
+    """Swap the configured backend for one using the sharded layout."""
+    config = get_config()
+    config["local"]["layout"] = "sharded"
+    storage = LocalStorage(config, config_module.get_config_path())
+    config_module._storage = storage
+    return storage
+
+
+def test_sharded_layout_round_trip(
+    client: TestClient,
+    sharded_storage: LocalStorage,
+) -> None:
+    fileid, _ = upload_file(client, "sharded.txt", b"sharded")
+
+    folder = sharded_storage.folder_path(fileid)
+    assert folder.parent.parent.parent == sharded_storage.root
+    assert (folder / "sharded.txt").read_bytes() == b"sharded"
+    assert client.get(f"/get/{fileid}/sharded.txt").content == b"sharded"
+    assert [m.id for m in sharded_storage.list_metadata()] == [fileid]
+
+
+def test_migrate_layout_moves_flat_folders(
+    client: TestClient,
+    test_config: dict[str, Any],
+) -> None:
+    fileid, _ = upload_file(client, "flat.txt", b"flat")
+    flat_folder = Path(test_config["local"]["root"]) / fileid
+
+    config = get_config()
+    config["local"]["layout"] = "sharded"
+    storage = LocalStorage(config, config_module.get_config_path())
+    config_module._storage = storage
+
+    assert storage.migrate_layout() == 1
+    assert not flat_folder.exists()
+    assert (storage.folder_path(fileid) / "flat.txt").read_bytes() == b"flat"
+    assert storage.migrate_layout() == 0
+    assert client.get(f"/get/{fileid}/flat.txt").content == b"flat"
+
+
+def test_spilled_upload_is_linked_not_copied(client: TestClient) -> None:
+    storage = get_storage()
+    spool = UploadSpool(max_memory=4, dir=storage.staging_dir())
+    spool.write(b"spilled body")
+    spool.seek(0)
+    assert spool.path is not None
+    inode = spool.path.stat().st_ino
+
+    metadata = storage.save(spool, 12, "linked.bin")
+    spool.close()
+
+    stored = storage.folder_path(metadata.id) / "linked.bin"
+    assert stored.stat().st_ino == inode
+    assert stat.S_IMODE(stored.stat().st_mode) == 0o666 & ~filesystem._UMASK
+    assert stored.read_bytes() == b"spilled body"
+    assert list(storage.staging_dir().iterdir()) == []
+
+
+@pytest.fixture()
+def dedup_storage(client: TestClient) -> LocalStorage:
+    """Swap the configured backend for one with ``local.dedup`` enabled."""
+    config = get_config()
+    config["local"]["dedup"] = True
+    storage = LocalStorage(config, config_module.get_config_path())
+    config_module._storage = storage
+    return storage
+
+
+def test_dedup_stores_identical_bodies_once(
+    client: TestClient,
+    dedup_storage: LocalStorage,
+) -> None:
+    content = b"same artifact"
+    blob = dedup_storage.blob_path(hashlib.sha256(content).hexdigest())
+    first, _ = upload_file(client, "a.log", content)
+    second, _ = upload_file(client, "b.log", content)
+
+    first_path = dedup_storage.folder_path(first) / "a.log"
+    second_path = dedup_storage.folder_path(second) / "b.log"
+    assert first_path.stat().st_ino == second_path.stat().st_ino == blob.stat().st_ino
+
+    assert dedup_storage._remove_permanent(first, "a.log")
+    assert blob.exists()
+    assert client.get(f"/get/{second}/b.log").content == content
+
+    assert dedup_storage._remove_permanent(second, "b.log")
+    assert not blob.exists()
+
+
+@pytest.fixture()
+def hash_first_storage(client: TestClient) -> LocalStorage:
+    """Swap the configured backend for one with ``local.hash_first`` enabled."""
+    config = get_config()
+    config["local"]["dedup"] = True
+    config["local"]["hash_first"] = True
+    storage = LocalStorage(config, config_module.get_config_path())
+    config_module._storage = storage
+    return storage
+
+
+def test_hash_first_put_skips_known_body(
+    client: TestClient,
+    hash_first_storage: LocalStorage,
+) -> None:
+    content = b"known body"
+    digest = hashlib.sha256(content).hexdigest()
+    upload_file(client, "original.bin", content)
+
+    response = client.put("/again.bin", headers={"X-Content-SHA256": digest})
+
+    assert response.status_code == 200
+    fileid = response.text.rstrip("/").split("/")[-2]
+    assert response.headers["X-Owner-Key"]
+    assert client.get(f"/get/{fileid}/again.bin").content == content
+    assert hash_first_storage.load_metadata(fileid, "again.bin").size == len(content)
+
+
+def test_dedup_alone_does_not_honour_hash_first(
+    client: TestClient,
+    dedup_storage: LocalStorage,
+) -> None:
+    content = b"private body"
+    digest = hashlib.sha256(content).hexdigest()
+    fileid, _ = upload_file(client, "private.bin", content)
+
+    assert "sha256" not in client.get(f"/api/v1/{fileid}/private.bin").json()["data"]
+    assert client.put("/claim.bin", headers={"X-Content-SHA256": digest}).status_code == 400
+
+
+def test_hash_first_ignores_blobs_held_only_by_deleted_files(
+    client: TestClient,
+    hash_first_storage: LocalStorage,
+) -> None:
+    content = b"deleted body"
+    digest = hashlib.sha256(content).hexdigest()
+    fileid, _ = upload_file(client, "gone.bin", content)
+    assert hash_first_storage.remove(fileid, "gone.bin", "", force=True)
+
+    assert hash_first_storage.blob_path(digest).exists()
+    assert hash_first_storage._deleted_links(digest) == 1
+    assert client.put("/revive.bin", headers={"X-Content-SHA256": digest}).status_code == 400
+
+    upload_file(client, "again.bin", content)
+    assert client.put("/third.bin", headers={"X-Content-SHA256": digest}).status_code == 200
+
+
+def test_new_blob_is_copied_outside_the_blob_lock(
+    client: TestClient,
+    dedup_storage: LocalStorage,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    held: list[bool] = []
+    commit_stream = dedup_storage.commit_stream
+
+    def _commit_stream(stream: Any, path: Path) -> None:
+        held.append(dedup_storage._blob_lock.locked())
+        commit_stream(stream, path)
+
+    monkeypatch.setattr(dedup_storage, "commit_stream", _commit_stream)
+    fileid, _ = upload_file(client, "fresh.bin", b"fresh body")
+
+    assert held == [False]
+    assert client.get(f"/get/{fileid}/fresh.bin").content == b"fresh body"
+
+
+def test_hash_first_put_verifies_unknown_body(
+    client: TestClient,
+    hash_first_storage: LocalStorage,
+) -> None:
+    digest = hashlib.sha256(b"expected").hexdigest()
+
+    missing = client.put("/probe.bin", headers={"X-Content-SHA256": digest})
+    assert missing.status_code == 400
+
+    uploaded = client.put("/probe.bin", content=b"expected", headers={"X-Content-SHA256": digest})
+    assert uploaded.status_code == 200
+    assert hash_first_storage.blob_path(digest).exists()
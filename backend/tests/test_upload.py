@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from oryups.utils.upload import COALESCE_SIZE, SpoolBudget, UploadSpool, receive_body
+
+
+def _request(messages: list[dict[str, Any]], stall: float = 0.0) -> Request:
+    """Build a Request whose ASGI receive replays ``messages`` then stalls."""
+    queue = list(messages)
+
+    async def receive() -> dict[str, Any]:
+        if queue:
+            return queue.pop(0)
+        await asyncio.sleep(stall or 3600)
+        return {"type": "http.disconnect"}
+
+    scope = {"type": "http", "method": "PUT", "path": "/x", "headers": []}
+    return Request(scope, receive)
+
+
+def test_spool_spills_when_budget_is_exhausted(tmp_path: Path) -> None:
+    budget = SpoolBudget(limit=8)
+    first = UploadSpool(max_memory=1024, dir=tmp_path, budget=budget)
+    second = UploadSpool(max_memory=1024, dir=tmp_path, budget=budget)
+
+    first.write(b"12345678")
+    second.write(b"x")
+
+    assert first.path is None
+    assert second.path is not None
+    assert budget.snapshot() == {"limit": 8, "used": 8, "peak": 8, "spills": 1}
+
+    first.close()
+    second.close()
+
+    assert budget.used == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilled_spool_releases_its_reservation(tmp_path: Path) -> None:
+    budget = SpoolBudget(limit=1024)
+    spool = UploadSpool(max_memory=4, dir=tmp_path, budget=budget)
+
+    spool.write(b"abc")
+    assert budget.used == 3
+    spool.write(b"defg")
+
+    assert spool.path is not None
+    assert budget.used == 0
+    spool.seek(0)
+    assert spool.read() == b"abcdefg"
+    spool.close()
+
+
+async def test_receive_body_coalesces_small_messages() -> None:
+    messages = [{"type": "http.request", "body": b"ab", "more_body": True} for _ in range(3)]
+    messages.append({"type": "http.request", "body": b"c", "more_body": False})
+    writes: list[bytes] = []
+
+    size = await receive_body(_request(messages), lambda data: writes.append(bytes(data)))
+
+    assert size == 7
+    assert writes == [b"abababc"]
+
+
+async def test_receive_body_flushes_at_coalesce_size() -> None:
+    chunk = b"x" * COALESCE_SIZE
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True},
+        {"type": "http.request", "body": b"tail", "more_body": False},
+    ]
+    writes: list[int] = []
+
+    await receive_body(_request(messages), lambda data: writes.append(len(data)))
+
+    assert writes == [COALESCE_SIZE, 4]
+
+
+async def test_receive_body_passes_large_messages_through() -> None:
+    chunk = b"x" * COALESCE_SIZE
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True},
+        {"type": "http.request", "body": b"tail", "more_body": False},
+    ]
+    writes: list[Any] = []
+
+    await receive_body(_request(messages), writes.append)
+
+    assert writes[0] is chunk
+
+
+async def test_receive_body_idle_timeout_is_408() -> None:
+    messages = [{"type": "http.request", "body": b"slow", "more_body": True}]
+
+    with pytest.raises(HTTPException) as excinfo:
+        await receive_body(_request(messages), lambda data: None, idle_timeout=0.05)
+
+    assert excinfo.value.status_code == 408
+
+
+async def test_receive_body_slow_sink_is_not_an_idle_timeout() -> None:
+    chunk = b"x" * COALESCE_SIZE
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True},
+        {"type": "http.request", "body": chunk, "more_body": False},
+    ]
+
+    async def _slow_write(data: bytes) -> None:
+        await asyncio.sleep(0.1)
+
+    size = await receive_body(_request(messages), _slow_write, idle_timeout=0.05)
+
+    assert size == 2 * COALESCE_SIZE
+
+
+async def test_receive_body_sink_timeout_is_not_a_408() -> None:
+    messages = [{"type": "http.request", "body": b"x" * COALESCE_SIZE, "more_body": False}]
+
+    async def _timing_out_write(data: bytes) -> None:
+        raise TimeoutError("drive socket timed out")
+
+    with pytest.raises(TimeoutError):
+        await receive_body(_request(messages), _timing_out_write)
+
+
+async def test_receive_body_enforces_max_size() -> None:
+    messages = [{"type": "http.request", "body": b"toolarge", "more_body": False}]
+
+    with pytest.raises(HTTPException) as excinfo:
+        await receive_body(_request(messages), lambda data: None, max_size=4)
+
+    assert excinfo.value.status_code == 413
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from oryups.filesystem import _resumable_status
+from oryups.uploadjournal import UploadJournal
+
+
+def test_replay_folds_progress_and_drops_finished_entries(tmp_path: Path) -> None:
+    journal = UploadJournal(tmp_path / ".journal")
+    journal.record("queued", "aaa111", name="big.iso", folder="folder-a", size=300)
+    journal.record("queued", "bbb222", name="small.txt", folder="folder-b", size=3)
+    journal.record("session", "aaa111", uri="https://upload.example/session")
+    journal.record("progress", "aaa111", offset=200)
+    journal.record("body", "bbb222", gid="file-b")
+    journal.record("done", "bbb222")
+    with journal.path.open("a", encoding="utf-8") as f:
+        f.write('{"op": "progress", "id": "aaa1')
+
+    pending = UploadJournal(journal.path).replay()
+
+    assert pending == {
+        "aaa111": {
+            "name": "big.iso",
+            "folder": "folder-a",
+            "size": 300,
+            "uri": "https://upload.example/session",
+            "offset": 200,
+        },
+    }
+
+    assert journal.replay() == pending
+    assert journal.state("aaa111")["offset"] == 200
+
+    journal.compact()
+    assert UploadJournal(journal.path).replay() == pending
+    assert len(journal.path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_journal_compacts_after_enough_finished_entries(tmp_path: Path) -> None:
+    journal = UploadJournal(tmp_path / ".journal", compact_after=2)
+    journal.record("queued", "keep", name="keep.bin", folder="f", size=1)
+    for fileid in ("one", "two"):
+        journal.record("queued", fileid, name=f"{fileid}.bin", folder="f", size=1)
+        journal.record("progress", fileid, offset=1)
+        journal.record("done", fileid)
+
+    lines = journal.path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    assert UploadJournal(journal.path).replay() == {"keep": {"name": "keep.bin", "folder": "f", "size": 1}}
+
+
+class _Resp(dict):
+    def __init__(self, status: int, **headers: str) -> None:
+        super().__init__(headers)
+        self.status = status
+
+
+class _Http:
+    def __init__(self, resp: _Resp, content: bytes = b"") -> None:
+        self.resp = resp
+        self.content = content
+        self.headers: dict[str, str] = {}
+
+    def request(self, uri: str, method: str, headers: dict[str, str]) -> tuple[_Resp, bytes]:
+        self.headers = headers
+        return self.resp, self.content
+
+
+def test_resumable_status_reports_next_offset() -> None:
+    http = _Http(_Resp(308, range="bytes=0-1048575"))
+
+    assert _resumable_status(http, "https://upload.example/session", 4096 * 1024) == 1048576
+    assert http.headers["Content-Range"] == "bytes */4194304"
+    assert _resumable_status(_Http(_Resp(308)), "uri", 10) == 0
+    assert _resumable_status(_Http(_Resp(200), b'{"id": "file-a"}'), "uri", 10) == {"id": "file-a"}
+    assert _resumable_status(_Http(_Resp(404)), "uri", 10) is None
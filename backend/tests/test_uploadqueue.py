@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from oryups.uploadqueue import UploadQueue
+
+
+def test_reserve_is_refused_until_backlog_drains() -> None:
+    backlog = UploadQueue(max_bytes=10)
+    assert backlog.try_reserve(8)
+    backlog.put("first", 8)
+
+    assert not backlog.try_reserve(5)
+
+    item, size = backlog.get()
+    backlog.done(size)
+
+    assert item == "first"
+    assert backlog.try_reserve(5)
+    assert backlog.snapshot() == {"queued": 0, "pending_bytes": 5, "max_bytes": 10}
+
+
+def test_oversized_body_is_admitted_into_an_empty_backlog() -> None:
+    backlog = UploadQueue(max_bytes=10)
+
+    assert backlog.try_reserve(50)
+
+    assert backlog.snapshot()["pending_bytes"] == 50
+
+
+def test_requeued_item_keeps_its_bytes_reserved() -> None:
+    backlog = UploadQueue(max_bytes=10)
+    assert backlog.try_reserve(8)
+    backlog.put("flaky", 8)
+
+    item, size = backlog.get()
+    backlog.requeue(item, size, 0.01)
+
+    assert backlog.snapshot()["pending_bytes"] == 8
+    assert backlog.get() == ("flaky", 8)
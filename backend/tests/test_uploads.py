@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from oryups.config import get_config, get_storage
+from oryups.services import uploads
+
+
+def _create(client: TestClient, filename: str, length: int) -> str:
+    response = client.post("/api/v1/uploads", json={"filename": filename, "length": length})
+    assert response.status_code == 201
+    session_id = response.json()["data"]["id"]
+    assert response.headers["Location"] == f"/api/v1/uploads/{session_id}"
+    return session_id
+
+
+def test_resumable_upload_round_trip(client: TestClient, test_config: dict[str, Any]) -> None:
+    content = b"first half|second half"
+    session_id = _create(client, "resumed.txt", len(content))
+
+    first = client.patch(
+        f"/api/v1/uploads/{session_id}",
+        content=content[:11],
+        headers={"Upload-Offset": "0"},
+    )
+    assert first.status_code == 200
+    assert first.headers["Upload-Offset"] == "11"
+
+    head = client.head(f"/api/v1/uploads/{session_id}")
+    assert head.headers["Upload-Offset"] == "11"
+    assert head.headers["Upload-Length"] == str(len(content))
+
+    second = client.patch(
+        f"/api/v1/uploads/{session_id}",
+        content=content[11:],
+        headers={"Upload-Offset": "11"},
+    )
+    assert second.json()["data"]["offset"] == len(content)
+
+    done = client.post(f"/api/v1/uploads/{session_id}/finalize")
+    assert done.status_code == 200
+    data = done.json()["data"]
+    assert data["url"] == f"https://upload.example.test/{data['id']}/resumed.txt"
+    assert done.headers["X-Owner-Key"]
+    assert Path(test_config["local"]["root"], data["id"], "resumed.txt").read_bytes() == content
+    assert client.get(f"/get/{data['id']}/resumed.txt").content == content
+
+    assert client.head(f"/api/v1/uploads/{session_id}").status_code == 404
+
+
+def test_patch_with_wrong_offset_conflicts(client: TestClient) -> None:
+    session_id = _create(client, "offset.txt", 10)
+    client.patch(f"/api/v1/uploads/{session_id}", content=b"abcd", headers={"Upload-Offset": "0"})
+
+    stale = client.patch(f"/api/v1/uploads/{session_id}", content=b"efgh", headers={"Upload-Offset": "0"})
+
+    assert stale.status_code == 409
+    assert stale.headers["Upload-Offset"] == "4"
+
+
+def test_patch_past_declared_length_is_rejected(client: TestClient) -> None:
+    session_id = _create(client, "short.txt", 3)
+
+    response = client.patch(f"/api/v1/uploads/{session_id}", content=b"toolong", headers={"Upload-Offset": "0"})
+
+    assert response.status_code == 413
+
+
+def test_finalize_incomplete_upload_conflicts(client: TestClient) -> None:
+    session_id = _create(client, "partial.txt", 10)
+    client.patch(f"/api/v1/uploads/{session_id}", content=b"abc", headers={"Upload-Offset": "0"})
+
+    response = client.post(f"/api/v1/uploads/{session_id}/finalize")
+
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "3"
+
+
+def test_create_rejects_length_over_max_upload_size(client: TestClient) -> None:
+    get_config()["host"]["max_upload_size"] = 8
+
+    response = client.post("/api/v1/uploads", json={"filename": "big.bin", "length": 9})
+
+    assert response.status_code == 413
+
+
+def test_abandoned_sessions_expire(client: TestClient) -> None:
+    session_id = _create(client, "stale.txt", 10)
+    get_config()["host"]["upload_session_ttl"] = 60
+    root = uploads.sessions_root(get_storage().staging_dir())
+    session = uploads.load(root, session_id, 60)
+    session.updated_at = time.time() - 120
+    session._write()
+
+    assert uploads.sweep(root, 60) == 1
+    assert client.head(f"/api/v1/uploads/{session_id}").status_code == 404
+
+
+def test_abort_discards_staged_bytes(client: TestClient) -> None:
+    session_id = _create(client, "abort.txt", 10)
+
+    response = client.delete(f"/api/v1/uploads/{session_id}")
+
+    assert response.status_code == 200
+    assert client.head(f"/api/v1/uploads/{session_id}").status_code == 404
+
+
+def test_failed_finalize_keeps_the_session_for_a_retry(
+    client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    session_id = _create(client, "retry.txt", 5)
+    client.patch(f"/api/v1/uploads/{session_id}", content=b"retry", headers={"Upload-Offset": "0"})
+    storage = get_storage()
+    save = storage.save
+
+    def _failing_save(*args: Any, **kwargs: Any) -> Any:
+        raise OSError("backend unavailable")
+
+    monkeypatch.setattr(storage, "save", _failing_save)
+    with pytest.raises(OSError):
+        client.post(f"/api/v1/uploads/{session_id}/finalize")
+
+    assert client.head(f"/api/v1/uploads/{session_id}").headers["Upload-Offset"] == "5"
+    monkeypatch.setattr(storage, "save", save)
+    done = client.post(f"/api/v1/uploads/{session_id}/finalize")
+
+    assert done.status_code == 200
+    data = done.json()["data"]
+    assert client.get(f"/get/{data['id']}/retry.txt").content == b"retry"